@@ -0,0 +1,99 @@
+"""
+    Compares the streaming metadata parser with the BeautifulSoup version
+
+    Run from the repository root with:
+
+        python -m benchmark.metadata
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import argparse
+import bs4
+import pathlib
+import timeit
+import tracemalloc
+
+from src.metadata import MetadataParser
+from src.postlist import JINJA_COMMENT
+
+POSTS_DIR = pathlib.Path(__file__).parent.parent / 'src' / 'templates' / 'post'
+
+def find_fields_bs4(html):
+    """ Finds the metadata of a post by building a full BeautifulSoup tree
+
+        This is how posts were parsed before MetadataParser.
+
+        :param html: <str> Post HTML (or template source)
+        :return: <tuple> of date, title and description <str> (or None)
+        """
+    soup = bs4.BeautifulSoup(html, 'html.parser')
+
+    try:
+        date_str = soup.find(id="date").string
+    except AttributeError:
+        date_str = None
+
+    title = soup.find('h3').a.string
+    comment = soup.find(text=lambda text:isinstance(text, bs4.Comment))
+
+    return tuple(
+        str(field) if field is not None else None
+        for field in (date_str, title, comment))
+
+def measure(parse_func, sources, repeat):
+    """ Measures the time and peak memory of parsing every post
+
+        :param parse_func: Function handle that parses a post
+        :param sources: <list> of <str> post sources
+        :param repeat: <int> Number of times to parse every post
+        :return: <tuple> of seconds per pass and peak bytes
+        """
+    timer = timeit.Timer(lambda: [parse_func(source) for source in sources])
+    seconds = min(timer.repeat(repeat=repeat, number=1))
+
+    tracemalloc.start()
+    [parse_func(source) for source in sources]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return seconds, peak
+
+def main():
+    """ Runs the benchmark and prints a report
+
+        :return: None
+        """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='Number of passes over every post')
+    args = parser.parse_args()
+
+    paths = sorted(POSTS_DIR.glob('*.html'))
+    sources = [JINJA_COMMENT.sub('', path.read_text()) for path in paths]
+
+    # Both parsers must agree before their times mean anything
+    for path, source in zip(paths, sources):
+        expected = find_fields_bs4(source)
+        actual = MetadataParser.parse(source)
+        if expected != actual:
+            raise SystemExit(f'{path.name}: {actual} != {expected}')
+
+    bs4_time, bs4_peak = measure(find_fields_bs4, sources, args.repeat)
+    stream_time, stream_peak = measure(
+        MetadataParser.parse,
+        sources,
+        args.repeat)
+
+    print(f'{len(sources)} posts, best of {args.repeat} passes')
+    print(f'{"parser":<16}{"ms/pass":>10}{"us/post":>10}{"peak KiB":>10}')
+    for name, seconds, peak in [('bs4', bs4_time, bs4_peak),
+                                ('MetadataParser', stream_time, stream_peak)]:
+        print(f'{name:<16}{seconds * 1e3:>10.2f}'
+              f'{seconds / len(sources) * 1e6:>10.1f}'
+              f'{peak / 1024:>10.1f}')
+
+    print(f'speedup: {bs4_time / stream_time:.1f}x')
+
+if __name__ == '__main__':
+    main()
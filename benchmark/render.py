@@ -0,0 +1,374 @@
+"""
+    Measures how loading, serving and building the blog scale with posts
+
+    Synthetic corpora of posts (in the format of templates/post) are
+    created for each size. Each corpus is measured in a new process so its
+    peak memory and caches are its own. Results can be saved as a baseline,
+    and later runs report the metrics that got worse than it.
+
+    Timings only compare with timings of the same machine, so the baseline
+    isn't committed. Save one (e.g. before a change) on the machine that
+    runs the comparison. Baselines of another machine aren't compared.
+
+    Run from the repository root with:
+
+        python -m benchmark.render --save
+        python -m benchmark.render
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import argparse
+import concurrent.futures
+import datetime
+import json
+import multiprocessing
+import os
+import pathlib
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+from src.blog import Blog
+from src.builder import Builder
+from src.postlist import PostList
+from src.setting import Settings
+
+SRC_DIR = pathlib.Path(__file__).parent.parent / 'src'
+DEFAULT_BASELINE = pathlib.Path(__file__).parent / 'render-baseline.json'
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+# Suffix of metrics where larger is better. Smaller is better for the rest.
+HIGHER_IS_BETTER = '.rps'
+
+# Vocabulary of the synthetic posts
+WORDS = (
+    'async', 'buffer', 'cache', 'class', 'closure', 'compile', 'context',
+    'coroutine', 'debug', 'decorator', 'deploy', 'dict', 'event', 'flask',
+    'frame', 'function', 'generator', 'heap', 'index', 'iterator', 'kernel',
+    'lambda', 'latency', 'list', 'lock', 'loop', 'memory', 'method',
+    'module', 'mutex', 'object', 'operator', 'parser', 'pointer', 'process',
+    'python', 'queue', 'render', 'request', 'scope', 'server', 'signal',
+    'socket', 'stack', 'static', 'string', 'syntax', 'template', 'thread',
+    'token', 'tuple', 'value', 'yield',
+)
+
+def _sentence(rng):
+    """ Creates a random sentence
+
+        :param rng: <random.Random> Source of words
+        :return: <str> Sentence
+        """
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 16))]
+    return ' '.join(words).capitalize() + '.'
+
+def create_post(rng, number, date):
+    """ Creates the template of a synthetic post
+
+        Each post has a few paragraphs with inline code and one highlighted
+        code block, like the real posts.
+
+        :param rng: <random.Random> Source of words
+        :param number: <int> Number of post (makes its code unique)
+        :param date: <datetime.date> Date of post
+        :return: <str> Post template
+        """
+    paragraphs = []
+    for _ in range(rng.randint(4, 8)):
+        sentences = ' '.join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+        paragraphs.append(
+            '<p>\n  ' + sentences +
+            ' {{ codeify("' + rng.choice(WORDS) + '") }}\n</p>')
+
+    code = '\n'.join(
+        f'def {rng.choice(WORDS)}_{number}_{ii}(value):\n'
+        f'    return value * {ii}\n'
+        for ii in range(rng.randint(2, 5)))
+    paragraphs.insert(
+        len(paragraphs) // 2,
+        '{{ codeify("\n' + code + '", lang=\'py\') }}')
+
+    title = ' '.join(rng.choice(WORDS) for _ in range(4)).title()
+    return '\n'.join([
+        '<!--',
+        _sentence(rng),
+        '-->',
+        f"<h3><a href='{{{{ post_url }}}}' class='link'>{title}</a></h3>",
+        f"<p class='post-caption' id='date'>{date:%b %d, %Y}</p>",
+    ] + paragraphs) + '\n'
+
+def create_corpus(root, count, seed=0):
+    """ Creates an app root with synthetic posts
+
+        The templates, static files and posts of the real blog are linked
+        into it, since pages link to some of the posts. The synthetic posts
+        are added to them.
+
+        :param root: <Path> to empty directory
+        :param count: <int> Number of posts
+        :param seed: <int> Seed of the random text
+        :return: <list> of <str> names of posts
+        """
+    (root / 'static').symlink_to(SRC_DIR / 'static', target_is_directory=True)
+
+    template_dir = root / 'templates'
+    post_dir = template_dir / 'post'
+    post_dir.mkdir(parents=True)
+    for path in (SRC_DIR / 'templates').iterdir():
+        if path.is_file():
+            (template_dir / path.name).symlink_to(path)
+
+    for path in (SRC_DIR / 'templates' / 'post').iterdir():
+        (post_dir / path.name).symlink_to(path)
+
+    rng = random.Random(seed)
+    first_date = datetime.date(2000, 1, 1)
+    names = []
+    for number in range(count):
+        name = f'post-{number:05d}'
+        date = first_date + datetime.timedelta(days=number)
+        (post_dir / f'{name}.html').write_text(create_post(rng, number, date))
+        names.append(name)
+
+    return names
+
+def time_requests(client, urls):
+    """ Requests each URL and finds the latency distribution
+
+        :param client: Flask test client
+        :param urls: <list> of <str> URLs to request
+        :return: <dict> of metrics
+        """
+    latencies = []
+    for url in urls:
+        start = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - start)
+
+        if response.status_code != 200:
+            raise SystemExit(f'{url}: {response.status}')
+
+    percentiles = statistics.quantiles(latencies, n=20, method='inclusive')
+    return {
+        'p50_ms': statistics.median(latencies) * 1e3,
+        'p95_ms': percentiles[18] * 1e3,
+        'rps': len(latencies) / sum(latencies),
+    }
+
+def run_benchmark(count, requests, build, seed):
+    """ Measures a corpus of posts
+
+        Runs in a new process for each corpus.
+
+        :param count: <int> Number of posts
+        :param requests: <int> Number of requests timed for each page type
+        :param build: <Bool> Time a full static build
+        :param seed: <int> Seed of the random text
+        :return: <dict> of metrics
+        """
+    warnings.simplefilter('ignore')
+
+    settings = Settings.instance()
+
+    # Measure rendering rather than the page cache. Converting the images
+    # would dominate the build and doesn't depend on the posts.
+    settings['Cache']['PageCacheSize'] = '0'
+    settings['Images']['Formats'] = ''
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = pathlib.Path(tmp_dir)
+        names = create_corpus(root, count, seed)
+        app = Blog(settings, str(root)).app
+
+        # The first load parses every post. Later loads read the metadata
+        # from the post index.
+        with app.app_context():
+            for name in ['posts.load_cold_ms', 'posts.load_warm_ms']:
+                start = time.perf_counter()
+                len(PostList(settings, str(root)))
+                results[name] = (time.perf_counter() - start) * 1e3
+
+        routes = settings['Routes']
+        pages = {
+            'index': ['/'],
+            'post': [f'/{routes["PostsUrl"]}/{name}/' for name in names],
+            'archive': [f'/{routes["ArchiveUrl"]}/'],
+            'feed': [f'/{routes["RssFeed"]}'],
+            'sitemap': [f'/{routes["Sitemap"]}'],
+        }
+
+        with app.test_client() as client:
+            for page, urls in pages.items():
+                # Untimed request loads the posts and compiles templates
+                client.get(urls[0])
+
+                timed = [urls[ii % len(urls)] for ii in range(requests)]
+                for name, value in time_requests(client, timed).items():
+                    results[f'{page}.{name}'] = value
+
+        if build:
+            app.config['FREEZER_DESTINATION'] = str(root / 'build')
+            with app.app_context():
+                start = time.perf_counter()
+                Builder(app).build()
+                results['build.seconds'] = time.perf_counter() - start
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        # Linux reports KiB, macOS bytes
+        peak *= 1024
+
+    results['memory.peak_mib'] = peak / 2**20
+    return results
+
+def describe_machine():
+    """ Describes the machine and interpreter the benchmark runs on
+
+        :return: <dict> of details that a baseline must match
+        """
+    return {
+        'node': platform.node(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+    }
+
+def load_baseline(path):
+    """ Reads the baseline saved on this machine
+
+        :param path: <Path> to JSON file
+        :return: <dict> of baseline metrics of each size or None if there is
+                 no baseline of this machine
+        """
+    try:
+        contents = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+    if (not isinstance(contents, dict) or
+        contents.get('machine') != describe_machine()):
+        return None
+
+    return contents.get('results')
+
+def compare(results, baseline, threshold):
+    """ Finds the metrics that got worse than the baseline
+
+        :param results: <dict> of metrics of each size
+        :param baseline: <dict> of baseline metrics of each size
+        :param threshold: <float> Fraction a metric may get worse by
+        :return: <list> of (size, metric, baseline, current) tuples
+        """
+    regressions = []
+    for size, metrics in results.items():
+        for name, value in metrics.items():
+            expected = baseline.get(size, {}).get(name)
+            if expected is None:
+                continue
+
+            if name.endswith(HIGHER_IS_BETTER):
+                worse = value < expected / (1 + threshold)
+            else:
+                worse = value > expected * (1 + threshold)
+
+            if worse:
+                regressions.append((size, name, expected, value))
+
+    return regressions
+
+def format_results(size, metrics, baseline=None):
+    """ Formats the metrics of a corpus as a table
+
+        :param size: <str> Number of posts
+        :param metrics: <dict> of metrics
+        :param baseline: <dict> of baseline metrics of the same size
+        :return: <str> Table
+        """
+    baseline = baseline or {}
+    lines = [
+        f'{size} posts',
+        f'{"metric":<24}{"value":>12}{"baseline":>12}{"change":>9}',
+    ]
+    for name, value in metrics.items():
+        expected = baseline.get(name)
+        if expected:
+            change = f'{(value - expected) / expected * 100:>+8.1f}%'
+            lines.append(f'{name:<24}{value:>12.2f}{expected:>12.2f}{change}')
+        else:
+            lines.append(f'{name:<24}{value:>12.2f}')
+
+    return '\n'.join(lines)
+
+def main():
+    """ Runs the benchmark, prints a report and compares it to the baseline
+
+        Exits with status 1 if any metric regressed.
+
+        :return: None
+        """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Number of posts in each corpus')
+    parser.add_argument('--requests', type=int, default=50,
+                        help='Number of requests timed for each page type')
+    parser.add_argument('--no-build', action='store_true',
+                        help="Don't time a full static build")
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the random text of the posts')
+    parser.add_argument('--baseline', type=pathlib.Path,
+                        default=DEFAULT_BASELINE,
+                        help='JSON file of the results to compare to '
+                             '(saved on this machine)')
+    parser.add_argument('--save', action='store_true',
+                        help='Save the results as the baseline of this '
+                             'machine')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Fraction a metric may get worse by')
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None and not args.save:
+        print(f'No baseline of this machine in {args.baseline}. Nothing is '
+              f'compared. Save one with --save.')
+        print()
+
+    baseline = baseline or {}
+
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for size in args.sizes:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=context) as executor:
+            metrics = executor.submit(
+                run_benchmark,
+                size,
+                args.requests,
+                not args.no_build,
+                args.seed).result()
+
+        results[str(size)] = metrics
+        print(format_results(size, metrics, baseline.get(str(size))))
+        print()
+
+    regressions = compare(results, baseline, args.threshold)
+    for size, name, expected, value in regressions:
+        print(f'REGRESSION {size} posts {name}: {expected:.2f} -> {value:.2f}')
+
+    if args.save:
+        contents = {'machine': describe_machine(), 'results': results}
+        args.baseline.write_text(json.dumps(contents, indent=2) + '\n')
+        print(f'Saved baseline to {args.baseline}')
+
+    if regressions:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
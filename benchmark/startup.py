@@ -0,0 +1,122 @@
+"""
+    Measures the time to start the blog and to construct a Renderer
+
+    Process startup is timed in new interpreters: importing the app, and
+    creating it. Renderer construction is compared with building the lexers
+    and formatters of every language up front, which is how the Renderer
+    worked before the shared registry in src.highlight.
+
+    Run from the repository root with:
+
+        python -m benchmark.startup
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+from src.highlight import get_language
+from src.render import Renderer
+from src.setting import Settings
+
+# Languages used by the posts
+LANGUAGES = ['bash', 'cpp', 'css', 'default', 'html', 'js', 'py', 'pycon',
+             'xml']
+
+# Code run in a new interpreter for each startup measurement
+STARTUP_SCRIPTS = {
+    'import src': 'import src',
+    'create_app()': 'import src; src.create_app()',
+}
+
+def create_languages_eagerly():
+    """ Creates the lexer and formatter of every language up front
+
+        This is what each Renderer used to do when it was constructed.
+
+        :return: <dict> of (lexer, formatter) of each language
+        """
+    languages = {}
+    for lang in LANGUAGES:
+        get_language.cache_clear()
+        languages[lang] = get_language(lang)
+
+    return languages
+
+def time_startup(script, repeat):
+    """ Times a script in new interpreters
+
+        :param script: <str> Python code to run
+        :param repeat: <int> Number of interpreters to start
+        :return: <list> of seconds taken by each
+        """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, '-c', script],
+            check=True,
+            env=dict(os.environ, PYTHONWARNINGS='ignore'))
+        times.append(time.perf_counter() - start)
+
+    return times
+
+def main():
+    """ Runs the benchmark and prints a report
+
+        :return: None
+        """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='Number of interpreters started for each script')
+    parser.add_argument('--number', type=int, default=1000,
+                        help='Number of Renderers constructed for each pass')
+    args = parser.parse_args()
+
+    print(f'Process startup, {args.repeat} interpreters')
+    print(f'{"script":<24}{"min ms":>10}{"median ms":>12}')
+    for name, script in STARTUP_SCRIPTS.items():
+        times = time_startup(script, args.repeat)
+        print(f'{name:<24}{min(times) * 1e3:>10.1f}'
+              f'{statistics.median(times) * 1e3:>12.1f}')
+
+    settings = Settings.snapshot()
+    lazy = min(timeit.repeat(
+        lambda: Renderer(settings),
+        number=args.number,
+        repeat=5)) / args.number
+
+    # Lexers may be imported once per process. Construct them every time.
+    eager = min(timeit.repeat(
+        lambda: (Renderer(settings), create_languages_eagerly()),
+        number=max(args.number // 100, 1),
+        repeat=5)) / max(args.number // 100, 1)
+
+    get_language.cache_clear()
+    first_use = {}
+    for lang in LANGUAGES:
+        start = time.perf_counter()
+        get_language(lang)
+        first_use[lang] = time.perf_counter() - start
+
+    print()
+    print('Renderer construction')
+    print(f'{"languages":<24}{"us":>10}')
+    print(f'{"every one up front":<24}{eager * 1e6:>10.1f}')
+    print(f'{"on first use":<24}{lazy * 1e6:>10.1f}')
+    print(f'speedup: {eager / lazy:.0f}x')
+
+    print()
+    print('First use of each language')
+    print(f'{"language":<24}{"us":>10}')
+    for lang, seconds in first_use.items():
+        print(f'{lang:<24}{seconds * 1e6:>10.1f}')
+
+if __name__ == '__main__':
+    main()
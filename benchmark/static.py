@@ -0,0 +1,243 @@
+"""
+    Load tests the servers of the static build
+
+    Requests random pages and static files of the build tree from several
+    keep-alive connections at once, and reports the throughput and latency
+    of the StaticServer used by flask run-static and of the Werkzeug
+    development server that run-static used before. Each server runs in its
+    own process so the clients don't compete with it for the GIL.
+
+    Build the site first, then run from the repository root with:
+
+        python -m benchmark.static
+        python -m benchmark.static --url http://127.0.0.1:5000
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import argparse
+import http.client
+import logging
+import multiprocessing
+import pathlib
+import random
+import statistics
+import threading
+import time
+import urllib.parse
+import warnings
+import werkzeug.serving
+
+from src.blog import Blog
+from src.builder import Builder
+from src.compress import ENCODINGS
+from src.setting import Settings
+
+DEFAULT_ROOT = pathlib.Path(__file__).parent.parent / 'src' / 'build'
+SERVERS = ['static', 'werkzeug']
+
+def find_paths(root):
+    """ Lists the URL paths of the files of a build tree
+
+        Compressed copies are left out. They are requested through
+        Accept-Encoding instead.
+
+        :param root: <Path> to build tree
+        :return: <list> of <str> URL paths
+        """
+    suffixes = {details.suffix for details in ENCODINGS.values()}
+    paths = []
+    for path in sorted(root.rglob('*')):
+        if not path.is_file() or path.suffix in suffixes:
+            continue
+
+        url = f'/{path.relative_to(root).as_posix()}'
+        if path.name == 'index.html':
+            url = url[:-len('index.html')]
+
+        paths.append(urllib.parse.quote(url))
+
+    return paths
+
+def serve(server, root, ready):
+    """ Serves a build tree until terminated
+
+        Runs in a new process.
+
+        :param server: <str> Name of server (see SERVERS)
+        :param root: <str> Path to build tree
+        :param ready: <multiprocessing.Queue> the port is put on
+        :return: None
+        """
+    warnings.simplefilter('ignore')
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    app = Blog(Settings.instance()).app
+    app.config['FREEZER_DESTINATION'] = root
+    builder = Builder(app)
+    if server == 'static':
+        httpd = builder.make_static_server('127.0.0.1', 0, quiet=True)
+    else:
+        httpd = werkzeug.serving.make_server(
+            '127.0.0.1',
+            0,
+            builder.make_static_app(),
+            threaded=True)
+
+    ready.put(httpd.server_port)
+    httpd.serve_forever()
+
+def run_client(port, paths, headers, results):
+    """ Requests paths one after the other on a keep-alive connection
+
+        :param port: <int> Port of server on 127.0.0.1
+        :param paths: <list> of <str> URL paths to request
+        :param headers: <dict> of request headers
+        :param results: <list> the latencies, bytes and errors are added to
+        :return: None
+        """
+    latencies = []
+    received = 0
+    errors = 0
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    for path in paths:
+        start = time.perf_counter()
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        received += len(response.read())
+        latencies.append(time.perf_counter() - start)
+
+        if response.status != 200:
+            errors += 1
+        if response.will_close:
+            # HTTP/1.0 servers close each connection
+            connection.close()
+
+    connection.close()
+    results.append((latencies, received, errors))
+
+def load_test(port, paths, connections, requests, headers, seed):
+    """ Sends requests from several connections at once
+
+        :param port: <int> Port of server on 127.0.0.1
+        :param paths: <list> of <str> URL paths to choose from
+        :param connections: <int> Number of concurrent connections
+        :param requests: <int> Number of requests in total
+        :param headers: <dict> of request headers
+        :param seed: <int> Seed of the order of the requests
+        :return: <dict> of metrics
+        """
+    rng = random.Random(seed)
+    per_client = max(requests // connections, 1)
+    results = []
+    threads = [
+        threading.Thread(
+            target=run_client,
+            args=(port, rng.choices(paths, k=per_client), headers, results))
+        for _ in range(connections)
+    ]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    latencies = [latency for result in results for latency in result[0]]
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'rps': len(latencies) / seconds,
+        'p50_ms': statistics.median(latencies) * 1e3,
+        'p95_ms': percentiles[94] * 1e3,
+        'p99_ms': percentiles[98] * 1e3,
+        'mib_s': sum(result[1] for result in results) / seconds / 2**20,
+        'errors': sum(result[2] for result in results),
+    }
+
+def format_results(name, metrics):
+    """ Formats a row of the report
+
+        :param name: <str> Name of server
+        :param metrics: <dict> from load_test
+        :return: <str> Row
+        """
+    return (f'{name:<24}{metrics["rps"]:>10.0f}{metrics["p50_ms"]:>10.2f}'
+            f'{metrics["p95_ms"]:>10.2f}{metrics["p99_ms"]:>10.2f}'
+            f'{metrics["mib_s"]:>10.1f}{metrics["errors"]:>8}')
+
+def main():
+    """ Runs the load test and prints a report
+
+        :return: None
+        """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--root', type=pathlib.Path, default=DEFAULT_ROOT,
+                        help='Build tree to request files from')
+    parser.add_argument('--url',
+                        help='Load test a running server instead (e.g. '
+                             'flask run-static) at this http://host:port')
+    parser.add_argument('--servers', nargs='+', choices=SERVERS,
+                        default=SERVERS, help='Servers to start and test')
+    parser.add_argument('--connections', type=int, default=8,
+                        help='Number of concurrent keep-alive connections')
+    parser.add_argument('--requests', type=int, default=4000,
+                        help='Number of requests sent to each server')
+    parser.add_argument('--encoding', default='gzip',
+                        help='Accept-Encoding of the requests')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the order of the requests')
+    args = parser.parse_args()
+
+    paths = find_paths(args.root)
+    if not paths:
+        raise SystemExit(f'Nothing to serve in {args.root}. Run flask build.')
+
+    headers = {'Accept-Encoding': args.encoding}
+    print(f'{len(paths)} files, {args.connections} connections, '
+          f'{args.requests} requests, Accept-Encoding: {args.encoding}')
+    print(f'{"server":<24}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}'
+          f'{"p99 ms":>10}{"MiB/s":>10}{"errors":>8}')
+
+    if args.url is not None:
+        url = urllib.parse.urlsplit(args.url)
+        if url.hostname not in ('127.0.0.1', 'localhost'):
+            raise SystemExit('Only servers on 127.0.0.1 can be tested')
+
+        metrics = load_test(
+            url.port or 80,
+            [f'{url.path.rstrip("/")}{path}' for path in paths],
+            args.connections,
+            args.requests,
+            headers,
+            args.seed)
+        print(format_results(args.url, metrics))
+        return
+
+    context = multiprocessing.get_context('spawn')
+    for server in args.servers:
+        ready = context.Queue()
+        process = context.Process(
+            target=serve,
+            args=(server, str(args.root.resolve()), ready))
+        process.start()
+        try:
+            port = ready.get(timeout=60)
+
+            # Untimed pass warms the caches of the server
+            load_test(port, paths, 1, len(paths), headers, args.seed)
+            metrics = load_test(
+                port,
+                paths,
+                args.connections,
+                args.requests,
+                headers,
+                args.seed)
+        finally:
+            process.terminate()
+            process.join()
+
+        print(format_results(server, metrics))
+
+if __name__ == '__main__':
+    main()
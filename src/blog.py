@@ -5,35 +5,107 @@
     :license: MIT License. See LICENSE.md for details
 """
 import flask
+import json
+import os
 import pathlib
+import time
 
+from .bytecode import TemplateBytecodeCache
+from .cache import CachedPage, LruCache
+from .images import FORMATS, ImagePipeline
+from .manifest import DependencyTracker, TrackingEnvironment
+from .manifest import is_recording, record_dependency
+from .metrics import RequestMetrics
+from .postlist import PostList
 from .render import Renderer
+from .search import SEARCH_ENDPOINT, PostSearch
+from .setting import Settings
+from .watcher import PostWatcher
 from . import cli
 
+# Options of the [Flask] section that Flask reads as bools. The others are
+# passed on as strings.
+FLASK_BOOLEANS = {
+    'DEBUG',
+    'EXPLAIN_TEMPLATE_LOADING',
+    'FREEZER_IGNORE_404_NOT_FOUND',
+    'FREEZER_RELATIVE_URLS',
+    'FREEZER_REMOVE_EXTRA_FILES',
+    'JSON_AS_ASCII',
+    'JSON_SORT_KEYS',
+    'JSONIFY_PRETTYPRINT_REGULAR',
+    'PROPAGATE_EXCEPTIONS',
+    'TEMPLATES_AUTO_RELOAD',
+    'TESTING',
+}
+
 class Blog:
     """ Creates and maintains the Flask app """
 
-    def __init__(self, settings):
+    def __init__(self, settings, root_path=None):
         """ Constructor
         
             Routes each URL to a class method
 
-            :param settings_file: <str> Name of INI file
+            :param settings: Blog settings from .ini (a snapshot is taken)
+            :param root_path: <str> Directory of the templates, static files
+                              and caches. This package if None.
             :return: New instance
             """
+        # Read settings from an immutable snapshot. Changes made after
+        # this point need a new Blog.
+        settings = Settings.snapshot(settings)
+
         # Create and configure flask instance
-        self.app = flask.Flask(__name__)
-        self.app.config.update(**settings['Flask'])
+        self.app = flask.Flask(__name__, root_path=root_path)
+        self.app.extensions['settings'] = settings
+        self.app.config.update({
+            option: (settings['Flask'].getboolean(option)
+                     if option in FLASK_BOOLEANS else value)
+            for option, value in settings['Flask'].items()
+        })
+        self.app.jinja_environment = TrackingEnvironment
+        self.app.jinja_options = dict(
+            self.app.jinja_options,
+            bytecode_cache=TemplateBytecodeCache.from_settings(
+                settings,
+                self.app.root_path))
         self.app.url_map.strict_slashes = False
 
+        # Request hooks must be registered before the first request
+        DependencyTracker.for_app(self.app)
+
         # Add CLI commands
         self.app.cli.add_command(cli.build)
+        self.app.cli.add_command(cli.precompile)
         self.app.cli.add_command(cli.run_static)
         
         # Create renderer object
         self.renderer = Renderer(settings)
         self.renderer.connect(self.app)
 
+        # Rendered pages are kept until a post or template changes
+        self._page_cache = LruCache(int(settings['Cache']['PageCacheSize']))
+        self._template_watch_interval = float(
+            settings['Cache']['TemplateWatchInterval'])
+        self._template_mtime = (None, 0)
+        self._postlist = PostList.for_app(self.app, settings)
+        self._search = PostSearch.for_app(self.app, self._postlist, settings)
+
+        # Time each request (optional)
+        if settings['Metrics'].getboolean('Enabled'):
+            metrics = RequestMetrics.for_app(self.app, settings)
+            metrics.add_cache('page', self._page_cache)
+            for name, cache in self.renderer.caches().items():
+                metrics.add_cache(name, cache)
+
+        # Reload edited posts while developing. Not needed while building.
+        @self.app.before_first_request
+        def _start_watcher():
+            tracker = DependencyTracker.for_app(self.app)
+            if self.app.templates_auto_reload and tracker.manifest is None:
+                PostWatcher.for_app(self.app, self._postlist, settings).start()
+
         # Create index page
         @self.app.route('/')
         @self.app.route(f'/{settings["Routes"]["PageUrl"]}/<int:page>/')
@@ -43,17 +115,21 @@ class Blog:
                 :param page: <int> Page number
                 :return: Page content
                 """
-            return self.renderer.render_latest(page=page)
+            return self.serve_page(
+                lambda: self.renderer.render_latest(page=page),
+                self.renderer.last_modified)
         
         # Create about page
         @self.app.route(f'/{settings["Routes"]["AboutUrl"]}/')
         def about():
-            return self.renderer.render_about()
+            return self.serve_page(self.renderer.render_about)
 
         # Create archive page
         @self.app.route(f'/{settings["Routes"]["ArchiveUrl"]}/')
         def archive():
-            return self.renderer.render_archive()
+            return self.serve_page(
+                self.renderer.render_archive,
+                self.renderer.last_modified)
  
         # Create individual post pages
         @self.app.route(f'/{settings["Routes"]["PostsUrl"]}/<name>/')
@@ -63,7 +139,81 @@ class Blog:
                 :param name: <str> Page number
                 :return: Page content
                 """
-            return self.renderer.render_post(name)
+            return self.serve_page(
+                lambda: self.renderer.render_post(name),
+                lambda: self.renderer.last_modified(name))
+
+        # Answer search queries from the in-memory index
+        search_url = settings['Routes']['SearchUrl']
+        @self.app.route(f'/{search_url}', endpoint=SEARCH_ENDPOINT)
+        def search():
+            """ Finds the posts matching the q query parameter
+
+                :return: JSON results
+                """
+            query = flask.request.args.get('q', '')
+            return flask.jsonify(
+                query=query,
+                results=self._search.index.search(
+                    query,
+                    int(settings['Search']['ResultLimit'])))
+
+        # Serve the index for searching in the browser
+        @self.app.route(f'/{search_url}/index.json')
+        def search_manifest():
+            """ Serves the documents and shards of the search index
+
+                :return: JSON manifest
+                """
+            return self.serve_page(
+                lambda: json.dumps(
+                    self._search.index.manifest(),
+                    separators=(',', ':')),
+                self.renderer.last_modified,
+                content_type='application/json')
+
+        @self.app.route(f'/{search_url}/terms/<shard>.json')
+        def search_shard(shard):
+            """ Serves the terms of the search index sharing a prefix
+
+                :param shard: <str> Prefix of terms
+                :return: JSON posting list of each term
+                """
+            def _render_shard():
+                terms = self._search.index.shard(shard)
+                if not terms:
+                    flask.abort(404)
+
+                return json.dumps(terms, separators=(',', ':'))
+
+            return self.serve_page(
+                _render_shard,
+                self.renderer.last_modified,
+                content_type='application/json')
+
+        # Serve resized WebP/AVIF variants of images
+        @self.app.route(
+            f'/{settings["Routes"]["ImageVariantUrl"]}/<int:width>/'
+            f'<path:name>.<any({", ".join(FORMATS)}):fmt>')
+        def image_variant(name, width, fmt):
+            """ Serves a variant of an image in the image directory
+
+                :param name: <str> Path of image relative to image directory
+                :param width: <int> Width of variant
+                :param fmt: <str> Format of variant
+                :return: Image
+                """
+            images = ImagePipeline.for_app(self.app, settings)
+            try:
+                variant_path = images.variant(name, width, fmt)
+            except ValueError:
+                flask.abort(404)
+
+            record_dependency(
+                pathlib.Path(self.app.static_folder) /
+                settings['Images']['Directory'] /
+                name)
+            return flask.send_file(variant_path, mimetype=FORMATS[fmt][1])
 
         # Handle 404
         @self.app.errorhandler(404)
@@ -84,10 +234,12 @@ class Blog:
                 :param: None
                 :return: Page content
                 """
-            return flask.send_from_directory(
+            robots_dir = (
                 pathlib.Path(self.app.static_folder) /
-                settings['Routes']['RobotsLocation'],
-                robots)
+                settings['Routes']['RobotsLocation'])
+
+            record_dependency(robots_dir / robots)
+            return flask.send_from_directory(robots_dir, robots)
 
         # Serve RSS feed
         @self.app.route(f'/{settings["Routes"]["RssFeed"]}')
@@ -97,7 +249,9 @@ class Blog:
                 :param: None
                 :return: Page content
                 """
-            return self.serve_xml(self.renderer.render_feed)
+            return self.serve_xml(
+                self.renderer.render_feed,
+                self.renderer.last_modified)
 
         # Serve style for RSS feed
         @self.app.route(f'/{settings["Routes"]["RssFeedXsl"]}')
@@ -117,15 +271,104 @@ class Blog:
                 :param: None
                 :return: Page content
                 """
-            return self.serve_xml(self.renderer.render_sitemap)
+            return self.serve_xml(
+                self.renderer.render_sitemap,
+                self.renderer.last_modified)
         
-    def serve_xml(self, render_func):
+    def serve_xml(self, render_func, last_modified_func=None):
         """ Serves an XML route
 
             :param render_func: Function handle that defines how to serve route
+            :param last_modified_func: Function handle that finds when the
+                                       content last changed (optional)
             :return: Page content
             """
-        xml_content = render_func()
-        response = flask.make_response(xml_content)
-        response.headers['Content-Type'] = 'application/xml'
-        return response
+        return self.serve_page(
+            render_func,
+            last_modified_func,
+            content_type='application/xml')
+
+    def serve_page(self, render_func, last_modified_func=None,
+                   content_type=None):
+        """ Serves a page from the page cache, rendering it if needed
+
+            Responses carry a strong ETag (and a Last-Modified header if
+            known) so that clients can revalidate with a conditional request.
+            Error pages are never cached.
+
+            :param render_func: Function handle that defines how to serve route
+            :param last_modified_func: Function handle that finds when the
+                                       content last changed (optional)
+            :param content_type: <str> Content-Type header (optional)
+            :return: Response
+            """
+        # Pages rendered for the Builder must record their dependencies,
+        # so never serve them from the cache.
+        use_cache = not is_recording()
+        # Query strings and the Host header don't change pages
+        key = (
+            flask.request.script_root + flask.request.path,
+            self._content_version())
+
+        page = self._page_cache.get(key) if use_cache else None
+        if page is None:
+            rendered = render_func()
+            if isinstance(rendered, tuple):
+                return rendered
+
+            last_modified = None
+            if last_modified_func is not None:
+                last_modified = last_modified_func()
+
+            page = CachedPage(rendered, last_modified)
+            if use_cache:
+                self._page_cache.put(key, page)
+
+        response = flask.make_response(page.body)
+        if content_type is not None:
+            response.headers['Content-Type'] = content_type
+
+        response.set_etag(page.etag)
+        if page.last_modified is not None:
+            response.last_modified = page.last_modified.timestamp()
+
+        return response.make_conditional(flask.request)
+
+    def _content_version(self):
+        """ Finds a token that changes whenever a page could change
+
+            :return: <tuple> Version token
+            """
+        if not self.app.templates_auto_reload:
+            return (self._postlist.version,)
+
+        return (self._postlist.version, self._find_template_mtime())
+
+    def _find_template_mtime(self):
+        """ Finds when a template was last edited
+
+            The templates are only checked again once the template watch
+            interval has passed.
+
+            :return: <int> Latest modification time in nanoseconds
+            """
+        now = time.monotonic()
+        checked, template_mtime = self._template_mtime
+        if checked is not None and \
+                now - checked < self._template_watch_interval:
+            return template_mtime
+
+        # Templates may be edited while the server is running
+        template_mtime = 0
+        template_dir = os.path.join(
+            self.app.root_path,
+            self.app.template_folder)
+
+        for dir_path, _, file_names in os.walk(template_dir):
+            for file_name in file_names:
+                template_mtime = max(
+                    template_mtime,
+                    os.stat(os.path.join(dir_path, file_name)).st_mtime_ns)
+
+        self._template_mtime = (now, template_mtime)
+        return template_mtime
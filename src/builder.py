@@ -4,46 +4,119 @@
     :copyright: Copyright (c) 2021 Chris Hughes
     :license: MIT License. See LICENSE.md for details
 """
+import concurrent.futures
+import contextlib
 import flask
 import flask_frozen
-import math
+import mimetypes
 import os
 import pathlib
 import shutil
+import time
+import unicodedata
+import urllib.parse
+import warnings
 
+from .compress import ENCODINGS, Precompressor, is_compressible
+from .compress import select_encoding
+from .critical import CriticalCss
+from .fingerprint import IMMUTABLE_CACHE_CONTROL, StaticFingerprints
+from .images import ImagePipeline
+from .manifest import BuildManifest, DependencyTracker
+from .manifest import CODE_INPUT, POSTS_INPUT, SETTINGS_INPUT
+from .manifest import digest_code, digest_posts, digest_settings
+from .metrics import METRICS_ENDPOINT
+from .minify import minify_tree
 from .postlist import PostList
-from .render import Renderer
+from .profiling import BuildProfile, start_profiling, stop_profiling
+from .search import SEARCH_ENDPOINT, PostSearch
 from .setting import Settings
+from .staticserver import StaticServer
+
+# Endpoints that only exist on a running server
+DYNAMIC_ENDPOINTS = (METRICS_ENDPOINT, SEARCH_ENDPOINT)
 
 class Builder:
     """ Converts blog to static HTML/CSS """
 
+    @staticmethod
+    def page():
+        """ Generator for the routes that take no arguments
+
+            Same as the Frozen-Flask generator, except that dynamic routes
+            (e.g. the metrics) are left out.
+
+            :yields: endpoint and values of each route
+            """
+        for rule in flask.current_app.url_map.iter_rules():
+            if (not rule.arguments and
+                'GET' in rule.methods and
+                rule.endpoint not in DYNAMIC_ENDPOINTS):
+                yield rule.endpoint, {}
+
     @staticmethod
     def blog_post():
         """ Generator for the blog_post method
 
             :yields: valid blog post pages
             """
-        for post in PostList(
-                Settings.instance(),
-                flask.current_app.root_path):
+        for post in PostList.for_app(
+                flask.current_app,
+                Settings.snapshot()):
         
             yield {'name': post.url_stem}
 
+    @staticmethod
+    def image_variant():
+        """ Generator for the image_variant method
+
+            :yields: every variant of every image
+            """
+        images = ImagePipeline.for_app(flask.current_app, Settings.snapshot())
+        for name in images.images():
+            for width in images.widths(name):
+                for fmt in images.formats:
+                    yield {'name': name, 'width': width, 'fmt': fmt}
+
+    @staticmethod
+    def static_file():
+        """ Generator for plain copies of static files
+
+            Pages link to fingerprinted static files, which Frozen-Flask
+            builds. The feed and structured data link to some by name.
+
+            :yields: URL of each static file
+            """
+        app = flask.current_app
+        for filename in flask_frozen.walk_directory(
+                app.static_folder,
+                ignore=app.config['FREEZER_STATIC_IGNORE']):
+            yield f'{app.static_url_path}/{filename}'
+
+    @staticmethod
+    def search_shard():
+        """ Generator for the search_shard method
+
+            :yields: every shard of the search index
+            """
+        app = flask.current_app
+        search = PostSearch.for_app(
+            app,
+            PostList.for_app(app, Settings.snapshot()),
+            Settings.snapshot())
+
+        for shard in search.index.shard_keys():
+            yield {'shard': shard}
+
     @staticmethod
     def index():
         """ Generator for the index method
 
             :yields: valid index pages
             """
-        post_count = len(
-            list(PostList(
-                Settings.instance(),
-                flask.current_app.root_path)))
-        
-        num_pages = math.ceil(
-            post_count / int(
-                Settings.instance()['Render']['RenderedPostCount']))
+        postlist = PostList.for_app(flask.current_app, Settings.snapshot())
+        num_pages = postlist.page_count(
+            int(Settings.snapshot()['Render']['RenderedPostCount']))
 
         for page in range(1, num_pages+1):
             yield {'page': page}
@@ -55,35 +128,470 @@ class Builder:
             :return: New object
             """
         self.app = app
-        self.freezer = flask_frozen.Freezer(app)
+        self.freezer = flask_frozen.Freezer(app, with_no_argument_rules=False)
+        self.critical_report = None
+        self.minify_report = None
+        self.profile_report = None
+        self._manifest = None
+
+        # Compressed copies are written after freezing. Keep Frozen-Flask
+        # from deleting them as extra files.
+        ignore = list(self.app.config['FREEZER_DESTINATION_IGNORE'])
+        for encoding in ENCODINGS.values():
+            if f'*{encoding.suffix}' not in ignore:
+                ignore.append(f'*{encoding.suffix}')
+
+        self.app.config['FREEZER_DESTINATION_IGNORE'] = ignore
 
         # Register generators
+        self.freezer.register_generator(Builder.page)
         self.freezer.register_generator(Builder.blog_post)
+        self.freezer.register_generator(Builder.image_variant)
+        self.freezer.register_generator(Builder.static_file)
         self.freezer.register_generator(Builder.index)
+        self.freezer.register_generator(Builder.search_shard)
 
-    def build(self):
+    def build(self, incremental=False, jobs=1, minify=False,
+              critical_css=False, profile=False):
         """ Converts blog to static HTML/CSS
 
+            :param incremental: <Bool> Only rebuild pages whose inputs changed
+            :param jobs: <int> Number of processes used to render pages
+            :param minify: <Bool> Minify the HTML, XML and CSS. The bytes
+                           saved are stored in minify_report.
+            :param critical_css: <Bool> Inline the CSS used by the top of
+                                 each page and load stylesheets later. The
+                                 pages changed and bytes inlined are stored
+                                 in critical_report.
+            :param profile: <Bool> Time each phase of the build and each
+                            page. The <BuildProfile> is stored in
+                            profile_report.
+            :return: None
+            """
+        self.profile_report = BuildProfile() if profile else None
+        if profile:
+            start_profiling(self.profile_report)
+
+        try:
+            self._build(incremental, jobs, minify, critical_css)
+        finally:
+            stop_profiling()
+
+    def _build(self, incremental, jobs, minify, critical_css):
+        """ Runs each phase of the build
+
+            :param incremental: <Bool> Only rebuild pages whose inputs changed
+            :param jobs: <int> Number of processes used to render pages
+            :param minify: <Bool> Minify the HTML, XML and CSS
+            :param critical_css: <Bool> Inline the critical CSS of each page
             :return: None
             """
-        shutil.rmtree(self.freezer.root, ignore_errors=True)
-        self.freezer.freeze()
+        with self._phase('manifest'):
+            self._manifest = self._create_manifest()
+
+        if not incremental:
+            with self._phase('clean'):
+                shutil.rmtree(self.freezer.root, ignore_errors=True)
+
+        # Create the image variants up front so they are created in
+        # parallel instead of one at a time as they are frozen.
+        with self._phase('images'):
+            ImagePipeline.for_app(
+                self.app,
+                Settings.snapshot()).generate_all()
+
+        with self._phase('freeze'):
+            if jobs > 1:
+                self._freeze_parallel(incremental, jobs)
+            else:
+                self._freeze(incremental)
+
+            self._manifest.save()
 
         # The flask_frozen module doesn't route to the 404 page.
-        # Use the renderer to create it for you and copy the
+        # Use the app's renderer to create it for you and copy the
         # results into the build directory.
-        renderer = Renderer(Settings.instance())
-        renderer.connect(flask.current_app)
+        renderer = self.app.extensions['renderer']
+
+        with self._phase('404'):
+            with self.app.test_request_context(base_url=None):
+                write_path = pathlib.Path(self.freezer.root) / '404.html'
+                with write_path.open('w') as f_handle:
+                    f_handle.write(renderer.render_404()[0])
+
+        self.critical_report = None
+        if critical_css:
+            with self._phase('critical-css'):
+                critical = CriticalCss.from_settings(
+                    Settings.snapshot(),
+                    self.freezer.root)
+                self.critical_report = critical.inline_tree()
+
+                # Pages kept by an incremental build keep the CSS inlined
+                # when they were built
+                self._record_stylesheets(critical.stylesheets)
+                self._manifest.save()
+
+        # Minify before compressing so the compressed copies match
+        self.minify_report = None
+        if minify:
+            with self._phase('minify'):
+                self.minify_report = minify_tree(self.freezer.root)
+
+        with self._phase('compress'):
+            Precompressor.from_settings(
+                Settings.snapshot(),
+                self.app.root_path).compress_tree(self.freezer.root)
+
+    def _record_stylesheets(self, stylesheets):
+        """ Records the static stylesheets inlined into each page as inputs
+            of the page
+
+            :param stylesheets: <dict> of <list> of stylesheet URLs linked
+                                by each page (path relative to build)
+            :return: None
+            """
+        static_prefix = (
+            f'{self.freezer._script_name()}{self.app.static_url_path}/')
+        fingerprints = StaticFingerprints.for_app(self.app)
+        for filename, hrefs in stylesheets.items():
+            url = f'/{filename}'
+            if url.endswith('/index.html'):
+                url = url[:-len('index.html')]
+
+            inputs = []
+            for href in hrefs:
+                path = urllib.parse.unquote(urllib.parse.urlsplit(href).path)
+                if path.startswith(static_prefix):
+                    name = path[len(static_prefix):]
+                    inputs.append(
+                        pathlib.Path(self.app.static_folder) /
+                        (fingerprints.original(name) or name))
+
+            self._manifest.add_inputs(url, inputs)
+
+    def _phase(self, name):
+        """ Times a phase of the build if it is being profiled
+
+            :param name: <str> Name of phase
+            :return: Context manager
+            """
+        if self.profile_report is None:
+            return contextlib.nullcontext()
+
+        return self.profile_report.phase(name)
+
+    def _create_manifest(self, pseudo_inputs=None):
+        """ Creates the manifest that records the inputs of each page
+
+            :param pseudo_inputs: <dict> of non-file input digests. Found
+                                  from the current settings/posts if None.
+            :return: <BuildManifest>
+            """
+        settings = Settings.snapshot()
+
+        if pseudo_inputs is None:
+            with self.app.test_request_context(base_url=None):
+                posts_digest = digest_posts(
+                    PostList.for_app(self.app, settings))
+
+            pseudo_inputs = {
+                CODE_INPUT: digest_code(),
+                POSTS_INPUT: posts_digest,
+                SETTINGS_INPUT: digest_settings(settings),
+            }
+
+        return BuildManifest.from_settings(
+            settings,
+            self.app.root_path,
+            pseudo_inputs)
+
+    def _freeze(self, incremental):
+        """ Renders every page in this process
 
+            :param incremental: <Bool> Only rebuild pages whose inputs changed
+            :return: None
+            """
+        tracker = DependencyTracker.for_app(self.app)
+
+        if incremental:
+            self.app.config['FREEZER_SKIP_EXISTING'] = self._is_fresh
+
+        tracker.manifest = self._manifest
+        try:
+            with warnings.catch_warnings():
+                # Frozen-Flask warns about every endpoint it didn't build.
+                # Only hidden while this build freezes.
+                dynamic = '|'.join(DYNAMIC_ENDPOINTS)
+                warnings.filterwarnings(
+                    'ignore',
+                    message='Nothing frozen for endpoints '
+                            f'(({dynamic}), )*({dynamic})\\. ',
+                    category=flask_frozen.MissingURLGeneratorWarning)
+
+                if self.profile_report is None:
+                    self.freezer.freeze()
+                else:
+                    # Each page is built before it is yielded
+                    start = time.perf_counter()
+                    for page in self.freezer.freeze_yield():
+                        end = time.perf_counter()
+                        self.profile_report.finish_page(
+                            page.url,
+                            end - start)
+                        start = end
+        finally:
+            tracker.manifest = None
+            self.app.config['FREEZER_SKIP_EXISTING'] = False
+
+    def _freeze_parallel(self, incremental, jobs):
+        """ Renders every page using a pool of processes
+
+            The URLs from the generators are split between the workers. Each
+            worker reports the URLs linked from the pages it rendered, which
+            are then split between the workers again until none are left.
+
+            :param incremental: <Bool> Only rebuild pages whose inputs changed
+            :param jobs: <int> Number of processes
+            :return: None
+            """
+        root = self.freezer.root
+        ignore = self.app.config['FREEZER_DESTINATION_IGNORE']
+        previous_files = set()
+        if os.path.isdir(root):
+            previous_files = {
+                unicodedata.normalize(
+                    'NFC',
+                    os.path.join(root, *name.split('/')))
+                for name in flask_frozen.walk_directory(root, ignore=ignore)
+            }
+
+        # Each worker renders with the settings, root and config of this
+        # app, so it builds the same site as a serial build.
+        worker_config = {
+            key: value for key, value in self.app.config.items()
+            if key != 'FREEZER_SKIP_EXISTING'
+        }
+        worker_config['FREEZER_DESTINATION'] = root
+        settings = self.app.extensions.get('settings') or Settings.snapshot()
+
+        pending = list(dict.fromkeys(self.freezer.all_urls()))
+        seen_urls = set(pending)
+        built_files = set()
+
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=_init_worker,
+                initargs=(
+                    settings,
+                    self.app.root_path,
+                    worker_config,
+                    self._manifest.pseudo_inputs,
+                    incremental,
+                    self.profile_report is not None)) as executor:
+
+            while pending:
+                # Interleave the URLs so that each chunk gets a similar mix
+                # of expensive (posts) and cheap (static files) pages.
+                num_chunks = min(len(pending), jobs * 4)
+                chunks = [pending[ii::num_chunks] for ii in range(num_chunks)]
+
+                pending = []
+                for result in executor.map(_freeze_chunk, chunks):
+                    filenames, linked_urls, outputs, files, profile = result
+                    built_files.update(
+                        unicodedata.normalize('NFC', name)
+                        for name in filenames)
+                    self._manifest.merge(outputs, files)
+                    if profile is not None:
+                        self.profile_report.merge(*profile)
+
+                    for url in linked_urls:
+                        if url not in seen_urls:
+                            seen_urls.add(url)
+                            pending.append(url)
+
+        if self.app.config['FREEZER_REMOVE_EXTRA_FILES']:
+            for extra_file in previous_files - built_files:
+                os.remove(extra_file)
+                parent = os.path.dirname(extra_file)
+                if not os.listdir(parent):
+                    os.removedirs(parent)
+
+    def _freeze_urls(self, urls):
+        """ Renders a set of pages in this process
+
+            :param urls: <list> of <str> URLs to render
+            :return: <tuple> of built filenames and <list> of linked URLs
+            """
+        # Frozen-Flask creates missing directories without exist_ok, which
+        # races with the other build processes. Create them first.
+        for url in urls:
+            destination = self.freezer.urlpath_to_filepath(url)
+            os.makedirs(
+                os.path.dirname(os.path.join(self.freezer.root, destination)),
+                exist_ok=True)
+
+        filenames = []
+        for url in urls:
+            start = time.perf_counter()
+            filenames.append(self.freezer._build_one(url))
+            if self.profile_report is not None:
+                self.profile_report.finish_page(
+                    url,
+                    time.perf_counter() - start)
+
+        # Convert the url_for calls made while rendering into URLs the same
+        # way that Frozen-Flask does.
+        linked_urls = []
         with self.app.test_request_context(base_url=None):
-            write_path = pathlib.Path(self.freezer.root) / '404.html'
-            with write_path.open('w') as f_handle:
-                f_handle.write(renderer.render_404()[0])
+            for endpoint, values in self.freezer.url_for_logger.iter_calls():
+                url = urllib.parse.unquote(flask.url_for(endpoint, **values))
+                linked_urls.append(urllib.parse.urlsplit(url).path)
+
+        return filenames, linked_urls
+
+    def _is_fresh(self, url, filename):
+        """ Determines if a page from the last build can be kept
+
+            Used as FREEZER_SKIP_EXISTING during incremental builds. The
+            url_for calls made by kept pages are replayed so Frozen-Flask
+            still finds the pages they link to.
+
+            :param url: <str> URL of page
+            :param filename: <str> Path the page is written to
+            :return: <Bool> True if the page does not need to be rebuilt
+            """
+        if not os.path.isfile(filename) or not self._manifest.is_fresh(url):
+            return False
 
-    def host_static_app(self, host):
-        """ Hosts the static application after it is built
+        self.freezer.url_for_logger.logged_calls.extend(
+            self._manifest.links(url))
+        return True
+
+    def make_static_server(self, host, port, quiet=False):
+        """ Creates a server for the build area
+
+            It is multi-threaded and sends files with sendfile, so (unlike
+            make_static_app) it can be used to load test the static site.
+
+            :param host: <str> Address to listen on
+            :param port: <int> Port to listen on (0 for any free port)
+            :param quiet: <Bool> Don't log requests
+            :return: <StaticServer> (call serve_forever to start it)
+            """
+        settings = Settings.snapshot()['StaticServer']
+        return StaticServer(
+            (host, port),
+            self.freezer.root,
+            script_name=self.freezer._script_name(),
+            static_url_path=self.app.static_url_path,
+            default_mimetype=self.app.config['FREEZER_DEFAULT_MIMETYPE'],
+            stat_interval=settings.getfloat('StatInterval'),
+            keep_alive_timeout=settings.getfloat('KeepAliveTimeout'),
+            request_queue_size=settings.getint('RequestQueueSize'),
+            quiet=quiet)
+
+    def make_static_app(self):
+        """ Creates an app that serves the build area
+
+            Same as the Frozen-Flask static app, except that the compressed
+            copies of files are sent to clients that accept them and that
+            fingerprinted static files may be cached forever.
 
             :return: Flask app instance
             """
-        # Make a new app, hosted from the build area. 
-        self.freezer.serve(host=host)
+        root = pathlib.Path(self.freezer.root)
+        static_prefix = f'{self.app.static_url_path}/'
+        fingerprints = StaticFingerprints(
+            root / self.app.static_url_path.lstrip('/'))
+
+        def dispatch_request():
+            filename = self.freezer.urlpath_to_filepath(flask.request.path)
+
+            # Override the default mimetype from settings
+            mimetype, _ = mimetypes.guess_type(filename)
+            if not mimetype:
+                mimetype = self.app.config['FREEZER_DEFAULT_MIMETYPE']
+
+            compressible = is_compressible(filename)
+            encoding = None
+            if compressible:
+                encoding = select_encoding(
+                    root / filename,
+                    flask.request.accept_encodings)
+
+            if encoding is not None:
+                filename += ENCODINGS[encoding].suffix
+
+            response = flask.send_from_directory(
+                root,
+                filename,
+                mimetype=mimetype)
+
+            if compressible:
+                response.vary.add('Accept-Encoding')
+            if encoding is not None:
+                response.content_encoding = encoding
+
+            path = flask.request.path
+            if (path.startswith(static_prefix) and
+                fingerprints.original(path[len(static_prefix):])):
+                response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+
+            return response
+
+        app = flask.Flask(__name__)
+        # Do not use the URL map
+        app.dispatch_request = dispatch_request
+        return app
+
+# Builder used by each process of the build pool
+_worker_builder = None
+
+def _init_worker(settings, root_path, config, pseudo_inputs, incremental,
+                 profile):
+    """ Creates the app and builder used by a build process
+
+        :param settings: <SettingsSnapshot> of the parent app
+        :param root_path: <str> Root directory of the parent app
+        :param config: <dict> Flask config of the parent app
+        :param pseudo_inputs: <dict> of non-file input digests
+        :param incremental: <Bool> Only rebuild pages whose inputs changed
+        :param profile: <Bool> Time each page
+        :return: None
+        """
+    global _worker_builder
+
+    # Imported here since the blog module imports this one
+    from .blog import Blog
+    app = Blog(settings, root_path).app
+    app.config.update(config)
+
+    _worker_builder = Builder(app)
+    _worker_builder._manifest = _worker_builder._create_manifest(
+        pseudo_inputs)
+
+    DependencyTracker.for_app(app).manifest = _worker_builder._manifest
+    if incremental:
+        app.config['FREEZER_SKIP_EXISTING'] = _worker_builder._is_fresh
+
+    if profile:
+        _worker_builder.profile_report = BuildProfile()
+        start_profiling(_worker_builder.profile_report)
+
+def _freeze_chunk(urls):
+    """ Renders a chunk of pages in a build process
+
+        :param urls: <list> of <str> URLs to render
+        :return: <tuple> of built filenames, linked URLs, manifest entries
+                 and profile (None if not profiling)
+        """
+    filenames, linked_urls = _worker_builder._freeze_urls(urls)
+    outputs, files = _worker_builder._manifest.export()
+
+    profile = None
+    if _worker_builder.profile_report is not None:
+        profile = _worker_builder.profile_report.export()
+
+    return filenames, linked_urls, outputs, files, profile
@@ -0,0 +1,98 @@
+"""
+    Defines the TemplateBytecodeCache class, which keeps compiled templates
+    between runs
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import jinja2
+import os
+import pathlib
+import pickle
+
+class TemplateBytecodeCache(jinja2.FileSystemBytecodeCache):
+    """ Jinja bytecode cache in a directory shared by every process
+
+        Entries are keyed by the name and path of the template and checked
+        against the checksum of its source, so edited templates are compiled
+        again. Entries are written atomically because build processes and
+        server workers may load a template while another process writes it.
+        """
+
+    def __init__(self, directory):
+        """ Constructor
+
+            :param directory: <Path> to directory of entries
+            :return: New instance
+            """
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        super().__init__(str(directory))
+
+    @staticmethod
+    def from_settings(settings, root_path):
+        """ Creates a cache at the location specified by the settings
+
+            :param settings: Blog settings from .ini
+            :param root_path: <str> Path to app root directory
+            :return: <TemplateBytecodeCache> or None if disabled
+            """
+        if not settings['Cache']['TemplateDirectory']:
+            return None
+
+        return TemplateBytecodeCache(
+            pathlib.Path(root_path) /
+            settings['Cache']['Directory'] /
+            settings['Cache']['TemplateDirectory'])
+
+    def load_bytecode(self, bucket):
+        """ Loads the compiled template, if cached and up to date
+
+            :param bucket: <jinja2.bccache.Bucket> of template
+            :return: None
+            """
+        try:
+            super().load_bytecode(bucket)
+        except (OSError, EOFError, ValueError, TypeError,
+                pickle.UnpicklingError):
+            # Unreadable entries are compiled again and overwritten
+            bucket.reset()
+
+    def dump_bytecode(self, bucket):
+        """ Writes a compiled template
+
+            :param bucket: <jinja2.bccache.Bucket> of template
+            :return: None
+            """
+        path = self._get_cache_filename(bucket)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as tmp_file:
+                bucket.write_bytecode(tmp_file)
+
+            os.replace(tmp_path, path)
+
+        except OSError:
+            # The template still renders. It is compiled again next time.
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def precompile(self, environment):
+        """ Compiles every template of an environment into the cache
+
+            Entries of removed or edited templates are deleted first.
+
+            :param environment: <jinja2.Environment> using this cache
+            :return: <int> Number of templates compiled
+            """
+        self.clear()
+        if environment.cache is not None:
+            environment.cache.clear()
+
+        names = environment.list_templates()
+        for name in names:
+            environment.get_template(name)
+
+        return len(names)
@@ -0,0 +1,87 @@
+"""
+    Defines the in-memory caches used while serving pages
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import collections
+import hashlib
+import threading
+
+class LruCache:
+    """ Thread-safe cache that evicts the least recently used entry """
+
+    def __init__(self, max_size):
+        """ Constructor
+
+            :param max_size: <int> Maximum number of entries (0 disables)
+            :return: New instance
+            """
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """ Returns the number of cached entries
+
+            :return: <int> Number of entries
+            """
+        return len(self._entries)
+
+    def get(self, key):
+        """ Gets an entry
+
+            :param key: Hashable key of entry
+            :return: Cached value or None if not cached
+            """
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """ Adds an entry, evicting the oldest one if the cache is full
+
+            :param key: Hashable key of entry
+            :param value: Value to cache
+            :return: None
+            """
+        if self._max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """ Removes every entry
+
+            :return: None
+            """
+        with self._lock:
+            self._entries.clear()
+
+class CachedPage:
+    """ A fully rendered page and the validators sent with it """
+
+    def __init__(self, body, last_modified=None):
+        """ Constructor
+
+            :param body: <str> Rendered page
+            :param last_modified: <datetime> When the content last changed
+            :return: New instance
+            """
+        self.body = body.encode()
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.last_modified = last_modified
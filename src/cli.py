@@ -7,30 +7,110 @@
 import click
 import flask
 import flask.cli
-import os
+import pathlib
 
 from .builder import Builder
 from .setting import Settings
 
 @click.command('build')
+@click.option('--incremental', is_flag=True,
+              help='Only rebuild pages whose inputs changed')
+@click.option('--jobs', '-j', default=1, type=click.IntRange(min=1),
+              help='Number of processes used to render pages')
+@click.option('--minify', is_flag=True,
+              help='Minify HTML, XML and CSS and report the bytes saved')
+@click.option('--critical-css', is_flag=True,
+              help='Inline the CSS used by the top of each page')
+@click.option('--profile', is_flag=True,
+              help='Time each phase and page and write JSON/HTML reports')
+@click.option('--profile-top', type=click.IntRange(min=1),
+              help='Number of slowest pages to summarize')
 @flask.cli.with_appcontext
-def build():
+def build(incremental, jobs, minify, critical_css, profile, profile_top):
     """ Builds static HTML files for deployment
 
+        :param incremental: <Bool> Only rebuild pages whose inputs changed
+        :param jobs: <int> Number of processes used to render pages
+        :param minify: <Bool> Minify HTML, XML and CSS
+        :param critical_css: <Bool> Inline the CSS used by the top of pages
+        :param profile: <Bool> Time each phase of the build and each page
+        :param profile_top: <int> Number of slowest pages to summarize
         :return: None
         """
-    builder = Builder(flask.current_app)
-    builder.build()
+    app = flask.current_app
+    builder = Builder(app)
+    builder.build(
+        incremental=incremental,
+        jobs=jobs,
+        minify=minify,
+        critical_css=critical_css,
+        profile=profile)
+
+    if builder.critical_report is not None:
+        pages, inlined = builder.critical_report
+        click.echo(f'Inlined {inlined:,} bytes of critical CSS in {pages} pages')
+
+    if builder.minify_report is not None:
+        click.echo(builder.minify_report.format())
+
+    if builder.profile_report is not None:
+        settings = Settings.snapshot()
+        if profile_top is None:
+            profile_top = int(settings['Build']['ProfileTopPages'])
+
+        paths = builder.profile_report.save(
+            pathlib.Path(app.root_path) /
+            settings['Cache']['Directory'] /
+            settings['Build']['ProfileReport'],
+            profile_top)
+
+        click.echo(builder.profile_report.format(profile_top))
+        for path in paths:
+            click.echo(f'Wrote {path}')
+
+@click.command('precompile')
+@flask.cli.with_appcontext
+def precompile():
+    """ Compiles every template into the bytecode cache for deployment
+
+        Servers and builds started afterwards skip parsing and compiling
+        the templates.
+
+        :return: None
+        """
+    environment = flask.current_app.jinja_env
+    if environment.bytecode_cache is None:
+        raise click.ClickException(
+            'The template cache is disabled (see TemplateDirectory in the '
+            '[Cache] section of the .ini)')
+
+    count = environment.bytecode_cache.precompile(environment)
+    click.echo(
+        f'Compiled {count} templates into '
+        f'{environment.bytecode_cache.directory}')
 
 @click.command('run-static')
 @click.argument('host')
+@click.option('--port', '-p', default=5000, type=click.IntRange(min=0),
+              help='Port to listen on')
+@click.option('--quiet', '-q', is_flag=True,
+              help="Don't log each request (e.g. while load testing)")
 @flask.cli.with_appcontext
-def run_static(host):
+def run_static(host, port, quiet):
     """ Serve the static version of the website
 
+        :param host: <str> Address to listen on
+        :param port: <int> Port to listen on
+        :param quiet: <Bool> Don't log each request
         :return: None
         """
-    os.environ['FLASK_RUN_FROM_CLI'] = 'false'
     builder = Builder(flask.current_app)
-    app = builder.host_static_app(host)
-
+    with builder.make_static_server(host, port, quiet) as server:
+        click.echo(
+            f'Serving {builder.freezer.root} on '
+            f'http://{host}:{server.server_port}{server.script_name}/ '
+            f'(press CTRL+C to quit)')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,263 @@
+"""
+    Defines the Precompressor class, which writes compressed copies of the
+    static build so that they don't have to be compressed on every request
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import collections
+import concurrent.futures
+import gzip
+import json
+import os
+import pathlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Only text compresses well. Images and PDFs are already compressed.
+COMPRESSIBLE_SUFFIXES = (
+    '.css', '.html', '.js', '.json', '.svg', '.txt', '.xml', '.xsl')
+
+Encoding = collections.namedtuple('Encoding', ['suffix', 'compress'])
+
+def _compress_gzip(data):
+    """ Compresses data with gzip
+
+        The timestamp is left out so builds are reproducible.
+
+        :param data: <bytes> to compress
+        :return: <bytes> Compressed data
+        """
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def _compress_brotli(data):
+    """ Compresses data with brotli
+
+        :param data: <bytes> to compress
+        :return: <bytes> Compressed data
+        """
+    return brotli.compress(data, mode=brotli.MODE_TEXT)
+
+# Content-Encoding tokens in order of preference. Brotli is optional.
+ENCODINGS = collections.OrderedDict()
+if brotli is not None:
+    ENCODINGS['br'] = Encoding('.br', _compress_brotli)
+
+ENCODINGS['gzip'] = Encoding('.gz', _compress_gzip)
+
+def is_compressible(path):
+    """ Determines if a file should have compressed copies
+
+        :param path: <str> or <Path> to file
+        :return: <Bool> True if the file holds text
+        """
+    return pathlib.Path(path).suffix in COMPRESSIBLE_SUFFIXES
+
+def select_encoding(path, accept_encodings, available=None):
+    """ Chooses the compressed copy of a file to send to a client
+
+        :param path: <Path> to uncompressed file
+        :param accept_encodings: <werkzeug.datastructures.Accept> from request
+        :param available: Content-Encoding tokens of the copies that exist
+                          (looked up on disk if None)
+        :return: <str> Content-Encoding token or None to send the file as is
+        """
+    best = None
+    best_quality = 0
+    for encoding, details in ENCODINGS.items():
+        quality = accept_encodings.quality(encoding)
+        if quality <= best_quality:
+            continue
+
+        if available is None:
+            exists = os.path.isfile(f'{path}{details.suffix}')
+        else:
+            exists = encoding in available
+
+        if exists:
+            best = encoding
+            best_quality = quality
+
+    return best
+
+class Precompressor:
+    """ Writes a compressed sibling of each text file in a directory
+
+        e.g. index.html gets index.html.gz and index.html.br (if the brotli
+        module is installed). Siblings that are already up to date are kept.
+        """
+
+    def __init__(self, min_size, encodings=None, max_workers=None,
+                 record_path=None):
+        """ Constructor
+
+            :param min_size: <int> Smallest file (bytes) worth compressing
+            :param encodings: <list> of Content-Encoding tokens to write.
+                              Every available encoding if None.
+            :param max_workers: <int> Number of threads (default if None)
+            :param record_path: <Path> to JSON file listing the copies
+                                written in each tree. Without it, copies of
+                                removed files can't be told apart from other
+                                compressed files, so they are kept.
+            :return: New instance
+            """
+        if encodings is None:
+            encodings = list(ENCODINGS)
+
+        self._encodings = [
+            ENCODINGS[encoding] for encoding in encodings
+            if encoding in ENCODINGS
+        ]
+        self._max_workers = max_workers
+        self._min_size = min_size
+        self._record_path = record_path
+
+    @staticmethod
+    def from_settings(settings, root_path, max_workers=None):
+        """ Creates a precompressor configured by the settings
+
+            :param settings: Blog settings from .ini
+            :param root_path: <str> Path to app root directory
+            :param max_workers: <int> Number of threads (default if None)
+            :return: <Precompressor>
+            """
+        return Precompressor(
+            int(settings['Build']['CompressMinSize']),
+            settings['Build']['CompressEncodings'].split(),
+            max_workers,
+            pathlib.Path(root_path) /
+            settings['Cache']['Directory'] /
+            settings['Cache']['CompressedCopies'])
+
+    def compress_tree(self, root):
+        """ Compresses every text file in a directory
+
+            Compressed copies written by an earlier call whose original was
+            removed (or became too small to compress) are deleted. Other
+            compressed files (e.g. a source.tar.gz download or a data.json.gz
+            without a data.json) aren't copies, so they are kept.
+
+            :param root: <str> or <Path> to directory
+            :return: <int> Number of compressed files written
+            """
+        root = pathlib.Path(root)
+        known_suffixes = {
+            encoding.suffix for encoding in ENCODINGS.values()}
+        suffixes = {encoding.suffix for encoding in self._encodings}
+        records = self._read_records()
+        written = None
+        if records is not None:
+            written = set(records.get(str(root.resolve()), []))
+
+        originals = []
+        for path in root.rglob('*'):
+            if not path.is_file():
+                continue
+
+            if path.suffix in known_suffixes:
+                original = path.with_suffix('')
+                if written is not None:
+                    is_copy = path.relative_to(root).as_posix() in written
+                else:
+                    is_copy = original.is_file() and is_compressible(original)
+
+                if is_copy and (path.suffix not in suffixes or
+                                not original.is_file() or
+                                not self._wants(original)):
+                    path.unlink()
+            elif is_compressible(path):
+                originals.append(path)
+
+        # zlib and brotli release the GIL, so threads compress in parallel
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._max_workers) as executor:
+            count = sum(executor.map(self._compress_file, originals))
+
+        if records is not None:
+            records[str(root.resolve())] = sorted(
+                path.relative_to(root).with_name(
+                    path.name + encoding.suffix).as_posix()
+                for path in originals if self._wants(path)
+                for encoding in self._encodings)
+            self._write_records(records)
+
+        return count
+
+    def _compress_file(self, path):
+        """ Writes the compressed siblings of a file
+
+            A sibling is given the modification time of its original, which
+            marks it as up to date.
+
+            :param path: <Path> to file
+            :return: <int> Number of compressed files written
+            """
+        stat = path.stat()
+        if stat.st_size < self._min_size:
+            return 0
+
+        data = None
+        written = 0
+        for encoding in self._encodings:
+            sibling = path.with_name(path.name + encoding.suffix)
+            try:
+                if sibling.stat().st_mtime_ns == stat.st_mtime_ns:
+                    continue
+            except FileNotFoundError:
+                pass
+
+            if data is None:
+                data = path.read_bytes()
+
+            sibling.write_bytes(encoding.compress(data))
+            os.utime(sibling, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            written += 1
+
+        return written
+
+    def _read_records(self):
+        """ Reads the lists of copies written in each tree
+
+            :return: <dict> of <list> of relative paths of each tree, or None
+                     if the copies aren't recorded
+            """
+        if self._record_path is None:
+            return None
+
+        try:
+            records = json.loads(self._record_path.read_text())
+        except (OSError, ValueError):
+            # Missing or corrupt. Earlier copies are kept.
+            return {}
+
+        return records if isinstance(records, dict) else {}
+
+    def _write_records(self, records):
+        """ Writes the lists of copies written in each tree
+
+            Trees that were deleted (e.g. temporary builds) are dropped.
+
+            :param records: <dict> of <list> of relative paths of each tree
+            :return: None
+            """
+        records = {
+            root: copies for root, copies in records.items()
+            if os.path.isdir(root)
+        }
+
+        self._record_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._record_path.with_name(
+            f'{self._record_path.name}.{os.getpid()}.tmp')
+        tmp_path.write_text(json.dumps(records, indent=1))
+        os.replace(tmp_path, self._record_path)
+
+    def _wants(self, path):
+        """ Determines if a file should have compressed siblings
+
+            :param path: <Path> to file
+            :return: <Bool> True if the file is compressed
+            """
+        return is_compressible(path) and path.stat().st_size >= self._min_size
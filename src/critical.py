@@ -0,0 +1,421 @@
+"""
+    Defines the CriticalCss class, which inlines the CSS needed to render the
+    top of each page and defers loading the rest
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import bs4
+import html
+import html.parser
+import pathlib
+import re
+import soupsieve
+import urllib.parse
+
+from .minify import minify_css
+
+# Added to the inlined <style> so pages are only processed once
+CRITICAL_ATTRIBUTE = 'data-critical'
+
+# States that a static page never starts in. Rules using them aren't needed
+# for the first paint, but the selector is still matched without them.
+_DYNAMIC_PSEUDO = re.compile(
+    r'::?(?:active|after|before|first-letter|first-line|focus|focus-visible|'
+    r'focus-within|hover|placeholder|selection|target|visited)\b')
+
+# Type, class and id selectors of the last compound selector (the element
+# a rule styles). Selectors with attributes or arguments aren't split.
+_SUBJECT = re.compile(r'(?:^|[\s>+~])([^\s>+~]+)$')
+_SIMPLE = re.compile(r'([.#]?)([\w-]+)|(:[\w-]+)')
+
+_HEAD = re.compile(r'<head\b.*?</head\s*>', re.DOTALL | re.IGNORECASE)
+_LINK = re.compile(r'<link\b[^>]*>', re.IGNORECASE)
+
+class _AttributeParser(html.parser.HTMLParser):
+    """ Reads the attributes of a single tag """
+
+    def __init__(self):
+        """ Constructor
+
+            :return: New instance
+            """
+        super().__init__(convert_charrefs=True)
+        self.attrs = {}
+
+    @staticmethod
+    def parse(tag):
+        """ Reads the attributes of a tag
+
+            :param tag: <str> Tag including the angle brackets
+            :return: <dict> of attribute values (None if it has no value)
+            """
+        parser = _AttributeParser()
+        parser.feed(tag)
+        parser.close()
+        return parser.attrs
+
+    def handle_starttag(self, tag, attrs):
+        """ Keeps the attributes of a start tag
+
+            :param tag: <str> Name of tag
+            :param attrs: <list> of (name, value) tuples
+            :return: None
+            """
+        self.attrs = dict(attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        """ Keeps the attributes of a self-closing tag (e.g. <link />)
+
+            :param tag: <str> Name of tag
+            :param attrs: <list> of (name, value) tuples
+            :return: None
+            """
+        self.attrs = dict(attrs)
+
+def _split_rules(css):
+    """ Splits CSS into its top level rules
+
+        :param css: <str> Minified CSS
+        :return: <list> of (prelude, body) tuples. The body of statements
+                 without a block (e.g. @import) is None.
+        """
+    rules = []
+    position = 0
+    depth = 0
+    start = 0
+    prelude = None
+    quote = None
+
+    for index, char in enumerate(css):
+        if quote is not None:
+            if char == quote and css[index - 1] != '\\':
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == '{':
+            if depth == 0:
+                prelude = css[position:index].strip()
+                start = index + 1
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                rules.append((prelude, css[start:index]))
+                position = index + 1
+        elif char == ';' and depth == 0:
+            rules.append((css[position:index].strip(), None))
+            position = index + 1
+
+    return [(prelude, body) for prelude, body in rules if prelude]
+
+def _split_selectors(prelude):
+    """ Splits a selector list on the commas that aren't in parentheses
+
+        :param prelude: <str> Selector list
+        :return: <list> of <str> selectors
+        """
+    selectors = []
+    depth = 0
+    start = 0
+    for index, char in enumerate(prelude):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(prelude[start:index])
+            start = index + 1
+
+    selectors.append(prelude[start:])
+    return [selector.strip() for selector in selectors]
+
+class CriticalCss:
+    """ Inlines the CSS rules used by the top of each page
+
+        The "top" of a page is approximated by its first elements in
+        document order, since the layout of the page isn't known without a
+        browser. The stylesheets (including web fonts) are then loaded
+        without blocking the first paint.
+        """
+
+    def __init__(self, root, fold_elements):
+        """ Constructor
+
+            :param root: <str> or <Path> to the static build
+            :param fold_elements: <int> Number of elements of the body that
+                                  are considered to be above the fold
+            :return: New instance
+            """
+        self._fold_elements = fold_elements
+        self._root = pathlib.Path(root)
+        self.stylesheets = {}
+        self._selectors = {}
+        self._stylesheets = {}
+        self._subjects = {}
+
+    @staticmethod
+    def from_settings(settings, root):
+        """ Creates a stage configured by the settings
+
+            :param settings: Blog settings from .ini
+            :param root: <str> or <Path> to the static build
+            :return: <CriticalCss>
+            """
+        return CriticalCss(root, int(settings['Build']['CriticalElements']))
+
+    def inline_tree(self):
+        """ Inlines critical CSS into every HTML page of the build
+
+            Pages that were already processed (e.g. kept by an incremental
+            build) are skipped. The stylesheets linked by each changed page
+            are kept in the stylesheets attribute, so the build can rebuild
+            the page when one of them is edited.
+
+            :return: <tuple> of number of pages changed and bytes inlined
+            """
+        pages = 0
+        inlined = 0
+        self.stylesheets = {}
+        for path in sorted(self._root.rglob('*.html')):
+            text = path.read_text(encoding='utf-8')
+            result = self.inline(text)
+            if result is not None:
+                path.write_text(result[0], encoding='utf-8')
+                pages += 1
+                inlined += result[1]
+
+                head = _HEAD.search(text)
+                self.stylesheets[path.relative_to(self._root).as_posix()] = [
+                    attrs['href']
+                    for _, attrs in self._stylesheet_links(head.group())
+                ]
+
+        return pages, inlined
+
+    def inline(self, text):
+        """ Inlines critical CSS into a page
+
+            :param text: <str> HTML of page
+            :return: <tuple> of new HTML and bytes inlined, or None if the
+                     page has no stylesheet to defer
+            """
+        head = _HEAD.search(text)
+        if head is None or CRITICAL_ATTRIBUTE in head.group():
+            return None
+
+        links = self._stylesheet_links(head.group())
+        if not links:
+            return None
+
+        soup = bs4.BeautifulSoup(text, 'html.parser')
+        fold = self._find_fold(soup)
+
+        styles = []
+        for _, attrs in links:
+            css = self._read_stylesheet(attrs['href'])
+            if css is None:
+                continue
+
+            critical = self._critical_rules(css, fold, self._names(fold))
+            if critical:
+                media = attrs.get('media') or 'all'
+                styles.append(
+                    f'<style {CRITICAL_ATTRIBUTE} '
+                    f'media="{html.escape(media)}">{critical}</style>')
+
+        # Inline the critical CSS where the first stylesheet was linked and
+        # load every stylesheet without blocking rendering.
+        head_text = head.group()
+        for index, (match, attrs) in reversed(list(enumerate(links))):
+            replacement = self._defer(match.group(), attrs)
+            if index == 0:
+                replacement = ''.join(styles) + replacement
+
+            head_text = (
+                head_text[:match.start()] +
+                replacement +
+                head_text[match.end():])
+
+        if not styles:
+            # Still mark the page so it isn't processed again
+            head_text = head_text.replace(
+                '</head',
+                f'<style {CRITICAL_ATTRIBUTE}></style></head',
+                1)
+
+        inlined = sum(len(style) for style in styles)
+        return (
+            text[:head.start()] + head_text + text[head.end():],
+            inlined)
+
+    def _critical_rules(self, css, fold, names):
+        """ Finds the rules of a stylesheet used above the fold
+
+            :param css: <str> Minified CSS
+            :param fold: <list> of elements above the fold
+            :param names: <set> of type, class and id selectors of fold
+            :return: <str> Minified CSS of critical rules
+            """
+        critical = []
+        for prelude, body in _split_rules(css):
+            if body is None:
+                # e.g. @import or @charset
+                critical.append(f'{prelude};')
+            elif prelude.startswith(('@media', '@supports')):
+                inner = self._critical_rules(body, fold, names)
+                if inner:
+                    critical.append(f'{prelude}{{{inner}}}')
+            elif prelude.startswith('@'):
+                # e.g. @font-face or @keyframes
+                critical.append(f'{prelude}{{{body}}}')
+            elif self._is_used(prelude, fold, names):
+                critical.append(f'{prelude}{{{body}}}')
+
+        return ''.join(critical)
+
+    def _compile(self, selector):
+        """ Compiles (and memoizes) a selector without dynamic pseudo-classes
+
+            :param selector: <str> CSS selector
+            :return: Compiled selector or None if it can't be matched
+            """
+        if selector not in self._selectors:
+            stripped = _DYNAMIC_PSEUDO.sub('', selector).strip() or '*'
+            try:
+                self._selectors[selector] = soupsieve.compile(stripped)
+            except (soupsieve.SelectorSyntaxError, NotImplementedError):
+                self._selectors[selector] = None
+
+        return self._selectors[selector]
+
+    def _defer(self, tag, attrs):
+        """ Changes a stylesheet link so it doesn't block rendering
+
+            The stylesheet is requested for print media (which doesn't block
+            the screen) and switched to its real media when it loads. The
+            original link is kept in <noscript> for browsers without JS.
+
+            :param tag: <str> Original <link> tag
+            :param attrs: <dict> of attributes of tag
+            :return: <str> HTML
+            """
+        media = attrs.get('media') or 'all'
+        deferred = tag[:-2] if tag.endswith('/>') else tag[:-1]
+        deferred = re.sub(
+            r'\smedia=(["\']).*?\1',
+            '',
+            deferred,
+            flags=re.IGNORECASE).rstrip()
+
+        return (
+            f'{deferred} media="print" '
+            f'onload="this.media=&#39;{html.escape(media)}&#39;">'
+            f'<noscript>{tag}</noscript>')
+
+    def _find_fold(self, soup):
+        """ Finds the elements considered to be above the fold
+
+            :param soup: <BeautifulSoup> of page
+            :return: <list> of elements
+            """
+        fold = soup.find_all(['html', 'head', 'body'])
+        body = soup.body or soup
+        fold.extend(body.find_all(True, limit=self._fold_elements))
+        return fold
+
+    def _is_used(self, prelude, fold, names):
+        """ Determines if any selector of a rule matches above the fold
+
+            :param prelude: <str> Selector list of rule
+            :param fold: <list> of elements above the fold
+            :param names: <set> of type, class and id selectors of fold
+            :return: <Bool> True if the rule is critical
+            """
+        for selector in _split_selectors(prelude):
+            # Most selectors (e.g. of highlighted code) can be ruled out
+            # without matching them against every element
+            required = self._subject(selector)
+            if required is not None and not required <= names:
+                continue
+
+            compiled = self._compile(selector)
+            if compiled is None:
+                # Keep rules that can't be checked
+                return True
+
+            if any(compiled.match(tag) for tag in fold):
+                return True
+
+        return False
+
+    def _names(self, fold):
+        """ Finds the type, class and id selectors that match the fold
+
+            :param fold: <list> of elements above the fold
+            :return: <set> of selectors (e.g. 'div', '.title' and '#main')
+            """
+        names = set()
+        for tag in fold:
+            names.add(tag.name)
+            names.update(f'.{name}' for name in tag.get('class', []))
+            if tag.get('id'):
+                names.add(f'#{tag["id"]}')
+
+        return names
+
+    def _stylesheet_links(self, head):
+        """ Finds the stylesheets linked by the head of a page
+
+            :param head: <str> HTML of head
+            :return: <list> of (<re.Match> of tag, <dict> of attributes)
+            """
+        links = []
+        for match in _LINK.finditer(head):
+            attrs = _AttributeParser.parse(match.group())
+            rel = (attrs.get('rel') or '').lower()
+            if rel == 'stylesheet' and attrs.get('href'):
+                links.append((match, attrs))
+
+        return links
+
+    def _subject(self, selector):
+        """ Finds the type, class and id selectors an element must match to be
+            styled by a selector
+
+            :param selector: <str> CSS selector
+            :return: <set> of selectors or None if it can't be determined
+            """
+        if selector not in self._subjects:
+            required = None
+            match = _SUBJECT.search(selector)
+            if match is not None and not set('([\\*|') & set(selector):
+                required = set()
+                for simple in _SIMPLE.finditer(match.group(1)):
+                    if not simple.group(3):
+                        required.add(simple.group(1) + simple.group(2))
+
+            self._subjects[selector] = required
+
+        return self._subjects[selector]
+
+    def _read_stylesheet(self, href):
+        """ Reads (and memoizes) a stylesheet of the build
+
+            :param href: <str> URL of stylesheet
+            :return: <str> Minified CSS or None if it isn't in the build
+            """
+        url = urllib.parse.urlsplit(href)
+        if url.scheme or url.netloc or not url.path.startswith('/'):
+            return None
+
+        if href not in self._stylesheets:
+            path = self._root / urllib.parse.unquote(url.path).lstrip('/')
+            try:
+                css = minify_css(path.read_text(encoding='utf-8'))
+            except OSError:
+                css = None
+
+            self._stylesheets[href] = css
+
+        return self._stylesheets[href]
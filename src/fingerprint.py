@@ -0,0 +1,178 @@
+"""
+    Defines the StaticFingerprints class, which adds a hash of their contents
+    to the names of static files
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import flask
+import hashlib
+import pathlib
+import posixpath
+import re
+import threading
+
+from .manifest import record_dependency
+
+# Sent with fingerprinted files. Their contents never change.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Number of hex digits of the hash used in a name
+FINGERPRINT_LENGTH = 10
+
+# e.g. css/stylesheet.0123456789.css
+_FINGERPRINTED_NAME = re.compile(
+    rf'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{{{FINGERPRINT_LENGTH}}})'
+    r'(?P<suffix>\.[^./]+)?$')
+
+class StaticFingerprints:
+    """ Finds and memoizes the fingerprinted names of static files
+
+        A fingerprinted name (e.g. css/stylesheet.0123456789.css) changes
+        whenever the contents of the file change, so responses for it can be
+        cached forever.
+        """
+
+    def __init__(self, static_folder, auto_reload=False):
+        """ Constructor
+
+            :param static_folder: <str> Path to static folder
+            :param auto_reload: <Bool> Check if files changed on every call.
+                                Otherwise a file is only hashed once.
+            :return: New instance
+            """
+        self._auto_reload = auto_reload
+        self._digests = {}
+        self._lock = threading.Lock()
+        self._static_path = pathlib.Path(static_folder)
+
+        # Frozen-Flask finds the static files of a view from the object its
+        # method is bound to, so this needs the same name as on the app.
+        self.static_folder = str(static_folder)
+
+    @staticmethod
+    def for_app(app):
+        """ Gets the fingerprints of an app. Creates them if not created.
+
+            :param app: Flask application
+            :return: <StaticFingerprints>
+            """
+        if 'static_fingerprints' not in app.extensions:
+            app.extensions['static_fingerprints'] = StaticFingerprints(
+                app.static_folder,
+                app.debug or app.templates_auto_reload)
+
+        return app.extensions['static_fingerprints']
+
+    def fingerprint(self, filename):
+        """ Gets the fingerprinted name of a static file
+
+            :param filename: <str> Path relative to static folder
+            :return: <str> Fingerprinted path or filename if it isn't a file
+            """
+        # The name changes with the file, so pages that link to it must be
+        # rebuilt when it's edited
+        record_dependency(self._static_path / filename)
+        digest = self._digest(filename)
+        if digest is None:
+            return filename
+
+        directory, name = posixpath.split(filename)
+        stem, dot, suffix = name.rpartition('.')
+        if not stem:
+            stem, dot, suffix = name, '', ''
+
+        return posixpath.join(directory, f'{stem}.{digest}{dot}{suffix}')
+
+    def original(self, filename):
+        """ Gets the name of the file a fingerprinted name refers to
+
+            :param filename: <str> Fingerprinted path
+            :return: <str> Path relative to static folder or None if the name
+                     isn't the current fingerprint of a file
+            """
+        match = _FINGERPRINTED_NAME.match(filename)
+        if match is None:
+            return None
+
+        original = match.group('stem') + (match.group('suffix') or '')
+        if self._digest(original) != match.group('digest'):
+            return None
+
+        return original
+
+    def _digest(self, filename):
+        """ Finds (and memoizes) the hash of a file
+
+            :param filename: <str> Path relative to static folder
+            :return: <str> Truncated hex digest or None if it isn't a file
+            """
+        with self._lock:
+            entry = self._digests.get(filename)
+
+        if entry is not None and not self._auto_reload:
+            return entry[1]
+
+        path = self._static_path / filename
+        try:
+            stat = path.stat()
+        except (OSError, ValueError):
+            return None
+
+        if self._static_path.resolve() not in path.resolve().parents:
+            return None
+
+        key = (stat.st_mtime_ns, stat.st_size)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        try:
+            digest = hashlib.sha1(
+                path.read_bytes()).hexdigest()[:FINGERPRINT_LENGTH]
+        except OSError:
+            return None
+
+        with self._lock:
+            self._digests[filename] = (key, digest)
+
+        return digest
+
+    def add_fingerprint(self, endpoint, values):
+        """ Fingerprints the filename of url_for('static', ...) calls
+
+            Registered as a url_defaults function of the app.
+
+            :param endpoint: <str> Endpoint of url_for call
+            :param values: <dict> Values of url_for call
+            :return: None
+            """
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = self.fingerprint(values['filename'])
+
+    def send_static_file(self, filename):
+        """ Serves a static file
+
+            Replaces the static view of the app. Fingerprinted names are
+            served with headers that let them be cached forever. A stale
+            fingerprint (e.g. from a cached page) gets the current file.
+
+            :param filename: <str> Requested path relative to static folder
+            :return: Response
+            """
+        original = self.original(filename)
+        is_fingerprinted = original is not None
+
+        if not is_fingerprinted:
+            original = filename
+            match = _FINGERPRINTED_NAME.match(filename)
+            if (match is not None and
+                not (self._static_path / filename).is_file()):
+                original = match.group('stem') + (match.group('suffix') or '')
+
+        record_dependency(self._static_path / original)
+        response = flask.send_from_directory(self._static_path, original)
+
+        if is_fingerprinted:
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+
+        return response
@@ -0,0 +1,184 @@
+"""
+    Defines the HighlightCache class, which caches syntax highlighted code,
+    and the registry of the lexer and formatter of each language
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import functools
+import hashlib
+import os
+import pathlib
+import pygments
+import pygments.formatters
+import pygments.lexers
+import pygments.util
+
+from .cache import LruCache
+from .profiling import measure
+
+# Languages of the blog named differently from their Pygments alias
+LANGUAGE_ALIASES = {
+    'bash': 'console',
+    'default': 'text',
+}
+
+# Languages shown without line numbers (sessions and plain text)
+NO_LINE_NUMBERS = frozenset(['console', 'pycon', 'text'])
+
+@functools.lru_cache(maxsize=None)
+def get_language(lang):
+    """ Gets the lexer and formatter of a language
+
+        They are created the first time a language is used and shared by
+        everything in the process. Any Pygments alias works. Unknown
+        languages are shown as plain text.
+
+        :param lang: <str> Language specifier (None for plain text)
+        :return: <tuple> of <pygments.lexer.Lexer> and
+                 <pygments.formatters.HtmlFormatter>
+        """
+    alias = LANGUAGE_ALIASES.get(lang or 'default', lang)
+    try:
+        lexer = pygments.lexers.get_lexer_by_name(alias)
+    except pygments.util.ClassNotFound:
+        if alias == 'text':
+            raise
+
+        return get_language('default')
+
+    if alias in NO_LINE_NUMBERS:
+        formatter = pygments.formatters.HtmlFormatter(wrapcode=True)
+    else:
+        formatter = pygments.formatters.HtmlFormatter(
+            linenos=True,
+            wrapcode=True)
+
+    return lexer, formatter
+
+class HighlightCache:
+    """ Content-addressed cache of pygments output
+
+        Entries are kept in memory (least recently used are evicted) and,
+        optionally, on disk so that they survive between runs and builds.
+        """
+
+    def __init__(self, max_size, cache_dir=None):
+        """ Constructor
+
+            :param max_size: <int> Maximum number of entries kept in memory
+            :param cache_dir: <Path> to directory of entries on disk (optional)
+            :return: New instance
+            """
+        self._memory = LruCache(max_size)
+        self._cache_dir = cache_dir
+
+    @property
+    def hits(self):
+        """ Number of lookups found in memory
+
+            :return: <int> Hits
+            """
+        return self._memory.hits
+
+    @property
+    def misses(self):
+        """ Number of lookups not found in memory (read from disk or
+            highlighted again)
+
+            :return: <int> Misses
+            """
+        return self._memory.misses
+
+    @staticmethod
+    def from_settings(settings, root_path):
+        """ Creates a cache configured by the settings
+
+            :param settings: Blog settings from .ini
+            :param root_path: <str> Path to app root directory
+            :return: <HighlightCache>
+            """
+        cache_dir = None
+        if settings['Cache']['HighlightDirectory']:
+            cache_dir = (
+                pathlib.Path(root_path) /
+                settings['Cache']['Directory'] /
+                settings['Cache']['HighlightDirectory'])
+
+        return HighlightCache(
+            int(settings['Cache']['HighlightCacheSize']),
+            cache_dir)
+
+    def highlight(self, code, lexer, formatter):
+        """ Highlights code, reusing a previous result if possible
+
+            :param code: <str> Code to highlight
+            :param lexer: <pygments.lexer.Lexer> for the language
+            :param formatter: <pygments.formatter.Formatter> to format with
+            :return: <str> Highlighted code
+            """
+        key = HighlightCache._key(code, lexer, formatter)
+
+        highlighted = self._memory.get(key)
+        if highlighted is not None:
+            return highlighted
+
+        highlighted = self._read(key)
+        if highlighted is None:
+            with measure('pygments.highlight'):
+                highlighted = pygments.highlight(code, lexer, formatter)
+
+            self._write(key, highlighted)
+
+        self._memory.put(key, highlighted)
+        return highlighted
+
+    def _read(self, key):
+        """ Reads an entry from disk
+
+            :param key: <str> Key of entry
+            :return: <str> Highlighted code or None if not cached
+            """
+        if self._cache_dir is None:
+            return None
+
+        try:
+            return (self._cache_dir / f'{key}.html').read_text()
+        except OSError:
+            return None
+
+    def _write(self, key, highlighted):
+        """ Writes an entry to disk
+
+            :param key: <str> Key of entry
+            :param highlighted: <str> Highlighted code
+            :return: None
+            """
+        if self._cache_dir is None:
+            return
+
+        # Write to a temporary file first so that readers (possibly in
+        # another process) never see a partially written entry.
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._cache_dir / f'{key}.html'
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        tmp_path.write_text(highlighted)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _key(code, lexer, formatter):
+        """ Creates the key of an entry
+
+            :param code: <str> Code to highlight
+            :param lexer: <pygments.lexer.Lexer> for the language
+            :param formatter: <pygments.formatter.Formatter> to format with
+            :return: <str> Hex digest
+            """
+        sha = hashlib.sha1()
+        sha.update(pygments.__version__.encode())
+        sha.update(type(lexer).__name__.encode())
+        sha.update(repr(sorted(lexer.options.items())).encode())
+        sha.update(type(formatter).__name__.encode())
+        sha.update(repr(sorted(formatter.options.items())).encode())
+        sha.update(code.encode())
+        return sha.hexdigest()
@@ -0,0 +1,254 @@
+"""
+    Defines the ImagePipeline class, which creates resized WebP/AVIF copies
+    of the images in static/img
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import concurrent.futures
+import hashlib
+import os
+import pathlib
+import threading
+
+try:
+    import PIL
+    import PIL.Image
+except ImportError:
+    PIL = None
+
+# Images that can be converted. SVGs are already resolution independent.
+RASTER_SUFFIXES = ('.jpeg', '.jpg', '.png', '.webp')
+
+# Pillow format name and MIME type of each variant format
+FORMATS = {
+    'avif': ('AVIF', 'image/avif'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+def _create_variant(source_path, variant_path, width, fmt, quality):
+    """ Writes a resized copy of an image in another format
+
+        Runs in a process of the pool used by ImagePipeline.generate_all().
+
+        :param source_path: <Path> to original image
+        :param variant_path: <Path> to write the copy to
+        :param width: <int> Width of copy in pixels
+        :param fmt: <str> Format of copy (a key of FORMATS)
+        :param quality: <int> Encoder quality (0 to 100)
+        :return: <Path> to copy
+        """
+    with PIL.Image.open(source_path) as image:
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+
+        if width < image.width:
+            height = round(image.height * width / image.width)
+            image = image.resize((width, height), PIL.Image.LANCZOS)
+
+        # Write to a temporary file first so that readers (possibly in
+        # another process) never see a partially written image.
+        variant_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = variant_path.with_name(
+            f'{variant_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        image.save(tmp_path, FORMATS[fmt][0], quality=quality)
+
+    os.replace(tmp_path, variant_path)
+    return variant_path
+
+class ImagePipeline:
+    """ Creates and caches resized WebP/AVIF copies (variants) of images
+
+        Variants are cached on disk by the hash of the original image, so
+        they are only created again when the image (or the settings) change.
+        Every variant is skipped if Pillow isn't installed.
+        """
+
+    def __init__(self, image_dir, cache_dir, widths, formats, quality=80,
+                 max_workers=None):
+        """ Constructor
+
+            :param image_dir: <Path> to directory of original images
+            :param cache_dir: <Path> to directory of cached variants
+            :param widths: <list> of <int> widths of variants in pixels
+            :param formats: <list> of <str> formats (keys of FORMATS)
+            :param quality: <int> Encoder quality (0 to 100)
+            :param max_workers: <int> Number of processes (default if None)
+            :return: New instance
+            """
+        self._cache_dir = pathlib.Path(cache_dir)
+        self._image_dir = pathlib.Path(image_dir)
+        self._max_workers = max_workers
+        self._quality = quality
+        self._widths = sorted(widths)
+
+        self._formats = []
+        if PIL is not None:
+            extensions = PIL.Image.registered_extensions()
+            self._formats = [
+                fmt for fmt in formats
+                if (fmt in FORMATS and
+                    extensions.get(f'.{fmt}') == FORMATS[fmt][0])
+            ]
+
+        # Original width and digest of each image by (path, mtime, size)
+        self._info = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def for_app(app, settings):
+        """ Gets the pipeline of an app. Creates one if not already created.
+
+            :param app: Flask application
+            :param settings: Blog settings from .ini
+            :return: <ImagePipeline>
+            """
+        if 'images' not in app.extensions:
+            app.extensions['images'] = ImagePipeline(
+                pathlib.Path(app.static_folder) /
+                settings['Images']['Directory'],
+                pathlib.Path(app.root_path) /
+                settings['Cache']['Directory'] /
+                settings['Cache']['ImageDirectory'],
+                [int(width) for width in settings['Images']['Widths'].split()],
+                settings['Images']['Formats'].split(),
+                int(settings['Images']['Quality']))
+
+        return app.extensions['images']
+
+    @property
+    def formats(self):
+        """ Gets the formats variants are created in
+
+            :return: <list> of <str> formats, best first
+            """
+        return list(self._formats)
+
+    def images(self):
+        """ Finds the images that have variants
+
+            :return: <list> of <str> paths relative to the image directory
+            """
+        if not self._formats or not self._image_dir.is_dir():
+            return []
+
+        return sorted(
+            path.relative_to(self._image_dir).as_posix()
+            for path in self._image_dir.rglob('*')
+            if path.suffix.lower() in RASTER_SUFFIXES and path.is_file())
+
+    def widths(self, name):
+        """ Finds the widths of the variants of an image
+
+            Images are never enlarged, so only the configured widths smaller
+            than the image are used, followed by the width of the image.
+
+            :param name: <str> Path of image relative to the image directory
+            :return: <list> of <int> widths (empty if there are no variants)
+            """
+        info = self._image_info(name)
+        if info is None:
+            return []
+
+        width, _ = info
+        return [size for size in self._widths if size < width] + [width]
+
+    def variant(self, name, width, fmt):
+        """ Gets a variant of an image, creating it if not cached
+
+            :param name: <str> Path of image relative to the image directory
+            :param width: <int> Width of variant (one of widths())
+            :param fmt: <str> Format of variant (one of formats)
+            :return: <Path> to variant or raises ValueError if it isn't valid
+            """
+        if fmt not in self._formats or width not in self.widths(name):
+            raise ValueError(f'No {fmt} variant of {name} at width {width}')
+
+        variant_path = self._variant_path(name, width, fmt)
+        if not variant_path.is_file():
+            _create_variant(
+                self._image_dir / name,
+                variant_path,
+                width,
+                fmt,
+                self._quality)
+
+        return variant_path
+
+    def generate_all(self):
+        """ Creates every variant that isn't cached using a pool of processes
+
+            :return: <int> Number of variants created
+            """
+        jobs = []
+        for name in self.images():
+            for width in self.widths(name):
+                for fmt in self._formats:
+                    variant_path = self._variant_path(name, width, fmt)
+                    if not variant_path.is_file():
+                        jobs.append((
+                            self._image_dir / name,
+                            variant_path,
+                            width,
+                            fmt,
+                            self._quality))
+
+        if not jobs:
+            return 0
+
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=self._max_workers) as executor:
+            futures = [executor.submit(_create_variant, *job) for job in jobs]
+            for future in futures:
+                future.result()
+
+        return len(jobs)
+
+    def _image_info(self, name):
+        """ Finds the width and digest of an image
+
+            Results are kept until the image is modified.
+
+            :param name: <str> Path of image relative to the image directory
+            :return: <tuple> of width and digest or None if it isn't an image
+                     with variants
+            """
+        path = self._image_dir / name
+        if (not self._formats or
+            path.suffix.lower() not in RASTER_SUFFIXES or
+            self._image_dir.resolve() not in path.resolve().parents):
+            return None
+
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+
+        key = (name, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key in self._info:
+                return self._info[key]
+
+        contents = path.read_bytes()
+        with PIL.Image.open(path) as image:
+            width = image.width
+
+        sha = hashlib.sha1(contents)
+        sha.update(f'{PIL.__version__}:{self._quality}'.encode())
+        info = (width, sha.hexdigest())
+
+        with self._lock:
+            self._info[key] = info
+
+        return info
+
+    def _variant_path(self, name, width, fmt):
+        """ Finds where a variant is cached
+
+            :param name: <str> Path of image relative to the image directory
+            :param width: <int> Width of variant
+            :param fmt: <str> Format of variant
+            :return: <Path> to variant
+            """
+        _, digest = self._image_info(name)
+        return self._cache_dir / f'{digest}-{width}.{fmt}'
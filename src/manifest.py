@@ -0,0 +1,402 @@
+"""
+    Defines the classes that track which inputs each built page depends on
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import contextlib
+import flask
+import flask.templating
+import hashlib
+import json
+import os
+import pathlib
+import threading
+
+from .profiling import ProfiledTemplate
+
+# Bump whenever the layout of the manifest changes so stale files are ignored
+MANIFEST_VERSION = 1
+
+# Inputs that are not files. Every output depends on these.
+CODE_INPUT = ':code'
+SETTINGS_INPUT = ':settings'
+
+# Input representing the metadata (not the bodies) of all posts
+POSTS_INPUT = ':posts'
+
+def record_dependency(path):
+    """ Records that the page being built depends on an input
+
+        Does nothing unless a page is being built by the Builder or the
+        dependencies are being captured.
+
+        :param path: <str> or <Path> to input file or a pseudo-input name
+        :return: None
+        """
+    if not flask.has_request_context():
+        return
+
+    deps = flask.g.get('build_deps')
+    captures = flask.g.get('dep_captures')
+    if deps is None and not captures:
+        return
+
+    path = str(path)
+    if os.path.isabs(path):
+        path = os.path.relpath(path, flask.current_app.root_path)
+
+    if deps is not None:
+        deps.add(path)
+
+    for captured in captures or []:
+        captured.add(path)
+
+def record_dependencies(paths):
+    """ Records that the page being built depends on several inputs
+
+        :param paths: <iterable> of input paths or pseudo-input names
+        :return: None
+        """
+    for path in paths:
+        record_dependency(path)
+
+@contextlib.contextmanager
+def capture_dependencies():
+    """ Collects the dependencies recorded inside a with block
+
+        Used by caches so that a cache hit can record the same dependencies
+        as the miss that filled it. Dependencies are still recorded for the
+        page being built as usual.
+
+        :yields: <set> of dependencies recorded so far
+        """
+    captured = set()
+    if not flask.has_request_context():
+        yield captured
+        return
+
+    captures = flask.g.setdefault('dep_captures', [])
+    captures.append(captured)
+    try:
+        yield captured
+    finally:
+        captures.remove(captured)
+
+def is_recording():
+    """ Determines if the page being served is being built by the Builder
+
+        :return: <Bool> True if dependencies are being recorded
+        """
+    return flask.has_request_context() and 'build_deps' in flask.g
+
+class TrackingEnvironment(flask.templating.Environment):
+    """ Jinja environment that records every template a page uses """
+
+    # Renders are timed when the build is profiled
+    template_class = ProfiledTemplate
+
+    def get_template(self, name, parent=None, globals=None):
+        """ Loads a template and records it as a dependency
+
+            :param name: <str> Name of template
+            :param parent: <str> Name of parent template
+            :param globals: <dict> Extra template globals
+            :return: <jinja2.Template>
+            """
+        template = super().get_template(name, parent, globals)
+        if template.filename is not None:
+            record_dependency(template.filename)
+
+        return template
+
+class BuildManifest:
+    """ Maps each built URL to the inputs it was rendered from
+
+        A URL whose inputs are all unchanged since it was last built is
+        considered fresh and does not have to be rendered again.
+        """
+
+    def __init__(self, manifest_path, root_path, pseudo_inputs):
+        """ Constructor
+
+            :param manifest_path: <Path> to JSON file
+            :param root_path: <str> Path to app root directory
+            :param pseudo_inputs: <dict> of current non-file input digests
+            :return: New instance
+            """
+        self._manifest_path = manifest_path
+        self._root_path = pathlib.Path(root_path)
+        self.pseudo_inputs = pseudo_inputs
+        self._digests = {}
+        self._lock = threading.Lock()
+
+        self._outputs = {}
+        self._files = {}
+        self._prev_outputs = {}
+        self._prev_files = {}
+
+        try:
+            contents = json.loads(manifest_path.read_text())
+            if contents['version'] == MANIFEST_VERSION:
+                self._prev_outputs = contents['outputs']
+                self._prev_files = contents['files']
+        except (OSError, ValueError, KeyError, TypeError):
+            # Missing or corrupt manifest. Everything will be rebuilt.
+            pass
+
+    @staticmethod
+    def from_settings(settings, root_path, pseudo_inputs):
+        """ Creates a manifest at the location specified by the settings
+
+            :param settings: Blog settings from .ini
+            :param root_path: <str> Path to app root directory
+            :param pseudo_inputs: <dict> of current non-file input digests
+            :return: <BuildManifest>
+            """
+        return BuildManifest(
+            pathlib.Path(root_path) /
+            settings['Cache']['Directory'] /
+            settings['Cache']['BuildManifest'],
+            root_path,
+            pseudo_inputs)
+
+    def is_fresh(self, url):
+        """ Determines if a URL can be reused from the previous build
+
+            :param url: <str> URL of page
+            :return: <Bool> True if no input of the page changed
+            """
+        entry = self._prev_outputs.get(url)
+        if entry is None:
+            return False
+
+        for path, digest in entry['inputs'].items():
+            if self._digest(path) != digest:
+                return False
+
+        with self._lock:
+            self._outputs[url] = entry
+
+        return True
+
+    def links(self, url):
+        """ Gets the url_for calls made when the URL was last built
+
+            :param url: <str> URL of page
+            :return: <list> of (endpoint, values) tuples
+            """
+        return [tuple(link) for link in self._prev_outputs[url]['links']]
+
+    def record(self, url, inputs, links):
+        """ Records the inputs a URL was built from
+
+            :param url: <str> URL of page
+            :param inputs: <iterable> of input paths and pseudo-inputs
+            :param links: <list> of (endpoint, values) from url_for calls
+            :return: None
+            """
+        entry = {
+            'inputs': {path: self._digest(path) for path in inputs},
+            'links': links,
+        }
+
+        with self._lock:
+            self._outputs[url] = entry
+
+    def add_inputs(self, url, inputs):
+        """ Adds inputs to a URL built or reused by this build
+
+            Used by the stages that change pages after they are rendered.
+
+            :param url: <str> URL of page
+            :param inputs: <iterable> of <str> or <Path> to input files
+            :return: None
+            """
+        digests = {}
+        for path in inputs:
+            path = str(path)
+            if os.path.isabs(path):
+                path = os.path.relpath(path, self._root_path)
+
+            digests[path] = self._digest(path)
+
+        with self._lock:
+            entry = self._outputs.get(url)
+            if entry is not None:
+                entry['inputs'] = dict(entry['inputs'], **digests)
+
+    def export(self):
+        """ Takes the entries recorded since the last export
+
+            Used to send the entries recorded by a build process back to the
+            parent process.
+
+            :return: <tuple> of output and file <dict>
+            """
+        with self._lock:
+            outputs, self._outputs = self._outputs, {}
+            files, self._files = self._files, {}
+
+        return outputs, files
+
+    def merge(self, outputs, files):
+        """ Adds entries exported from another manifest
+
+            :param outputs: <dict> of outputs from export()
+            :param files: <dict> of files from export()
+            :return: None
+            """
+        with self._lock:
+            self._outputs.update(outputs)
+            self._files.update(files)
+
+    def save(self):
+        """ Writes the manifest for the URLs built or reused in this build
+
+            :return: None
+            """
+        with self._lock:
+            contents = json.dumps({
+                'version': MANIFEST_VERSION,
+                'files': self._files,
+                'outputs': self._outputs,
+            })
+
+        self._manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._manifest_path.with_name(
+            f'{self._manifest_path.name}.{os.getpid()}.tmp')
+        tmp_path.write_text(contents)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _digest(self, path):
+        """ Finds the digest of an input
+
+            Files are only hashed when their size or mtime changed since the
+            last build.
+
+            :param path: <str> Input path relative to root or pseudo-input
+            :return: <str> Digest or None if the input does not exist
+            """
+        if path in self.pseudo_inputs:
+            return self.pseudo_inputs[path]
+
+        with self._lock:
+            if path in self._digests:
+                return self._digests[path]
+
+        try:
+            stat = (self._root_path / path).stat()
+        except OSError:
+            digest = None
+        else:
+            prev = self._prev_files.get(path)
+            if (prev is not None and
+                prev[0] == stat.st_mtime_ns and
+                prev[1] == stat.st_size):
+                digest = prev[2]
+            else:
+                digest = hashlib.sha1(
+                    (self._root_path / path).read_bytes()).hexdigest()
+
+            with self._lock:
+                self._files[path] = [stat.st_mtime_ns, stat.st_size, digest]
+
+        with self._lock:
+            self._digests[path] = digest
+
+        return digest
+
+class DependencyTracker:
+    """ Records the inputs of each page while the site is being built """
+
+    def __init__(self, app):
+        """ Constructor
+
+            Registers the request hooks with the app. Use for_app() instead
+            to avoid registering them more than once.
+
+            :param app: Flask application
+            :return: New instance
+            """
+        self.manifest = None
+
+        @app.before_request
+        def _start_recording():
+            if self.manifest is not None:
+                flask.g.build_deps = {CODE_INPUT, SETTINGS_INPUT}
+                flask.g.build_links = []
+
+        @app.after_request
+        def _stop_recording(response):
+            if self.manifest is not None and 'build_deps' in flask.g:
+                self.manifest.record(
+                    flask.request.path,
+                    flask.g.build_deps,
+                    flask.g.build_links)
+
+            return response
+
+        def _record_url_for(endpoint, values):
+            if 'build_links' in flask.g:
+                flask.g.build_links.append((endpoint, dict(values)))
+
+        # Insert at the front so values are logged before other url_defaults
+        # functions mutate them (same as the Frozen-Flask logger does).
+        app.url_default_functions.setdefault(None, []).insert(
+            0,
+            _record_url_for)
+
+    @staticmethod
+    def for_app(app):
+        """ Gets the tracker of an app. Creates one if not already created.
+
+            :param app: Flask application
+            :return: <DependencyTracker>
+            """
+        if 'dependency_tracker' not in app.extensions:
+            app.extensions['dependency_tracker'] = DependencyTracker(app)
+
+        return app.extensions['dependency_tracker']
+
+def digest_code():
+    """ Creates a digest of the Python source of the blog
+
+        :return: <str> Hex digest
+        """
+    sha = hashlib.sha1()
+    for path in sorted(pathlib.Path(__file__).parent.glob('*.py')):
+        sha.update(path.read_bytes())
+
+    return sha.hexdigest()
+
+def digest_settings(settings):
+    """ Creates a digest of the resolved settings
+
+        :param settings: Blog settings from .ini
+        :return: <str> Hex digest
+        """
+    resolved = {
+        section: dict(settings[section])
+        for section in settings.sections()
+    }
+
+    return hashlib.sha1(
+        json.dumps(resolved, sort_keys=True).encode()).hexdigest()
+
+def digest_posts(postlist):
+    """ Creates a digest of the metadata of every post
+
+        Pages that only list posts (rather than show their bodies) depend on
+        this instead of each post template.
+
+        :param postlist: <PostList> of all posts
+        :return: <str> Hex digest
+        """
+    metadata = [
+        (post.url_stem, post.metadata)
+        for post in postlist
+    ]
+
+    return hashlib.sha1(
+        json.dumps(metadata, sort_keys=True).encode()).hexdigest()
@@ -0,0 +1,161 @@
+"""
+    Defines the MetadataParser class, which finds the metadata of a post
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import html.parser
+
+class _MetadataFound(Exception):
+    """ Raised to stop parsing once every field is found """
+    pass
+
+class _Field:
+    """ Collects the string of an element, like bs4's Tag.string """
+
+    def __init__(self, name, tag):
+        """ Constructor
+
+            :param name: <str> Name of the metadata field
+            :param tag: <str> Name of the element
+            :return: New instance
+            """
+        self.name = name
+        self.tag = tag
+        self.depth = 0
+        self.strings = []
+        self.has_children = False
+
+    @property
+    def value(self):
+        """ Gets the string of the element
+
+            :return: <str> or None if the element didn't hold just a string
+            """
+        if self.has_children or not self.strings:
+            return None
+
+        return ''.join(self.strings)
+
+class MetadataParser(html.parser.HTMLParser):
+    """ Streams through a post to find its date, title and description
+
+        Finds the same fields as the BeautifulSoup queries that were used
+        before: the string of the element with id="date", the string of the
+        first <a> in the first <h3> and the first comment. Parsing stops as
+        soon as all three are found.
+        """
+
+    def __init__(self):
+        """ Constructor
+
+            :return: New instance
+            """
+        super().__init__(convert_charrefs=True)
+        self.date = None
+        self.title = None
+        self.comment = None
+
+        self._open_fields = []
+        self._found_date = False
+        self._found_h3 = False
+        self._in_first_h3 = False
+
+    @staticmethod
+    def parse(html_text):
+        """ Finds the metadata of a post
+
+            :param html_text: <str> Post HTML (or template source)
+            :return: <tuple> of date, title and description <str> (or None)
+            """
+        parser = MetadataParser()
+        try:
+            parser.feed(html_text)
+            parser.close()
+        except _MetadataFound:
+            pass
+
+        return parser.date, parser.title, parser.comment
+
+    def handle_starttag(self, tag, attrs):
+        """ Handles an opening tag
+
+            :param tag: <str> Name of element
+            :param attrs: <list> of (name, value) attributes
+            :return: None
+            """
+        for field in self._open_fields:
+            field.has_children = True
+            if field.tag == tag:
+                field.depth += 1
+
+        if not self._found_date and ('id', 'date') in attrs:
+            self._found_date = True
+            self._open_fields.append(_Field('date', tag))
+
+        if tag == 'h3' and not self._found_h3:
+            self._found_h3 = True
+            self._in_first_h3 = True
+        elif tag == 'a' and self._in_first_h3:
+            self._in_first_h3 = False
+            self._open_fields.append(_Field('title', tag))
+
+    def handle_startendtag(self, tag, attrs):
+        """ Handles a self-closing tag
+
+            :param tag: <str> Name of element
+            :param attrs: <list> of (name, value) attributes
+            :return: None
+            """
+        for field in self._open_fields:
+            field.has_children = True
+
+    def handle_endtag(self, tag):
+        """ Handles a closing tag
+
+            :param tag: <str> Name of element
+            :return: None
+            """
+        if tag == 'h3':
+            self._in_first_h3 = False
+
+        for field in list(self._open_fields):
+            if field.tag != tag:
+                continue
+
+            if field.depth > 0:
+                field.depth -= 1
+            else:
+                self._open_fields.remove(field)
+                setattr(self, field.name, field.value)
+
+        self._check_done()
+
+    def handle_data(self, data):
+        """ Handles text
+
+            :param data: <str> Text
+            :return: None
+            """
+        for field in self._open_fields:
+            field.strings.append(data)
+
+    def handle_comment(self, data):
+        """ Handles a comment
+
+            :param data: <str> Comment text
+            :return: None
+            """
+        if self.comment is None:
+            self.comment = data
+            self._check_done()
+
+    def _check_done(self):
+        """ Stops parsing if every field was found
+
+            :return: None
+            """
+        if (self._found_date and self._found_h3 and
+            not self._in_first_h3 and not self._open_fields and
+            self.comment is not None):
+            raise _MetadataFound
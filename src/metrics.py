@@ -0,0 +1,267 @@
+"""
+    Defines the RequestMetrics class, which records the latency and size of
+    each response for Prometheus and the Server-Timing header
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import bisect
+import flask
+import threading
+import time
+
+# Endpoint of the Prometheus text. It only exists on a running server, so the
+# Builder doesn't freeze it.
+METRICS_ENDPOINT = 'metrics'
+
+# Version of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _format_labels(labels):
+    """ Formats the labels of a Prometheus sample
+
+        :param labels: <list> of (name, value) tuples
+        :return: <str> e.g. {endpoint="index",le="0.5"}
+        """
+    def _escape(value):
+        return (str(value)
+                .replace('\\', '\\\\')
+                .replace('"', '\\"')
+                .replace('\n', '\\n'))
+
+    return '{{{}}}'.format(','.join(
+        f'{name}="{_escape(value)}"' for name, value in labels))
+
+class Histogram:
+    """ Counts observations in cumulative buckets, like Prometheus does
+
+        Not thread-safe. RequestMetrics holds a lock while using it.
+        """
+
+    def __init__(self, buckets):
+        """ Constructor
+
+            :param buckets: <list> of upper bounds of buckets
+            :return: New instance
+            """
+        self._buckets = sorted(buckets)
+        self._counts = [0] * (len(self._buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """ Adds an observation
+
+            :param value: <float> Observed value
+            :return: None
+            """
+        self._counts[bisect.bisect_left(self._buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        """ Formats the histogram as Prometheus samples
+
+            :param name: <str> Name of metric
+            :param labels: <list> of (name, value) tuples of histogram
+            :return: <list> of <str> lines
+            """
+        lines = []
+        cumulative = 0
+        bounds = [repr(float(bound)) for bound in self._buckets] + ['+Inf']
+        for bound, count in zip(bounds, self._counts):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{_format_labels(labels + [("le", bound)])} '
+                f'{cumulative}')
+
+        lines.append(f'{name}_sum{_format_labels(labels)} {self.sum!r}')
+        lines.append(f'{name}_count{_format_labels(labels)} {self.count}')
+        return lines
+
+class RequestMetrics:
+    """ Records latency histograms of each route of the app
+
+        Also records the time spent in each operation measured while
+        responding (e.g. rendering templates), the size of each response
+        and the hits and misses of the caches. Each response gets a
+        Server-Timing header with its operations, so they are shown by the
+        developer tools of browsers.
+        """
+
+    def __init__(self, app, url, latency_buckets, size_buckets,
+                 server_timing=True):
+        """ Constructor
+
+            Registers the request hooks and the metrics route with the app.
+            Use for_app() instead to avoid registering them more than once.
+
+            :param app: Flask application
+            :param url: <str> Route of the Prometheus text (e.g. '/metrics')
+            :param latency_buckets: <list> of bucket bounds in seconds
+            :param size_buckets: <list> of bucket bounds in bytes
+            :param server_timing: <Bool> Add the Server-Timing header
+            :return: New instance
+            """
+        self._caches = {}
+        self._latency = {}
+        self._latency_buckets = latency_buckets
+        self._lock = threading.Lock()
+        self._operations = {}
+        self._server_timing = server_timing
+        self._size_buckets = size_buckets
+        self._sizes = {}
+
+        @app.before_request
+        def _start_timer():
+            flask.g.request_start = time.perf_counter()
+            flask.g.request_timings = {}
+
+        @app.after_request
+        def _record_request(response):
+            # Scrapes would dominate the latency of an idle server
+            if (flask.request.endpoint == METRICS_ENDPOINT or
+                'request_start' not in flask.g):
+                return response
+
+            seconds = time.perf_counter() - flask.g.request_start
+            timings = flask.g.request_timings
+            size = response.calculate_content_length()
+            if size is None:
+                size = response.content_length
+
+            self.observe(
+                flask.request.endpoint or 'unmatched',
+                seconds,
+                size,
+                timings)
+
+            if self._server_timing:
+                response.headers['Server-Timing'] = ', '.join(
+                    [f'total;dur={seconds * 1000:.3f}'] + [
+                        f'{operation};dur={op_seconds * 1000:.3f}'
+                        for operation, op_seconds in timings.items()
+                    ])
+
+            return response
+
+        app.add_url_rule(url, METRICS_ENDPOINT, self.serve)
+
+    @staticmethod
+    def for_app(app, settings):
+        """ Gets the metrics of an app. Creates them if not created.
+
+            :param app: Flask application
+            :param settings: Blog settings from .ini
+            :return: <RequestMetrics>
+            """
+        if 'metrics' not in app.extensions:
+            metrics = settings['Metrics']
+            app.extensions['metrics'] = RequestMetrics(
+                app,
+                f'/{settings["Routes"]["MetricsUrl"]}',
+                [float(bound) for bound in metrics['LatencyBuckets'].split()],
+                [int(bound) for bound in metrics['SizeBuckets'].split()],
+                metrics.getboolean('ServerTiming'))
+
+        return app.extensions['metrics']
+
+    def add_cache(self, name, cache):
+        """ Reports the hits and misses of a cache
+
+            :param name: <str> Name of cache
+            :param cache: Object with hits and misses attributes
+            :return: None
+            """
+        self._caches[name] = cache
+
+    def observe(self, endpoint, seconds, size=None, timings=None):
+        """ Records a response
+
+            :param endpoint: <str> Endpoint of route
+            :param seconds: <float> Time taken to respond
+            :param size: <int> Size of response body (None if unknown)
+            :param timings: <dict> of time spent in each operation
+            :return: None
+            """
+        with self._lock:
+            latency = self._histogram(
+                self._latency,
+                (endpoint,),
+                self._latency_buckets)
+            latency.observe(seconds)
+
+            if size is not None:
+                sizes = self._histogram(
+                    self._sizes,
+                    (endpoint,),
+                    self._size_buckets)
+                sizes.observe(size)
+
+            for operation, op_seconds in (timings or {}).items():
+                self._histogram(
+                    self._operations,
+                    (endpoint, operation),
+                    self._latency_buckets).observe(op_seconds)
+
+    def format(self):
+        """ Formats the metrics in the Prometheus text format
+
+            :return: <str> Metrics
+            """
+        lines = []
+        with self._lock:
+            for name, description, histograms, label_names in [
+                    ('blog_request_duration_seconds',
+                     'Time taken to respond to a request',
+                     self._latency,
+                     ['endpoint']),
+                    ('blog_response_size_bytes',
+                     'Size of the body of a response',
+                     self._sizes,
+                     ['endpoint']),
+                    ('blog_operation_duration_seconds',
+                     'Time spent in an operation while responding',
+                     self._operations,
+                     ['endpoint', 'operation'])]:
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for key, histogram in sorted(histograms.items()):
+                    lines.extend(histogram.samples(
+                        name,
+                        list(zip(label_names, key))))
+
+        for name, attribute in [('blog_cache_hits_total', 'hits'),
+                                ('blog_cache_misses_total', 'misses')]:
+            lines.append(f'# HELP {name} Number of cache {attribute}')
+            lines.append(f'# TYPE {name} counter')
+            for cache_name, cache in sorted(self._caches.items()):
+                lines.append(
+                    f'{name}{_format_labels([("cache", cache_name)])} '
+                    f'{getattr(cache, attribute)}')
+
+        return '\n'.join(lines) + '\n'
+
+    def serve(self):
+        """ Serves the metrics in the Prometheus text format
+
+            :return: Response
+            """
+        response = flask.make_response(self.format())
+        response.headers['Content-Type'] = PROMETHEUS_CONTENT_TYPE
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    @staticmethod
+    def _histogram(histograms, key, buckets):
+        """ Gets a histogram, creating it if needed
+
+            :param histograms: <dict> of histograms
+            :param key: <tuple> of label values
+            :param buckets: <list> of bucket bounds
+            :return: <Histogram>
+            """
+        if key not in histograms:
+            histograms[key] = Histogram(buckets)
+
+        return histograms[key]
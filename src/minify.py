@@ -0,0 +1,269 @@
+"""
+    Defines the functions that minify the static build
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import collections
+import json
+import pathlib
+import re
+
+# Elements whose whitespace is significant or that are minified separately
+_HTML_TOKEN = re.compile(
+    r'(?P<raw><(?P<raw_tag>pre|textarea|code)\b.*?</(?P=raw_tag)\s*>)'
+    r'|(?P<script><script\b(?P<script_attrs>[^>]*)>'
+    r'(?P<script_body>.*?)(?P<script_end></script\s*>))'
+    r'|(?P<style><style\b(?P<style_attrs>[^>]*)>'
+    r'(?P<style_body>.*?)(?P<style_end></style\s*>))'
+    r'|(?P<comment><!--(?!\[if).*?-->)'
+    r'|(?P<tag><[^>]*>)',
+    re.DOTALL | re.IGNORECASE)
+
+_XML_TOKEN = re.compile(
+    r'(?P<raw><!\[CDATA\[.*?\]\]>|<xsl:text\b.*?</xsl:text\s*>)'
+    r'|(?P<comment><!--.*?-->)'
+    r'|(?P<tag><[^>]*>)',
+    re.DOTALL)
+
+# Whitespace inside a tag, except in quoted attribute values
+_TAG_SPACE = re.compile(r'("[^"]*"|\'[^\']*\')|\s+')
+
+# Strings are protected while the rest of the CSS is minified
+_CSS_STRING_OR_COMMENT = re.compile(
+    r'(?P<string>"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')'
+    r'|(?P<comment>/\*.*?\*/)',
+    re.DOTALL)
+
+# Characters escaped by flask.json.htmlsafe_dumps
+_JSON_HTML_ESCAPES = {
+    '<': '\\u003c',
+    '>': '\\u003e',
+    '&': '\\u0026',
+    "'": '\\u0027',
+}
+
+def _collapse_space(text):
+    """ Collapses each run of whitespace to a single character
+
+        Runs containing a line break become a line break so that the output
+        keeps (fewer, shorter) lines.
+
+        :param text: <str> Text to collapse
+        :return: <str> Collapsed text
+        """
+    return re.sub(
+        r'\s+',
+        lambda match: '\n' if '\n' in match.group() else ' ',
+        text)
+
+def _minify_tag(tag):
+    """ Removes redundant whitespace from a tag
+
+        :param tag: <str> Tag including the angle brackets
+        :return: <str> Minified tag
+        """
+    tag = _TAG_SPACE.sub(lambda match: match.group(1) or ' ', tag)
+    return re.sub(r'\s+>$', '>', tag)
+
+def _minify_json(text):
+    """ Removes the whitespace from JSON embedded in a <script> element
+
+        :param text: <str> JSON
+        :return: <str> Minified JSON (or the original if it can't be parsed)
+        """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return text
+
+    minified = json.dumps(data, separators=(',', ':'))
+    for char, escape in _JSON_HTML_ESCAPES.items():
+        minified = minified.replace(char, escape)
+
+    return minified
+
+def minify_css(text):
+    """ Removes comments and redundant whitespace from CSS
+
+        :param text: <str> CSS
+        :return: <str> Minified CSS
+        """
+    strings = []
+
+    def _protect(match):
+        if match.group('comment'):
+            return ''
+
+        strings.append(match.group('string'))
+        return f'\0{len(strings) - 1}\0'
+
+    text = _CSS_STRING_OR_COMMENT.sub(_protect, text)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r' ?([{};,>]) ?', r'\1', text)
+    text = re.sub(r': ', ':', text)
+    text = text.replace(';}', '}')
+
+    return re.sub(
+        r'\0(\d+)\0',
+        lambda match: strings[int(match.group(1))],
+        text).strip()
+
+def minify_html(text):
+    """ Removes comments and redundant whitespace from HTML
+
+        The contents of <pre>, <textarea> and <code> elements (e.g. the
+        highlighted code in posts) are left alone. JSON-LD and <style>
+        elements are minified. Other scripts are left alone.
+
+        :param text: <str> HTML
+        :return: <str> Minified HTML
+        """
+    parts = []
+    between = ''
+    position = 0
+    for match in _HTML_TOKEN.finditer(text):
+        between += text[position:match.start()]
+        position = match.end()
+
+        # Join the text around a comment so its whitespace collapses too
+        if match.group('comment'):
+            continue
+
+        parts.append(_collapse_space(between))
+        between = ''
+
+        if match.group('raw'):
+            parts.append(match.group())
+        elif match.group('script'):
+            body = match.group('script_body')
+            if 'ld+json' in match.group('script_attrs').lower():
+                body = _minify_json(body)
+
+            parts.append(
+                _minify_tag(f'<script{match.group("script_attrs")}>') +
+                body +
+                match.group('script_end'))
+        elif match.group('style'):
+            parts.append(
+                _minify_tag(f'<style{match.group("style_attrs")}>') +
+                minify_css(match.group('style_body')) +
+                match.group('style_end'))
+        elif match.group('tag'):
+            parts.append(_minify_tag(match.group()))
+
+    parts.append(_collapse_space(between + text[position:]))
+    return ''.join(parts).strip()
+
+def minify_xml(text):
+    """ Removes comments and whitespace between elements from XML
+
+        Text content, CDATA sections and <xsl:text> elements are left alone.
+
+        :param text: <str> XML
+        :return: <str> Minified XML
+        """
+    parts = []
+    position = 0
+    for match in _XML_TOKEN.finditer(text):
+        between = text[position:match.start()]
+        parts.append('' if between.isspace() else between)
+        position = match.end()
+
+        if match.group('raw'):
+            parts.append(match.group())
+        elif match.group('tag'):
+            parts.append(_minify_tag(match.group()))
+
+    between = text[position:]
+    parts.append('' if between.isspace() else between)
+    return ''.join(parts).strip()
+
+# Minifier for each type of file
+MINIFIERS = {
+    '.css': minify_css,
+    '.html': minify_html,
+    '.xml': minify_xml,
+    '.xsl': minify_xml,
+}
+
+class MinifyReport:
+    """ Counts the bytes saved by minifying each type of file """
+
+    def __init__(self):
+        """ Constructor
+
+            :return: New instance
+            """
+        self._totals = collections.defaultdict(lambda: [0, 0, 0])
+
+    def add(self, file_type, before, after):
+        """ Adds a minified file to the report
+
+            :param file_type: <str> Type of file (e.g. 'html')
+            :param before: <int> Size in bytes before minifying
+            :param after: <int> Size in bytes after minifying
+            :return: None
+            """
+        totals = self._totals[file_type]
+        totals[0] += 1
+        totals[1] += before
+        totals[2] += after
+
+    def saved(self, file_type=None):
+        """ Finds the number of bytes saved
+
+            :param file_type: <str> Type of file or None for every type
+            :return: <int> Bytes saved
+            """
+        if file_type is not None:
+            totals = [self._totals.get(file_type, (0, 0, 0))]
+        else:
+            totals = self._totals.values()
+
+        return sum(before - after for _, before, after in totals)
+
+    def format(self):
+        """ Formats the report as a table
+
+            :return: <str> Report
+            """
+        lines = [
+            f'{"type":<6}{"files":>7}{"before":>12}{"after":>12}{"saved":>9}']
+        rows = sorted(self._totals.items())
+        rows.append(('total', [
+            sum(totals[ii] for totals in self._totals.values())
+            for ii in range(3)
+        ]))
+
+        for file_type, (count, before, after) in rows:
+            saved = (before - after) / before * 100 if before else 0
+            lines.append(
+                f'{file_type:<6}{count:>7}{before:>12,}{after:>12,}'
+                f'{saved:>8.1f}%')
+
+        return '\n'.join(lines)
+
+def minify_tree(root):
+    """ Minifies every HTML, XML/XSL and CSS file in a directory
+
+        Files are only rewritten if minifying changed them, so running it
+        again (e.g. after an incremental build) leaves them untouched.
+
+        :param root: <str> or <Path> to directory
+        :return: <MinifyReport>
+        """
+    report = MinifyReport()
+    for path in sorted(pathlib.Path(root).rglob('*')):
+        minifier = MINIFIERS.get(path.suffix)
+        if minifier is None or not path.is_file():
+            continue
+
+        original = path.read_bytes()
+        minified = minifier(original.decode('utf-8')).encode('utf-8')
+        if minified != original:
+            path.write_bytes(minified)
+
+        report.add(path.suffix[1:], len(original), len(minified))
+
+    return report
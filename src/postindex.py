@@ -0,0 +1,184 @@
+"""
+    Defines the PostIndex class, which persists post metadata between runs
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import hashlib
+import json
+import os
+import pathlib
+import threading
+
+# Bump whenever the layout of an entry changes so stale files are ignored
+INDEX_VERSION = 1
+
+class PostIndex:
+    """ On-disk index of the metadata extracted from each post template
+
+        Entries are keyed by the template path and validated against the
+        template's mtime, size and content hash. Unchanged posts can then
+        be loaded without rendering and parsing the template again.
+        """
+
+    def __init__(self, index_path=None, root_path='/'):
+        """ Constructor
+
+            :param index_path: <Path> to JSON file (None disables persistence)
+            :param root_path: <str> Path that entry keys are relative to
+            :return: New instance
+            """
+        self._index_path = index_path
+        self._root_path = pathlib.Path(root_path)
+        self._entries = None
+        self._is_dirty = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def from_settings(settings, root_path):
+        """ Creates an index at the location specified by the settings
+
+            :param settings: Blog settings from .ini
+            :param root_path: <str> Path to app root directory
+            :return: <PostIndex>
+            """
+        try:
+            index_name = settings['Cache']['PostIndex']
+        except KeyError:
+            index_name = ''
+
+        if not index_name:
+            return PostIndex(root_path=root_path)
+
+        return PostIndex(
+            pathlib.Path(root_path) /
+            settings['Cache']['Directory'] /
+            index_name,
+            root_path)
+
+    def lookup(self, post_path):
+        """ Finds the cached metadata for a post template
+
+            :param post_path: <Path> to template HTML
+            :return: <dict> of metadata or None if missing/out of date
+            """
+        entry = self._load().get(self._key(post_path))
+        if entry is None:
+            return None
+
+        stat = post_path.stat()
+        if entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            return entry['metadata']
+
+        # The file was touched. Only re-parse if its contents changed.
+        if entry['hash'] != PostIndex._hash(post_path):
+            return None
+
+        with self._lock:
+            entry['mtime'] = stat.st_mtime_ns
+            entry['size'] = stat.st_size
+            self._is_dirty = True
+
+        return entry['metadata']
+
+    def store(self, post_path, metadata):
+        """ Records the metadata of a post template
+
+            :param post_path: <Path> to template HTML
+            :param metadata: <dict> JSON serializable metadata
+            :return: None
+            """
+        stat = post_path.stat()
+        entry = {
+            'hash': PostIndex._hash(post_path),
+            'metadata': metadata,
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+        }
+
+        entries = self._load()
+        with self._lock:
+            entries[self._key(post_path)] = entry
+            self._is_dirty = True
+
+    def prune(self, post_paths):
+        """ Removes entries for templates that no longer exist
+
+            :param post_paths: <iterable> of <Path> that are still present
+            :return: None
+            """
+        keep = {self._key(path) for path in post_paths}
+        entries = self._load()
+        with self._lock:
+            for key in [key for key in entries if key not in keep]:
+                del entries[key]
+                self._is_dirty = True
+
+    def save(self):
+        """ Writes the index to disk if it changed
+
+            :return: None
+            """
+        if self._index_path is None:
+            return
+
+        with self._lock:
+            if not self._is_dirty:
+                return
+
+            contents = json.dumps({
+                'version': INDEX_VERSION,
+                'entries': self._entries,
+            })
+
+            # Write to a temporary file first so that readers (possibly in
+            # another process) never see a partially written index.
+            self._index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._index_path.with_name(
+                f'{self._index_path.name}.{os.getpid()}.tmp')
+            tmp_path.write_text(contents)
+            os.replace(tmp_path, self._index_path)
+            self._is_dirty = False
+
+    def _load(self):
+        """ Loads the index from disk if not done already
+
+            :return: <dict> of entries
+            """
+        with self._lock:
+            if self._entries is not None:
+                return self._entries
+
+            self._entries = {}
+            if self._index_path is None:
+                return self._entries
+
+            try:
+                contents = json.loads(self._index_path.read_text())
+                if contents['version'] == INDEX_VERSION:
+                    self._entries = contents['entries']
+            except (OSError, ValueError, KeyError, TypeError):
+                # Missing or corrupt index. Start from scratch.
+                pass
+
+            return self._entries
+
+    def _key(self, post_path):
+        """ Creates the key of a template's entry
+
+            :param post_path: <Path> to template HTML
+            :return: <str> Path relative to the root path
+            """
+        try:
+            return str(post_path.relative_to(self._root_path))
+        except ValueError:
+            return str(post_path)
+
+    @staticmethod
+    def _hash(post_path):
+        """ Hashes the contents of a template
+
+            :param post_path: <Path> to template HTML
+            :return: <str> Hex digest
+            """
+        return hashlib.sha1(post_path.read_bytes()).hexdigest()
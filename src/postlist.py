@@ -4,67 +4,151 @@
     :copyright: Copyright (c) 2021 Chris Hughes
     :license: MIT License. See LICENSE.md for details
 """
-import bs4
-import collections
 import flask
+import math
 import pathlib
+import re
 import threading
+import types
 
 from datetime import datetime
+from src.manifest import POSTS_INPUT, record_dependency
+from src.metadata import MetadataParser
+from src.postindex import PostIndex
+from src.profiling import measure
 from src.setting import Settings
 
+# Jinja syntax. Metadata containing it must be rendered before it is used.
+JINJA_COMMENT = re.compile(r'{#.*?#}', re.DOTALL)
+JINJA_MARKERS = ('{{', '{%', '{#')
+
 class Post:
     """ Contains data for a single post """
 
-    def __init__(self, post_path):
+    def __init__(self, post_path, metadata=None):
         """ Constructor
 
             :param post_path: <Path> to template HTML
+            :param metadata: <dict> Previously extracted metadata (optional)
             :return: New instance
             """
         self.mod_date = datetime.fromtimestamp(post_path.stat().st_mtime)
+        self.path = post_path
         
         self.url_stem = post_path.stem
         self.rel_url = (
             pathlib.Path('/') / post_path.parent.stem / post_path.stem)
-        self.full_url = f'{Settings.instance()["Routes"]["BaseUrl"]}{self.rel_url}'
+        self.full_url = f'{Settings.snapshot().Routes.BaseUrl}{self.rel_url}'
         self.rel_path = (
             pathlib.Path('/') / post_path.parent.stem / post_path.name)
-        
-        self.contents = flask.render_template(
-            str(self.rel_path),
-            post_url=f'{self.rel_url}/',
-            settings=Settings.instance())
-        
-        soup = bs4.BeautifulSoup(self.contents, 'html.parser')
 
-        # Find the date of the post
-        try:
-            date_str = soup.find(id="date").string
-            post_date = datetime.strptime(
-                date_str,
-                '%b %d, %Y')
+        self._contents = None
+        if metadata is None:
+            metadata = self._parse_metadata()
 
-        except (AttributeError, ValueError):
+        # Find the date of the post
+        if metadata['date'] is not None:
+            post_date = datetime.strptime(metadata['date'], '%Y-%m-%d')
+        else:
             post_date = datetime.now()
 
         self.date = post_date
         self.datestr = self.date.strftime('%b %d, %Y')
         self.date_rfc822 = self.date.strftime('%a, %d %b %Y %H:%M:%S EST')
 
-        # Find the title of the post
-        self.title = soup.find('h3').a.string.strip()
+        self.title = metadata['title']
+        self.description = metadata['description']
+        self.metadata = metadata
+
+    @property
+    def contents(self):
+        """ Rendered HTML of the post. Rendered on first access.
+
+            :return: <str> Post HTML
+            """
+        record_dependency(self.path)
+        if self._contents is None:
+            self._contents = flask.render_template(
+                str(self.rel_path),
+                post_url=f'{self.rel_url}/',
+                settings=Settings.snapshot())
+
+        return self._contents
+
+    def _parse_metadata(self):
+        """ Finds the date, title and description of the post
+
+            The fields are read from the template source so that the post
+            doesn't have to be rendered. The post is only rendered if one of
+            the fields is generated by Jinja.
+
+            :return: <dict> of metadata
+            """
+        source = JINJA_COMMENT.sub('', self.path.read_text())
+        fields = MetadataParser.parse(source)
+
+        if any(marker in field
+               for field in fields if field is not None
+               for marker in JINJA_MARKERS):
+            fields = MetadataParser.parse(self.contents)
+
+        date_str, title, comment = fields
+
+        # Find the date of the post
+        try:
+            post_date = datetime.strptime(
+                date_str,
+                '%b %d, %Y').strftime('%Y-%m-%d')
+
+        except (TypeError, ValueError):
+            post_date = None
 
         # Find meta description. Will be contained in comment
-        comment = soup.find(text=lambda text:isinstance(text, bs4.Comment))
         if comment is not None:
-            self.description = str(comment).replace('\n', ' ').strip()
-            self.description = self.description.replace('  ', ' ')
+            description = comment.replace('\n', ' ').strip()
+            description = description.replace('  ', ' ')
         else:
-            self.description = ''
+            description = ''
+
+        return {
+            'date': post_date,
+            'description': description,
+            'title': title.strip(),
+        }
+
+class _Snapshot:
+    """ Immutable view of the posts at one point in time
+
+        A new snapshot is built whenever posts are (re)loaded and swapped in
+        with a single assignment, so readers never see a partial update.
+        """
+
+    __slots__ = ('posts', 'sequence', 'stats', 'version')
+
+    def __init__(self, post_list, stats, version):
+        """ Constructor
+
+            :param post_list: <iterable> of <Post>
+            :param stats: <dict> of (mtime, size) of each post path
+            :param version: <int> Version of post list
+            :return: New instance
+            """
+        self.sequence = tuple(sorted(
+            post_list,
+            key=lambda entry: entry.date,
+            reverse=True))
+        self.posts = types.MappingProxyType(
+            {post.url_stem: post for post in self.sequence})
+        self.stats = types.MappingProxyType(dict(stats))
+        self.version = version
 
 class PostList:
-    """ Maintains the date, title, path, etc of blog posts """
+    """ Maintains the date, title, path, etc of blog posts
+
+        Posts are loaded once (by the first thread to need them) into an
+        immutable snapshot. Readers use whichever snapshot was current when
+        they started and never take the lock after the first load.
+        """
 
     def __init__(self, settings, root_path='/'):
         """ Constructor
@@ -72,23 +156,41 @@ class PostList:
             :param root_path: <str> Path to app root directory
             :return: New instance
             """
+        self._index = None
+        self._post_dir = None
         self._posts = None
         self._root_path = root_path
         self._settings = settings
+        self._snapshot = None
 
-        # Lock might not be necessary, but the bug that would result if it
-        # wasn't here would be really hard to track down. Only needed if
-        # multiple threads are started by Flask application. 
+        # Serializes loading and reloading. Readers don't take it once the
+        # first snapshot is published.
         self._lock = threading.Lock()
 
+    @staticmethod
+    def for_app(app, settings):
+        """ Gets the PostList shared by everything using an app
+
+            Creates one if not already created.
+
+            :param app: Flask application
+            :param settings: Blog settings from .ini
+            :return: <PostList>
+            """
+        if 'postlist' not in app.extensions:
+            app.extensions['postlist'] = PostList(settings, app.root_path)
+
+        return app.extensions['postlist']
+
     def __iter__(self):
         """ Returns an iterator. Loads posts if not done already
 
             :param: None
             :return: Iterator
             """
-        self._load_posts()
-        return iter(self._posts.values())
+        snapshot = self._check_configure()
+        record_dependency(POSTS_INPUT)
+        return iter(snapshot.sequence)
 
     def get(self, url):
         """ Gets the post at the requested URL
@@ -96,45 +198,177 @@ class PostList:
             :param url: <str> URL of given post
             :return: <Post> or raises ValueError
             """
-        self._load_posts()
         try:
-            return self._posts[url]
+            post = self._check_configure().posts[url]
         except KeyError:
             raise ValueError
 
+        record_dependency(post.path)
+        return post
+
+    @property
+    def version(self):
+        """ Number that changes whenever the loaded posts change
+
+            Loads posts if not done already.
+
+            :return: <int> Version of post list
+            """
+        return self._check_configure().version
+
+    def __len__(self):
+        """ Returns the number of posts. Loads posts if not done already
+
+            :return: <int> Number of posts
+            """
+        return len(self._check_configure().sequence)
+
+    def page(self, number, count):
+        """ Gets the posts shown on a page of the index
+
+            :param number: <int> Page number (starting at 1)
+            :param count: <int> Number of posts per page
+            :return: <tuple> of <Post> (empty if there is no such page)
+            """
+        snapshot = self._check_configure()
+        record_dependency(POSTS_INPUT)
+
+        if number < 1:
+            return ()
+
+        start = (number - 1) * count
+        return snapshot.sequence[start:start + count]
+
+    def page_count(self, count):
+        """ Finds the number of index pages
+
+            :param count: <int> Number of posts per page
+            :return: <int> Number of pages
+            """
+        snapshot = self._check_configure()
+        record_dependency(POSTS_INPUT)
+        return math.ceil(len(snapshot.sequence) / count)
+
+    def refresh(self):
+        """ Reloads the posts that were added, edited or removed
+
+            Only the posts that changed since they were loaded are parsed
+            again. Readers keep using the previous snapshot until the new one
+            is ready. Does nothing if the posts haven't been loaded yet.
+
+            :return: <Bool> True if any post changed
+            """
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return False
+
+            stats = self._stat_posts()
+            if stats == snapshot.stats:
+                return False
+
+            posts = {post.path: post for post in snapshot.sequence}
+            for path in snapshot.stats.keys() - stats.keys():
+                del posts[path]
+
+            for path, stat in stats.items():
+                if snapshot.stats.get(path) != stat:
+                    posts[path] = self._create_post(path)
+
+            self._index.prune(stats)
+            self._index.save()
+            self._publish(posts.values(), stats)
+            return True
+
     def _check_configure(self):
-        """ Determines if post information needs to be loaded
+        """ Loads the posts if not done already
 
-            :return: None
+            Only the first caller loads them. Others wait for it to finish.
+
+            :return: <_Snapshot> of current posts
             """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+
         with self._lock:
             if self._posts is None:
                 self._load_posts()
 
+            return self._snapshot
+
     def _load_posts(self):
         """ Loads the post information 
 
+            Must be called with the lock held.
+
             :param: None
             :return: None
             """
         if self._posts:
             return
-        
-        post_list = []
 
-        post_path = (pathlib.Path(self._root_path) /
-                     flask.current_app.template_folder /
-                     self._settings['Routes']['PostsUrl'])
+        self._post_dir = (pathlib.Path(self._root_path) /
+                          flask.current_app.template_folder /
+                          self._settings['Routes']['PostsUrl'])
 
-        for path in post_path.glob('*.html'):
-            post_list.append(Post(path))
+        if self._index is None:
+            self._index = PostIndex.from_settings(
+                self._settings,
+                self._root_path)
 
-        sorted_post_list = sorted(
-            post_list,
-            key=lambda entry: entry.date,
-            reverse=True)
+        stats = self._stat_posts()
+        post_list = [self._create_post(path) for path in stats]
+
+        self._index.prune(stats)
+        self._index.save()
+        self._publish(post_list, stats)
+
+    def _create_post(self, path):
+        """ Creates a post, reusing its metadata from the index if possible
+
+            :param path: <Path> to post template
+            :return: <Post>
+            """
+        metadata = self._index.lookup(path)
+        with measure('post'):
+            post = Post(path, metadata)
+
+        if metadata is None:
+            self._index.store(path, post.metadata)
+
+        return post
+
+    def _publish(self, post_list, stats):
+        """ Swaps in a new snapshot of the posts
+
+            Must be called with the lock held.
+
+            :param post_list: <iterable> of <Post>
+            :param stats: <dict> of (mtime, size) of each post path
+            :return: None
+            """
+        version = 1
+        if self._snapshot is not None:
+            version = self._snapshot.version + 1
+
+        snapshot = _Snapshot(post_list, stats, version)
+        self._posts = snapshot.posts
+        self._snapshot = snapshot
+
+    def _stat_posts(self):
+        """ Finds the post templates and when each was last changed
+
+            :return: <dict> of (mtime, size) of each post path
+            """
+        stats = {}
+        for path in self._post_dir.glob('*.html'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # Removed while the directory was being read
+                continue
 
-        self._posts = collections.OrderedDict(
-            [(post.url_stem, post) for post in sorted_post_list])
+            stats[path] = (stat.st_mtime_ns, stat.st_size)
 
-            
+        return stats
@@ -0,0 +1,334 @@
+"""
+    Defines the BuildProfile class, which records where the time of a build
+    is spent
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import contextlib
+import flask
+import html
+import jinja2
+import json
+import pathlib
+import threading
+import time
+
+# Profile of the build running in this process (None if not profiling)
+_active_profile = None
+
+def start_profiling(profile):
+    """ Records the operations measured in this process into a profile
+
+        :param profile: <BuildProfile> to record into
+        :return: None
+        """
+    global _active_profile
+    _active_profile = profile
+
+def stop_profiling():
+    """ Stops recording the operations measured in this process
+
+        :return: None
+        """
+    global _active_profile
+    _active_profile = None
+
+@contextlib.contextmanager
+def measure(operation):
+    """ Times an operation (e.g. rendering a template) inside a with block
+
+        Does nothing unless a build is being profiled or the request is
+        being timed by the RequestMetrics. The time is added to the totals
+        of the build and to the page being built (if any), or to the
+        timings of the request.
+
+        :param operation: <str> Name of operation
+        :yields: None
+        """
+    profile = _active_profile
+    timings = None
+    if flask.has_request_context():
+        timings = flask.g.get('request_timings')
+
+    if profile is None and timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if profile is not None:
+            profile.add(operation, seconds)
+
+        if timings is not None:
+            timings[operation] = timings.get(operation, 0.0) + seconds
+
+class ProfiledTemplate(jinja2.Template):
+    """ Jinja template that measures each time it is rendered
+
+        Templates that are included or extended are rendered as part of the
+        template using them, so each render is a page or a post.
+        """
+
+    def render(self, *args, **kwargs):
+        """ Renders the template
+
+            :return: <str> Rendered template
+            """
+        with measure('template'):
+            return super().render(*args, **kwargs)
+
+def _add_time(totals, operation, count, seconds):
+    """ Adds calls of an operation to a dict of totals
+
+        :param totals: <dict> of [count, seconds] of each operation
+        :param operation: <str> Name of operation
+        :param count: <int> Number of calls
+        :param seconds: <float> Time spent in calls
+        :return: None
+        """
+    total = totals.setdefault(operation, [0, 0.0])
+    total[0] += count
+    total[1] += seconds
+
+class BuildProfile:
+    """ Records the time spent in each phase of a build and on each page
+
+        Operations measured while a page is built (e.g. highlighting code)
+        are added to that page. The time of an operation includes the time
+        of the operations it calls, e.g. highlighting is part of rendering
+        the template of a post.
+        """
+
+    def __init__(self):
+        """ Constructor
+
+            :return: New instance
+            """
+        self._lock = threading.Lock()
+        self._operations = {}
+        self._pages = {}
+        self._pending = {}
+        self._phases = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ Times a phase of the build inside a with block
+
+            Operations measured outside of a page only count towards the
+            totals of the build.
+
+            :param name: <str> Name of phase
+            :yields: None
+            """
+        with self._lock:
+            self._pending = {}
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self._phases[name] = self._phases.get(name, 0.0) + seconds
+                self._pending = {}
+
+    def add(self, operation, seconds):
+        """ Adds a call of an operation
+
+            :param operation: <str> Name of operation
+            :param seconds: <float> Time spent in call
+            :return: None
+            """
+        with self._lock:
+            _add_time(self._operations, operation, 1, seconds)
+            _add_time(self._pending, operation, 1, seconds)
+
+    def finish_page(self, url, seconds):
+        """ Adds a built page and the operations measured since the last one
+
+            :param url: <str> URL of page
+            :param seconds: <float> Time spent building page
+            :return: None
+            """
+        with self._lock:
+            self._pages[url] = (seconds, self._pending)
+            self._pending = {}
+
+    def export(self):
+        """ Takes the pages and operations recorded since the last export
+
+            Used to send the profile of a build process back to the parent
+            process.
+
+            :return: <tuple> of page and operation <dict>
+            """
+        with self._lock:
+            pages, self._pages = self._pages, {}
+            operations, self._operations = self._operations, {}
+
+        return pages, operations
+
+    def merge(self, pages, operations):
+        """ Adds pages and operations exported from another profile
+
+            :param pages: <dict> of pages from export()
+            :param operations: <dict> of operations from export()
+            :return: None
+            """
+        with self._lock:
+            self._pages.update(pages)
+            for operation, (count, seconds) in operations.items():
+                _add_time(self._operations, operation, count, seconds)
+
+    def slowest(self, count=None):
+        """ Finds the pages that took longest to build
+
+            :param count: <int> Number of pages or None for every page
+            :return: <list> of (url, seconds, operations) tuples
+            """
+        with self._lock:
+            pages = sorted(
+                ((url, seconds, dict(operations))
+                 for url, (seconds, operations) in self._pages.items()),
+                key=lambda page: (-page[1], page[0]))
+
+        return pages if count is None else pages[:count]
+
+    def as_dict(self):
+        """ Converts the profile to a JSON serializable dict
+
+            :return: <dict> of phases, operations and pages (slowest first)
+            """
+        with self._lock:
+            phases = dict(self._phases)
+            operations = {
+                operation: {'count': count, 'seconds': seconds}
+                for operation, (count, seconds)
+                in sorted(self._operations.items())
+            }
+
+        return {
+            'total_seconds': sum(phases.values()),
+            'phases': phases,
+            'operations': operations,
+            'pages': [
+                {
+                    'url': url,
+                    'seconds': seconds,
+                    'operations': {
+                        operation: {'count': count, 'seconds': op_seconds}
+                        for operation, (count, op_seconds)
+                        in sorted(page_operations.items())
+                    },
+                }
+                for url, seconds, page_operations in self.slowest()
+            ],
+        }
+
+    def format(self, top=10):
+        """ Formats a summary of the profile as tables
+
+            :param top: <int> Number of slowest pages to list
+            :return: <str> Summary
+            """
+        profile = self.as_dict()
+
+        lines = [f'{"phase":<24}{"seconds":>10}']
+        for name, seconds in profile['phases'].items():
+            lines.append(f'{name:<24}{seconds:>10.3f}')
+
+        lines.append(f'{"total":<24}{profile["total_seconds"]:>10.3f}')
+        lines.append('')
+        lines.append(f'{"operation":<24}{"seconds":>10}{"count":>8}')
+        for name, total in profile['operations'].items():
+            lines.append(
+                f'{name:<24}{total["seconds"]:>10.3f}{total["count"]:>8}')
+
+        pages = profile['pages'][:top]
+        width = max([24] + [len(page['url']) + 2 for page in pages])
+        lines.append('')
+        lines.append(f'{"slowest pages":<{width}}{"seconds":>10}')
+        for page in pages:
+            lines.append(f'{page["url"]:<{width}}{page["seconds"]:>10.3f}')
+
+        return '\n'.join(lines)
+
+    def format_html(self, top=10):
+        """ Formats the profile as an HTML report
+
+            :param top: <int> Number of slowest pages to summarize
+            :return: <str> HTML
+            """
+        profile = self.as_dict()
+        names = list(profile['operations'])
+
+        def _row(cells, tag='td'):
+            return '<tr>{}</tr>'.format(''.join(
+                f'<{tag}>{html.escape(str(cell))}</{tag}>' for cell in cells))
+
+        def _table(title, header, rows):
+            return (
+                f'<h2>{html.escape(title)}</h2><table>' +
+                _row(header, 'th') +
+                ''.join(_row(row) for row in rows) +
+                '</table>')
+
+        def _page_rows(pages):
+            for page in pages:
+                operations = page['operations']
+                yield [page['url'], f'{page["seconds"]:.3f}'] + [
+                    f'{operations[name]["seconds"]:.3f} '
+                    f'({operations[name]["count"]})'
+                    if name in operations else ''
+                    for name in names
+                ]
+
+        page_header = ['url', 'seconds'] + names
+        return ''.join([
+            '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">',
+            '<title>Build profile</title><style>',
+            'body{font-family:sans-serif}table{border-collapse:collapse}',
+            'td,th{border:1px solid #ccc;padding:.2em .5em;text-align:right}',
+            'td:first-child,th:first-child{text-align:left}',
+            '</style></head><body><h1>Build profile</h1>',
+            f'<p>Total: {profile["total_seconds"]:.3f} seconds, ',
+            f'{len(profile["pages"])} pages</p>',
+            _table(
+                'Phases',
+                ['phase', 'seconds'],
+                [[name, f'{seconds:.3f}']
+                 for name, seconds in profile['phases'].items()]),
+            _table(
+                'Operations',
+                ['operation', 'seconds', 'count'],
+                [[name, f'{total["seconds"]:.3f}', total['count']]
+                 for name, total in profile['operations'].items()]),
+            _table(
+                f'Slowest {top} pages',
+                page_header,
+                _page_rows(profile['pages'][:top])),
+            _table('All pages', page_header, _page_rows(profile['pages'])),
+            '</body></html>',
+        ])
+
+    def save(self, path, top=10):
+        """ Writes the profile as JSON and HTML reports
+
+            :param path: <str> or <Path> to reports without the suffix
+            :param top: <int> Number of slowest pages to summarize
+            :return: <list> of <Path> to reports
+            """
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        json_path = path.with_name(f'{path.name}.json')
+        json_path.write_text(json.dumps(self.as_dict(), indent=2))
+
+        html_path = path.with_name(f'{path.name}.html')
+        html_path.write_text(self.format_html(top))
+
+        return [json_path, html_path]
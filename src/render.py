@@ -10,12 +10,12 @@ import jinja2
 import json
 import math
 import pathlib
-import pygments
-import pygments.formatters
-import pygments.lexers
-import pygments.util
 
 from datetime import datetime
+from .highlight import HighlightCache, get_language
+from .fingerprint import StaticFingerprints
+from .images import FORMATS, ImagePipeline
+from .manifest import record_dependency
 from .postlist import PostList
 from .struct_data import StructuredDataFactory
 
@@ -39,62 +39,9 @@ class Renderer:
         self._app = None
         self._postlist = None
         self._settings = settings
+        self._struct_data = None
+        self._highlighter = None
 
-        # Setup parser objects
-        self._lang_config = {
-            'bash': {
-                'lexer': pygments.lexers.BashSessionLexer(),
-                'formatter': pygments.formatters.HtmlFormatter(
-                    wrapcode=True)
-            },
-            'cpp': {
-                'lexer': pygments.lexers.CppLexer(),
-                'formatter': pygments.formatters.HtmlFormatter(
-                    linenos=True,
-                    wrapcode=True)
-            },
-            'css': {
-                'lexer': pygments.lexers.CssLexer(),
-                'formatter': pygments.formatters.HtmlFormatter(
-                    linenos=True,
-                    wrapcode=True)
-            },
-            'default': {
-                'lexer': pygments.lexers.TextLexer(),
-                'formatter': pygments.formatters.HtmlFormatter(
-                    wrapcode=True)
-            },
-            'html': {
-                'lexer': pygments.lexers.HtmlLexer(),
-                'formatter': pygments.formatters.HtmlFormatter(
-                    linenos=True,
-                    wrapcode=True)
-            },
-            'js': {
-                'lexer': pygments.lexers.JavascriptLexer(),
-                'formatter': pygments.formatters.HtmlFormatter(
-                    linenos=True,
-                    wrapcode=True)
-            },
-            'py': {
-                'lexer': pygments.lexers.PythonLexer(),
-                'formatter': pygments.formatters.HtmlFormatter(
-                    linenos=True,
-                    wrapcode=True)
-            },
-            'pycon': {
-                'lexer': pygments.lexers.PythonConsoleLexer(),
-                'formatter': pygments.formatters.HtmlFormatter(
-                    wrapcode=True)
-            },
-            'xml': {
-                'lexer': pygments.lexers.XmlLexer(),
-                'formatter': pygments.formatters.HtmlFormatter(
-                    linenos=True,
-                    wrapcode=True)
-            },                
-        }
-        
     def connect(self, app):
         """ Sets the active flask app
 
@@ -108,19 +55,63 @@ class Renderer:
             :return: None
             """
         self._app = app
-        self._postlist = PostList(
+        self._app.extensions['renderer'] = self
+        self._postlist = PostList.for_app(app, self._settings)
+        self._struct_data = StructuredDataFactory(
+            self._settings,
+            int(self._settings['Cache']['StructDataCacheSize']))
+        self._highlighter = HighlightCache.from_settings(
             self._settings,
-            root_path=app.root_path)
+            app.root_path)
+        self._images = ImagePipeline.for_app(app, self._settings)
+
+        # Link to static files by a name that changes with their contents
+        fingerprints = StaticFingerprints.for_app(app)
+        if fingerprints.add_fingerprint not in app.url_default_functions.get(
+                None, []):
+            app.url_defaults(fingerprints.add_fingerprint)
+            app.view_functions['static'] = fingerprints.send_static_file
 
         # Connect context processors
         @self._app.context_processor
         def _connect_context_processors():
             return {
                 'codeify': self._codeify,
+                'picture': self._picture,
                 'settings': self._settings,
                 'url': flask.request.url,
             }
 
+    def caches(self):
+        """ Gets the caches used while rendering
+
+            :return: <dict> of caches (with hits and misses) by name
+            """
+        return {
+            'highlight': self._highlighter,
+            'struct_data': self._struct_data,
+        }
+
+    def last_modified(self, post_name=None):
+        """ Finds when the content of a page last changed
+
+            :param post_name: <str> Name of post. Uses the most recently
+                              modified post if None.
+            :return: <datetime> or None if there is no such post
+            """
+        if not self._is_configured():
+            raise RendererNotConfiguredException
+
+        if post_name is not None:
+            try:
+                return self._postlist.get(post_name).mod_date
+            except ValueError:
+                return None
+
+        return max(
+            (post.mod_date for post in self._postlist),
+            default=None)
+
     def render_latest(self, page=1):
         """ Renders the latest blog posts
 
@@ -132,8 +123,9 @@ class Renderer:
             raise RendererNotConfiguredException
             
         # Determine posts on requested page
-        posts_per_page = self._find_posts_per_page(
-            int(self._settings['Render']['RenderedPostCount']))
+        posts_per_page = int(self._settings['Render']['RenderedPostCount'])
+        num_pages = self._postlist.page_count(posts_per_page)
+        page_posts = ()
 
         context = {
             'title': self._settings['Render']['IndexTitle'],
@@ -141,17 +133,18 @@ class Renderer:
             'next_page': None,
         }
         
-        if len(posts_per_page) > 0:
-            if page < 1 or page > len(posts_per_page):
+        if num_pages > 0:
+            if page < 1 or page > num_pages:
                 return self.render_404()
             else:
+                page_posts = self._postlist.page(page, posts_per_page)
                 context['posts'] = [
                     flask.Markup(post.contents)
-                    for post in posts_per_page[page-1]]
+                    for post in page_posts]
 
             if page > 1:
                 context['prev_page'] = page-1
-            if page < len(posts_per_page):
+            if page < num_pages:
                 context['next_page'] = page+1
             
         else:
@@ -162,14 +155,12 @@ class Renderer:
 
         # Render SEO content
         try: 
-            context['canonical_url'] = f'{posts_per_page[page-1][0].full_url}/'
+            context['canonical_url'] = f'{page_posts[0].full_url}/'
         except IndexError:
             context['canonical_url'] = f'{self._settings["Routes"]["BaseUrl"]}'
 
         # Render json
-        struct_data_factory = StructuredDataFactory(self._settings)
-        context['struct_data'] = struct_data_factory.create_blog(
-            self._postlist).as_dict()
+        context['struct_data'] = self._struct_data.blog_json(self._postlist)
 
         return flask.render_template( 
             self._settings['Templates']['Index'],
@@ -219,9 +210,7 @@ class Renderer:
             f'{post.full_url}/')
 
         # Render json
-        struct_data_factory = StructuredDataFactory(self._settings)
-        context['struct_data'] = struct_data_factory.create_post(
-            post).as_dict()
+        context['struct_data'] = self._struct_data.post_json(post)
 
         # Render post
         try:
@@ -248,8 +237,7 @@ class Renderer:
         }
         
         # Render json
-        struct_data_factory = StructuredDataFactory(self._settings)
-        context['struct_data'] = struct_data_factory.create_about().as_dict()
+        context['struct_data'] = self._struct_data.about_json()
 
         return flask.render_template(
             self._settings['Templates']['About'],
@@ -273,9 +261,8 @@ class Renderer:
         }
 
         # Render json
-        struct_data_factory = StructuredDataFactory(self._settings)
-        context['struct_data'] = struct_data_factory.create_archive(
-            self._postlist).as_dict()
+        context['struct_data'] = self._struct_data.archive_json(
+            self._postlist)
 
         return flask.render_template(
             self._settings['Templates']['Archive'],
@@ -374,23 +361,58 @@ class Renderer:
         return flask.Markup(
             f'<code {code_class}>{formatted_code}</code>')
 
-    def _find_posts_per_page(self, count):
-        """ Finds which posts to render for each page
+    def _picture(self, filename, alt='', sizes='100vw', **attrs):
+        """ Creates an image that lets the browser choose a smaller variant
 
-            :param posts: <list> Of posts
-            :param count: <int> Number of posts per page
-            :return: <list> Of lists with each index representing a page
-            """
-        posts_per_page = []
-
-        for idx, post in enumerate(self._postlist):
-            mod = idx % count
-            if mod == 0:
-                posts_per_page.append([])
+            Images in the image directory are wrapped in a <picture> with a
+            <source> for each variant format. Other images (or all images if
+            Pillow isn't installed) are a plain <img>.
 
-            posts_per_page[-1].append(post)
-
-        return posts_per_page
+            :param filename: <str> Path of image relative to static folder
+            :param alt: <str> Alternate text
+            :param sizes: <str> Value of the sizes attribute of each <source>
+            :param attrs: Other attributes of the <img> (use class_ for class)
+            :return: <Markup> HTML
+            """
+        img_attrs = flask.Markup('').join(
+            flask.Markup(' {}="{}"').format(name.rstrip('_'), value)
+            for name, value in attrs.items())
+        img = flask.Markup('<img src="{}" alt="{}"{}>').format(
+            flask.url_for('static', filename=filename),
+            alt,
+            img_attrs)
+
+        prefix = f'{self._settings["Images"]["Directory"]}/'
+        if not filename.startswith(prefix):
+            return img
+
+        name = filename[len(prefix):]
+        widths = self._images.widths(name)
+        if not widths:
+            return img
+
+        # The srcset changes if the image is resized
+        record_dependency(
+            pathlib.Path(self._app.static_folder) / filename)
+
+        sources = []
+        for fmt in self._images.formats:
+            srcset = ', '.join(
+                '{} {}w'.format(
+                    flask.url_for(
+                        'image_variant',
+                        name=name,
+                        width=width,
+                        fmt=fmt),
+                    width)
+                for width in widths)
+            sources.append(
+                flask.Markup('<source type="{}" srcset="{}" sizes="{}">')
+                .format(FORMATS[fmt][1], srcset, sizes))
+
+        return flask.Markup('<picture>{}{}</picture>').format(
+            flask.Markup('').join(sources),
+            img)
 
     def _highlight_syntax(self, code, lang):
         """ Modifies code to perform syntax highlighting
@@ -399,8 +421,5 @@ class Renderer:
             :param lang: <str> Language specifier
             :return: None
             """
-        fallback_config = self._lang_config['default']
-        return pygments.highlight(
-            code,
-            self._lang_config.get(lang, fallback_config)['lexer'],
-            self._lang_config.get(lang, fallback_config)['formatter'])
+        lexer, formatter = get_language(lang)
+        return self._highlighter.highlight(code, lexer, formatter)
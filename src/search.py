@@ -0,0 +1,323 @@
+"""
+    Defines the SearchIndex class, an inverted index of the posts, and the
+    PostSearch class, which keeps it up to date with the PostList
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import bisect
+import html
+import math
+import re
+import threading
+import unicodedata
+
+from .manifest import is_recording, record_dependency
+
+# Endpoint answering queries. It only exists on a running server, so the
+# Builder doesn't freeze it.
+SEARCH_ENDPOINT = 'search'
+
+# Bump whenever the layout of the shards changes
+SEARCH_INDEX_VERSION = 1
+
+# Weight of a word in each field of a post
+FIELD_WEIGHTS = (('title', 3), ('description', 2), ('body', 1))
+
+# Words too common to be worth indexing
+STOP_WORDS = frozenset('''
+    a about an and are as at be but by can do for from has have how i if in
+    into is it its it's not of on or so than that the their them then there
+    these they this to was we were what when which will with you your
+'''.split())
+
+# Suffixes removed by stem(): (suffix, replacement). The first match wins.
+SUFFIXES = (
+    ('sses', 'ss'),
+    ('ies', 'y'),
+    ('ing', ''),
+    ('ed', ''),
+    ('ly', ''),
+    ('ss', 'ss'),
+    ('us', 'us'),
+    ('s', ''),
+)
+
+# Shortest stem a suffix is removed from
+MIN_STEM = 3
+
+_TAG = re.compile(r'<[^>]*>')
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+def stem(word):
+    """ Reduces a word to its stem, e.g. 'threads' and 'threading' to
+        'thread'
+
+        A light suffix stripper rather than a full Porter stemmer, so a
+        client using the shards can stem queries the same way in a few
+        lines.
+
+        :param word: <str> Lowercase word
+        :return: <str> Stem
+        """
+    for suffix, replacement in SUFFIXES:
+        if (word.endswith(suffix) and
+            len(word) - len(suffix) + len(replacement) >= MIN_STEM):
+            word = word[:len(word) - len(suffix)] + replacement
+            break
+
+    # Undouble the consonant left by e.g. 'running'
+    if (len(word) > MIN_STEM and
+        word[-1] == word[-2] and
+        word[-1] not in 'aeioulsz'):
+        word = word[:-1]
+
+    if len(word) > MIN_STEM and word.endswith('e'):
+        word = word[:-1]
+
+    return word
+
+def tokenize(text):
+    """ Splits text into the stems of its words, leaving out stop words
+
+        :param text: <str> Plain text
+        :return: <list> of <str> stems
+        """
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = text.encode('ascii', 'ignore').decode('ascii')
+    return [
+        stem(word.replace("'", ''))
+        for word in _WORD.findall(text)
+        if word not in STOP_WORDS
+    ]
+
+def html_to_text(markup):
+    """ Removes the tags from HTML
+
+        :param markup: <str> HTML
+        :return: <str> Text
+        """
+    return html.unescape(_TAG.sub(' ', markup))
+
+class SearchIndex:
+    """ Inverted index of the title, description and body of each post
+
+        Each term maps to a posting list of [document, weight] pairs sorted
+        by document, where the weight adds up the occurrences of the term in
+        each field of the post times the weight of the field.
+
+        The index is split into shards of the terms sharing a prefix, so a
+        browser only fetches the shards of the terms in a query. The
+        manifest lists the documents and the shards.
+        """
+
+    def __init__(self, documents, postings, prefix_length=2):
+        """ Constructor
+
+            :param documents: <list> of <dict> url, title, description, date
+            :param postings: <dict> of posting list of each term
+            :param prefix_length: <int> Length of the prefix of each shard
+            :return: New instance
+            """
+        self.documents = documents
+        self.postings = postings
+        self.prefix_length = prefix_length
+        self._terms = sorted(postings)
+
+    @staticmethod
+    def from_posts(posts, prefix_length=2):
+        """ Indexes posts
+
+            :param posts: <iterable> of <Post>
+            :param prefix_length: <int> Length of the prefix of each shard
+            :return: <SearchIndex>
+            """
+        documents = []
+        postings = {}
+        for doc, post in enumerate(posts):
+            documents.append({
+                'url': f'{post.rel_url}/',
+                'title': post.title,
+                'description': post.description,
+                'date': post.date.strftime('%Y-%m-%d'),
+            })
+
+            fields = {
+                'title': post.title,
+                'description': post.description,
+                'body': html_to_text(post.contents),
+            }
+
+            weights = {}
+            for field, field_weight in FIELD_WEIGHTS:
+                for term in tokenize(fields[field]):
+                    weights[term] = weights.get(term, 0) + field_weight
+
+            for term, weight in weights.items():
+                postings.setdefault(term, []).append([doc, weight])
+
+        return SearchIndex(documents, postings, prefix_length)
+
+    def search(self, query, limit=10):
+        """ Finds the posts containing every term of a query
+
+            The last term also matches the terms it is a prefix of, so
+            results are found while the query is typed. Posts are ranked by
+            the weight of each term times its inverse document frequency.
+
+            :param query: <str> Query
+            :param limit: <int> Maximum number of results
+            :return: <list> of <dict> documents with a score, best first
+            """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        scores = None
+        for position, term in enumerate(terms):
+            matches = [term]
+            if position == len(terms) - 1:
+                matches = self._complete(term)
+
+            term_scores = {}
+            for match in matches:
+                postings = self.postings.get(match, ())
+                idf = math.log(1 + len(self.documents) / max(len(postings), 1))
+                for doc, weight in postings:
+                    term_scores[doc] = max(
+                        term_scores.get(doc, 0.0),
+                        weight * idf)
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    doc: score + term_scores[doc]
+                    for doc, score in scores.items() if doc in term_scores
+                }
+
+            if not scores:
+                return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [
+            dict(self.documents[doc], score=round(score, 4))
+            for doc, score in ranked[:limit]
+        ]
+
+    def shard_key(self, term):
+        """ Finds the shard containing a term
+
+            :param term: <str> Term
+            :return: <str> Key of shard
+            """
+        return term[:self.prefix_length]
+
+    def shard_keys(self):
+        """ Lists the keys of every shard
+
+            :return: <list> of <str> keys
+            """
+        return sorted({self.shard_key(term) for term in self._terms})
+
+    def shard(self, key):
+        """ Gets the posting lists of the terms in a shard
+
+            :param key: <str> Key of shard
+            :return: <dict> of posting list of each term (empty if no shard)
+            """
+        start = bisect.bisect_left(self._terms, key)
+        end = start
+        while (end < len(self._terms) and
+               self.shard_key(self._terms[end]) == key):
+            end += 1
+
+        return {term: self.postings[term] for term in self._terms[start:end]}
+
+    def manifest(self):
+        """ Describes the documents and shards for a client
+
+            :return: <dict> JSON serializable manifest
+            """
+        return {
+            'version': SEARCH_INDEX_VERSION,
+            'prefix_length': self.prefix_length,
+            'documents': self.documents,
+            'shards': self.shard_keys(),
+        }
+
+    def _complete(self, prefix):
+        """ Finds the terms starting with a prefix
+
+            Short prefixes would match terms in many shards, so they are
+            only matched exactly.
+
+            :param prefix: <str> Prefix of terms
+            :return: <list> of <str> terms
+            """
+        if len(prefix) < self.prefix_length:
+            return [prefix]
+
+        start = bisect.bisect_left(self._terms, prefix)
+        end = start
+        while end < len(self._terms) and self._terms[end].startswith(prefix):
+            end += 1
+
+        return self._terms[start:end] or [prefix]
+
+class PostSearch:
+    """ Keeps a SearchIndex of the posts of an app up to date
+
+        The index is built when first needed and again whenever the posts
+        change.
+        """
+
+    def __init__(self, postlist, prefix_length=2):
+        """ Constructor
+
+            :param postlist: <PostList> to index
+            :param prefix_length: <int> Length of the prefix of each shard
+            :return: New instance
+            """
+        self._index = None
+        self._lock = threading.Lock()
+        self._postlist = postlist
+        self._prefix_length = prefix_length
+        self._version = None
+
+    @staticmethod
+    def for_app(app, postlist, settings):
+        """ Gets the search of an app. Creates it if not created.
+
+            :param app: Flask application
+            :param postlist: <PostList> of the app
+            :param settings: Blog settings from .ini
+            :return: <PostSearch>
+            """
+        if 'search' not in app.extensions:
+            app.extensions['search'] = PostSearch(
+                postlist,
+                int(settings['Search']['ShardPrefixLength']))
+
+        return app.extensions['search']
+
+    @property
+    def index(self):
+        """ Index of the current posts. Built if the posts changed.
+
+            :return: <SearchIndex>
+            """
+        version = self._postlist.version
+        with self._lock:
+            if self._index is None or self._version != version:
+                self._index = SearchIndex.from_posts(
+                    self._postlist,
+                    self._prefix_length)
+                self._version = version
+
+        if is_recording():
+            # Pages built from the index depend on every post
+            for post in self._postlist:
+                record_dependency(post.path)
+
+        return self._index
@@ -4,10 +4,276 @@
     :copyright: Copyright (c) 2021 Chris Hughes
     :license: MIT License. See LICENSE.md for details
 """
+import collections.abc
 import configparser
+import itertools
 import os
 import pathlib
 
+# Version of each snapshot. Never reused, even after Settings.destroy().
+_versions = itertools.count(1)
+
+def _add_attributes(mapping, values):
+    """ Makes the values of a read-only mapping readable as attributes
+
+        They are stored as plain attributes (rather than looked up by
+        __getattr__) so that reading them is as fast as a dict lookup.
+
+        :param mapping: <Mapping> to add attributes to
+        :param values: <dict> of values
+        :return: None
+        """
+    for name, value in values.items():
+        if name.isidentifier() and not hasattr(type(mapping), name):
+            mapping.__dict__[name] = value
+
+class _TrackedParser(configparser.ConfigParser):
+    """ ConfigParser that counts its changes so that snapshots of it know
+        when they are out of date
+        """
+
+    def __init__(self):
+        """ Constructor
+
+            :return: New instance
+            """
+        self.changes = 0
+        super().__init__(interpolation=configparser.ExtendedInterpolation())
+        self.optionxform = str
+
+    def set(self, section, option, value=None):
+        """ Sets an option (also used by settings[section][option] = value)
+
+            :param section: <str> Name of section
+            :param option: <str> Name of option
+            :param value: <str> Value
+            :return: None
+            """
+        super().set(section, option, value)
+        self.changes += 1
+
+    def add_section(self, section):
+        """ Adds a section
+
+            :param section: <str> Name of section
+            :return: None
+            """
+        super().add_section(section)
+        self.changes += 1
+
+    def remove_option(self, section, option):
+        """ Removes an option
+
+            :param section: <str> Name of section
+            :param option: <str> Name of option
+            :return: <Bool> True if the option existed
+            """
+        self.changes += 1
+        return super().remove_option(section, option)
+
+    def remove_section(self, section):
+        """ Removes a section
+
+            :param section: <str> Name of section
+            :return: <Bool> True if the section existed
+            """
+        self.changes += 1
+        return super().remove_section(section)
+
+    def _read(self, fp, fpname):
+        """ Reads an INI file
+
+            :param fp: File object
+            :param fpname: <str> Name of file
+            :return: None
+            """
+        self.changes += 1
+        super()._read(fp, fpname)
+
+class SettingsSection(collections.abc.Mapping):
+    """ Immutable section of a SettingsSnapshot
+
+        Options are read like a dict (section['Option']) or an attribute
+        (section.Option), unless they are named like a method. The
+        getboolean(), getint() and getfloat() methods of ConfigParser
+        sections are kept for compatibility.
+        """
+
+    def __init__(self, name, values):
+        """ Constructor
+
+            :param name: <str> Name of section
+            :param values: <dict> of resolved value of each option
+            :return: New instance
+            """
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_values', values)
+        _add_attributes(self, values)
+
+    def __getitem__(self, option):
+        """ Gets an option
+
+            :param option: <str> Name of option
+            :return: Value or raises KeyError
+            """
+        return self._values[option]
+
+    def __getattr__(self, option):
+        """ Gets an option
+
+            :param option: <str> Name of option
+            :return: Value or raises AttributeError
+            """
+        if option.startswith('_'):
+            # Never an option. Keeps copy and pickle from recursing.
+            raise AttributeError(option)
+
+        try:
+            return self._values[option]
+        except KeyError:
+            raise AttributeError(f'[{self._name}] has no option {option}')
+
+    def __setattr__(self, name, value):
+        """ Refuses to change an option
+
+            :raises: AttributeError
+            """
+        raise AttributeError('Settings snapshots are read-only')
+
+    def __iter__(self):
+        """ Returns an iterator over the option names
+
+            :return: Iterator
+            """
+        return iter(self._values)
+
+    def __len__(self):
+        """ Returns the number of options
+
+            :return: <int> Number of options
+            """
+        return len(self._values)
+
+    def __repr__(self):
+        """ Describes the section
+
+            :return: <str> Description
+            """
+        return f'<SettingsSection {self._name}>'
+
+    def getboolean(self, option, fallback=None):
+        """ Gets an option as a bool, like ConfigParser
+
+            :param option: <str> Name of option
+            :param fallback: Returned if the option doesn't exist
+            :return: <Bool>
+            """
+        value = self._values.get(option, fallback)
+        if isinstance(value, str):
+            return configparser.ConfigParser.BOOLEAN_STATES[value.lower()]
+
+        return value
+
+    def getint(self, option, fallback=None):
+        """ Gets an option as an int, like ConfigParser
+
+            :param option: <str> Name of option
+            :param fallback: Returned if the option doesn't exist
+            :return: <int>
+            """
+        value = self._values.get(option, fallback)
+        return value if value is None else int(value)
+
+    def getfloat(self, option, fallback=None):
+        """ Gets an option as a float, like ConfigParser
+
+            :param option: <str> Name of option
+            :param fallback: Returned if the option doesn't exist
+            :return: <float>
+            """
+        value = self._values.get(option, fallback)
+        return value if value is None else float(value)
+
+class SettingsSnapshot(collections.abc.Mapping):
+    """ Immutable copy of the settings with every value resolved
+
+        Reading a setting is a dict lookup rather than an interpolation.
+        Values stay strings, like ConfigParser. Convert them with the
+        getboolean(), getint() and getfloat() methods of a section, or
+        with int() or float() once they are read. Sections are read
+        like a dict (settings['Routes']) or an attribute (settings.Routes),
+        unless they are named like a method.
+
+        Every snapshot has a different version, so caches of anything
+        derived from the settings can be keyed on it.
+        """
+
+    def __init__(self, parser):
+        """ Constructor
+
+            :param parser: <configparser.ConfigParser> to resolve
+            :return: New instance
+            """
+        sections = {
+            section: SettingsSection(section, dict(parser[section]))
+            for section in parser.sections()
+        }
+
+        object.__setattr__(self, '_sections', sections)
+        object.__setattr__(self, 'version', next(_versions))
+        _add_attributes(self, sections)
+
+    def __getitem__(self, section):
+        """ Gets a section
+
+            :param section: <str> Name of section
+            :return: <SettingsSection> or raises KeyError
+            """
+        return self._sections[section]
+
+    def __getattr__(self, section):
+        """ Gets a section
+
+            :param section: <str> Name of section
+            :return: <SettingsSection> or raises AttributeError
+            """
+        if section.startswith('_'):
+            # Never a section. Keeps copy and pickle from recursing.
+            raise AttributeError(section)
+
+        try:
+            return self._sections[section]
+        except KeyError:
+            raise AttributeError(f'No section [{section}]')
+
+    def __setattr__(self, name, value):
+        """ Refuses to change a section
+
+            :raises: AttributeError
+            """
+        raise AttributeError('Settings snapshots are read-only')
+
+    def __iter__(self):
+        """ Returns an iterator over the section names
+
+            :return: Iterator
+            """
+        return iter(self._sections)
+
+    def __len__(self):
+        """ Returns the number of sections
+
+            :return: <int> Number of sections
+            """
+        return len(self._sections)
+
+    def sections(self):
+        """ Lists the sections, like ConfigParser
+
+            :return: <list> of <str> names
+            """
+        return list(self._sections)
+
 class Settings:
     """ Maintains the settings for this app """
     _instance = None
@@ -15,17 +281,18 @@ class Settings:
     @staticmethod
     def instance():
         """ Returns instance. Creates one if not already created.
-        
+
+            The instance can be changed (e.g. by tests). Read the settings
+            from snapshot() instead where speed matters.
+
             :return: Settings instance
             """
         if Settings._instance is None:
             # Load the default.ini (must be read)
             default_ini_path = pathlib.Path(__file__).parent / 'default.ini'
-            
+
             with default_ini_path.open() as default_ini:
-                Settings._instance = configparser.ConfigParser(
-                    interpolation=configparser.ExtendedInterpolation())
-                Settings._instance.optionxform = str
+                Settings._instance = _TrackedParser()
                 Settings._instance.read_file(default_ini)
 
             # Load the configuration specific .ini (optional)
@@ -33,13 +300,42 @@ class Settings:
                 config_spec_ini_path = (
                     pathlib.Path(__file__).parent /
                     os.environ['CONFIG_SPEC_INI'])
-                
+
                 Settings._instance.read(str(config_spec_ini_path))
             except KeyError:
                 pass
-                
+
         return Settings._instance
 
+    @staticmethod
+    def snapshot(settings=None):
+        """ Returns an immutable snapshot of the settings
+
+            The snapshot is reused until the settings are changed.
+
+            :param settings: ConfigParser or <SettingsSnapshot> (the
+                             instance if None)
+            :return: <SettingsSnapshot>
+            """
+        if settings is None:
+            settings = Settings.instance()
+
+        # Reused until the parser is changed
+        cached = getattr(settings, '_snapshot', None)
+        if cached is not None and cached[0] == settings.changes:
+            return cached[1]
+
+        if isinstance(settings, SettingsSnapshot):
+            return settings
+
+        snapshot = SettingsSnapshot(settings)
+
+        # Only parsers created by instance() count their changes
+        if isinstance(settings, _TrackedParser):
+            settings._snapshot = (settings.changes, snapshot)
+
+        return snapshot
+
     @staticmethod
     def destroy():
         """ Destroy the instance """
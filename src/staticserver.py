@@ -0,0 +1,437 @@
+"""
+    Defines the StaticServer class
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import collections
+import http
+import http.server
+import mimetypes
+import os
+import pathlib
+import stat
+import threading
+import time
+import urllib.parse
+import werkzeug.http
+import werkzeug.utils
+
+from .compress import ENCODINGS, is_compressible, select_encoding
+from .fingerprint import IMMUTABLE_CACHE_CONTROL, StaticFingerprints
+
+# Page sent (with a 404 status) for files that don't exist
+NOT_FOUND_PAGE = '404.html'
+
+# Metadata of a file on disk. The etag is unquoted.
+StaticFile = collections.namedtuple(
+    'StaticFile',
+    ['path', 'size', 'mtime', 'etag', 'last_modified'])
+
+# Everything needed to answer a request for a path of the build tree.
+# A directory only has is_directory set.
+StaticEntry = collections.namedtuple(
+    'StaticEntry',
+    ['file', 'variants', 'content_type', 'cache_control', 'is_directory'])
+
+_DIRECTORY = StaticEntry(None, None, None, None, True)
+
+def _stat_file(path, encoding=None):
+    """ Reads the metadata of a file
+
+        :param path: <Path> to file
+        :param encoding: <str> Content-Encoding of file (None if it isn't a
+                         compressed copy)
+        :return: <StaticFile> or None if it isn't a regular file
+        """
+    try:
+        result = os.stat(path)
+    except (OSError, ValueError):
+        return None
+
+    if not stat.S_ISREG(result.st_mode):
+        return None
+
+    etag = f'{result.st_mtime_ns:x}-{result.st_size:x}'
+    if encoding is not None:
+        etag += f'-{encoding}'
+
+    return StaticFile(
+        str(path),
+        result.st_size,
+        int(result.st_mtime),
+        etag,
+        werkzeug.http.http_date(result.st_mtime))
+
+class StaticFileCache:
+    """ Keeps the metadata of the files of a build tree in memory
+
+        Files are only looked up on disk again once their metadata is older
+        than the stat interval, so new builds are picked up without a
+        restart. Paths that don't exist aren't kept.
+        """
+
+    def __init__(self, root, static_url_path='/static',
+                 default_mimetype='application/octet-stream',
+                 stat_interval=1.0):
+        """ Constructor
+
+            :param root: <str> Path to build tree
+            :param static_url_path: <str> URL path of static files
+            :param default_mimetype: <str> Mimetype of unknown files
+            :param stat_interval: <float> Seconds before the metadata of a
+                                  file is read again
+            :return: New instance
+            """
+        self.root = pathlib.Path(root)
+        self._default_mimetype = default_mimetype
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._stat_interval = stat_interval
+        self._static_prefix = f'{static_url_path.strip("/")}/'
+        self._fingerprints = StaticFingerprints(
+            self.root / static_url_path.strip('/'))
+
+    def lookup(self, filename):
+        """ Gets the metadata of a path
+
+            :param filename: <str> Path relative to build tree
+            :return: <StaticEntry> or None if it doesn't exist
+            """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(filename)
+
+        if cached is not None and now - cached[0] < self._stat_interval:
+            return cached[1]
+
+        entry = self._load(filename)
+        with self._lock:
+            if entry is None:
+                self._entries.pop(filename, None)
+            else:
+                self._entries[filename] = (now, entry)
+
+        return entry
+
+    def forget(self, filename):
+        """ Drops the metadata of a path (e.g. after it was deleted)
+
+            :param filename: <str> Path relative to build tree
+            :return: None
+            """
+        with self._lock:
+            self._entries.pop(filename, None)
+
+    def _load(self, filename):
+        """ Reads the metadata of a path and its compressed copies
+
+            :param filename: <str> Path relative to build tree
+            :return: <StaticEntry> or None if it doesn't exist
+            """
+        path = self.root / filename
+        file = _stat_file(path)
+        if file is None:
+            return _DIRECTORY if path.is_dir() else None
+
+        variants = None
+        if is_compressible(filename):
+            variants = {}
+            for encoding, details in ENCODINGS.items():
+                variant = _stat_file(f'{path}{details.suffix}', encoding)
+                if variant is not None:
+                    variants[encoding] = variant
+
+        mimetype, _ = mimetypes.guess_type(filename)
+        content_type = werkzeug.utils.get_content_type(
+            mimetype or self._default_mimetype,
+            'utf-8')
+
+        cache_control = None
+        if (filename.startswith(self._static_prefix) and
+            self._fingerprints.original(filename[len(self._static_prefix):])):
+            cache_control = IMMUTABLE_CACHE_CONTROL
+
+        return StaticEntry(file, variants, content_type, cache_control, False)
+
+class StaticRequestHandler(http.server.BaseHTTPRequestHandler):
+    """ Answers GET and HEAD requests for the files of a StaticServer
+
+        Supports keep-alive, conditional requests (If-None-Match,
+        If-Modified-Since), single byte ranges (Range, If-Range) and the
+        compressed copies written by the build. Bodies are sent with
+        socket.sendfile, which uses os.sendfile (zero-copy) where it can.
+        """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'StaticServer'
+
+    # The headers and body are separate writes. With Nagle's algorithm the
+    # body waits for the delayed ACK of the headers (~40 ms).
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        """ Sets how long idle keep-alive connections are kept open
+
+            :return: None
+            """
+        self.timeout = self.server.keep_alive_timeout
+        super().setup()
+
+    def do_GET(self):
+        """ Sends a file
+
+            :return: None
+            """
+        self._send(head=False)
+
+    def do_HEAD(self):
+        """ Sends the headers of a file
+
+            :return: None
+            """
+        self._send(head=True)
+
+    def log_message(self, format, *args):
+        """ Logs a request unless the server is quiet
+
+            :return: None
+            """
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, head):
+        """ Answers a request
+
+            :param head: <Bool> Only send the headers
+            :return: None
+            """
+        url = urllib.parse.urlsplit(self.path)
+        filename = self._filename(urllib.parse.unquote(url.path))
+        entry = None
+        if filename is not None:
+            entry = self.server.files.lookup(filename)
+
+        if entry is not None and entry.is_directory:
+            location = f'{url.path}/'
+            if url.query:
+                location += f'?{url.query}'
+
+            self.send_response(http.HTTPStatus.MOVED_PERMANENTLY)
+            self.send_header('Location', location)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if entry is None or not self._send_entry(filename, entry, head):
+            self._send_not_found(head)
+
+    def _filename(self, path):
+        """ Converts a URL path to a path in the build tree
+
+            :param path: <str> Unquoted URL path
+            :return: <str> Relative path or None if it can't be in the tree
+            """
+        script_name = self.server.script_name
+        if not path.startswith(f'{script_name}/') or '\0' in path:
+            return None
+
+        path = path[len(script_name):]
+        if path.endswith('/'):
+            path += 'index.html'
+
+        parts = path.split('/')[1:]
+        if any(part in ('', '.', '..') for part in parts):
+            return None
+
+        return '/'.join(parts)
+
+    def _send_not_found(self, head):
+        """ Sends the 404 page of the build, or a plain error without one
+
+            :param head: <Bool> Only send the headers
+            :return: None
+            """
+        entry = self.server.files.lookup(NOT_FOUND_PAGE)
+        if (entry is None or entry.is_directory or
+            not self._send_entry(
+                NOT_FOUND_PAGE,
+                entry,
+                head,
+                http.HTTPStatus.NOT_FOUND)):
+            self.send_error(http.HTTPStatus.NOT_FOUND)
+
+    def _send_entry(self, filename, entry, head, status=http.HTTPStatus.OK):
+        """ Sends a file, or the part of it that was requested
+
+            :param filename: <str> Path relative to build tree
+            :param entry: <StaticEntry> of file
+            :param head: <Bool> Only send the headers
+            :param status: <http.HTTPStatus> of response. Conditional and
+                           range requests are only answered for OK.
+            :return: <Bool> False if the file was deleted since its metadata
+                     was read (nothing was sent)
+            """
+        encoding = None
+        if entry.variants:
+            encoding = select_encoding(
+                entry.file.path,
+                werkzeug.http.parse_accept_header(
+                    self.headers.get('Accept-Encoding')),
+                entry.variants)
+
+        file = entry.file if encoding is None else entry.variants[encoding]
+        start, stop = 0, file.size
+        content_range = None
+        if status == http.HTTPStatus.OK:
+            if self._is_not_modified(file):
+                self.send_response(http.HTTPStatus.NOT_MODIFIED)
+                self._send_headers(entry, file, encoding)
+                self.end_headers()
+                return True
+
+            byte_range = self._byte_range(file)
+            if byte_range is False:
+                self.send_response(
+                    http.HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', f'bytes */{file.size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return True
+
+            if byte_range is not None:
+                start, stop = byte_range
+                status = http.HTTPStatus.PARTIAL_CONTENT
+                content_range = f'bytes {start}-{stop - 1}/{file.size}'
+
+        try:
+            body = open(file.path, 'rb')
+        except OSError:
+            self.server.files.forget(filename)
+            return False
+
+        with body:
+            self.send_response(status)
+            self._send_headers(entry, file, encoding)
+            if content_range is not None:
+                self.send_header('Content-Range', content_range)
+
+            self.send_header('Content-Type', entry.content_type)
+            self.send_header('Content-Length', str(stop - start))
+            self.end_headers()
+
+            if not head and stop > start:
+                sent = self.connection.sendfile(body, start, stop - start)
+                if sent < stop - start:
+                    # The file shrank since its metadata was read. The client
+                    # can only tell the body was cut short by a closed
+                    # connection.
+                    self.close_connection = True
+
+        return True
+
+    def _send_headers(self, entry, file, encoding):
+        """ Sends the headers of every response for a file (including 304)
+
+            :param entry: <StaticEntry> of file
+            :param file: <StaticFile> being sent
+            :param encoding: <str> Content-Encoding or None
+            :return: None
+            """
+        self.send_header('ETag', werkzeug.http.quote_etag(file.etag))
+        self.send_header('Last-Modified', file.last_modified)
+        self.send_header('Accept-Ranges', 'bytes')
+        if entry.variants is not None:
+            self.send_header('Vary', 'Accept-Encoding')
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        if entry.cache_control is not None:
+            self.send_header('Cache-Control', entry.cache_control)
+
+    def _is_not_modified(self, file):
+        """ Evaluates If-None-Match or (without it) If-Modified-Since
+
+            :param file: <StaticFile> being sent
+            :return: <Bool> True if the client's copy is current
+            """
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            etags = werkzeug.http.parse_etags(if_none_match)
+            return etags.contains_weak(file.etag)
+
+        since = werkzeug.http.parse_date(self.headers.get('If-Modified-Since'))
+        return since is not None and file.mtime <= since.timestamp()
+
+    def _byte_range(self, file):
+        """ Evaluates Range and If-Range
+
+            Requests for several ranges are answered with the whole file.
+
+            :param file: <StaticFile> being sent
+            :return: <tuple> of start and stop offsets, None to send the
+                     whole file or False if the range can't be satisfied
+            """
+        ranges = werkzeug.http.parse_range_header(self.headers.get('Range'))
+        if (ranges is None or ranges.units != 'bytes' or
+            len(ranges.ranges) != 1 or not self._is_range_current(file)):
+            return None
+
+        byte_range = ranges.range_for_length(file.size)
+        return False if byte_range is None else byte_range
+
+    def _is_range_current(self, file):
+        """ Evaluates If-Range
+
+            :param file: <StaticFile> being sent
+            :return: <Bool> True if the range applies to this file
+            """
+        if_range = self.headers.get('If-Range')
+        if if_range is None:
+            return True
+
+        if if_range.startswith(('"', 'W/')):
+            etag, weak = werkzeug.http.unquote_etag(if_range)
+            return not weak and etag == file.etag
+
+        date = werkzeug.http.parse_date(if_range)
+        return date is not None and file.mtime == date.timestamp()
+
+class StaticServer(http.server.ThreadingHTTPServer):
+    """ Serves a build tree, with a thread for each connection
+
+        Unlike the Werkzeug development server, it keeps the metadata of the
+        files in memory and sends them without copying them through Python,
+        so it can also be used to load test the static site.
+        """
+    daemon_threads = True
+
+    def __init__(self, address, root, script_name='',
+                 static_url_path='/static',
+                 default_mimetype='application/octet-stream',
+                 stat_interval=1.0, keep_alive_timeout=15.0,
+                 request_queue_size=128, quiet=False):
+        """ Constructor. Starts listening.
+
+            :param address: <tuple> of host and port (0 for any free port)
+            :param root: <str> Path to build tree
+            :param script_name: <str> URL path the tree is served under
+            :param static_url_path: <str> URL path of static files
+            :param default_mimetype: <str> Mimetype of unknown files
+            :param stat_interval: <float> Seconds before the metadata of a
+                                  file is read again
+            :param keep_alive_timeout: <float> Seconds idle connections are
+                                       kept open
+            :param request_queue_size: <int> Connections waiting to be
+                                       accepted
+            :param quiet: <Bool> Don't log requests
+            :return: New instance
+            """
+        self.files = StaticFileCache(
+            root,
+            static_url_path,
+            default_mimetype,
+            stat_interval)
+        self.keep_alive_timeout = keep_alive_timeout
+        self.quiet = quiet
+        self.request_queue_size = request_queue_size
+        self.script_name = script_name.rstrip('/')
+        super().__init__(address, StaticRequestHandler)
@@ -4,9 +4,14 @@
     :copyright: Copyright (c) 2021 Chris Hughes
     :license: MIT License. See LICENSE.md for details
 """
+import flask
 import json
 
 from datetime import datetime
+from .cache import LruCache
+from .manifest import capture_dependencies, record_dependencies
+from .manifest import record_dependency
+from .profiling import measure
 
 # Constants
 SCHEMA_CONTEXT = 'https://schema.org'
@@ -46,6 +51,7 @@ class StructuredDataAuthor:
             :return: New instance
             """
         self._settings = settings
+        self._dict = None
 
     def __str__(self):
         """ Returns a string representation of the author in JSON
@@ -57,6 +63,17 @@ class StructuredDataAuthor:
     def as_dict(self):
         """ Returns a dict representation of the author
 
+            :return: <dict> Representation of author
+            """
+        # Settings don't change once loaded. Only look them up once.
+        if self._dict is None:
+            self._dict = self._create_dict()
+
+        return self._dict
+
+    def _create_dict(self):
+        """ Creates the dict representation of the author
+
             :return: <dict> Representation of author
             """
         return {
@@ -88,6 +105,7 @@ class StructuredDataBlogPost:
         self._post = post
         self._author = author
         self._settings = settings
+        self._dict = None
 
     def __str__(self):
         """ Creates a string representation of a blog post in JSON
@@ -99,6 +117,18 @@ class StructuredDataBlogPost:
     def as_dict(self):
         """ Returns a dict representation of a blog post
 
+            :return: <dict> Representation of blog post
+            """
+        # The article body is the full post. Only copy it once.
+        if self._dict is None:
+            self._dict = self._create_dict()
+
+        record_dependency(self._post.path)
+        return self._dict
+
+    def _create_dict(self):
+        """ Creates the dict representation of a blog post
+
             :return: <dict> Representation of blog post
             """
         return {
@@ -121,13 +151,15 @@ class StructuredDataBlog:
 
     def __init__(self,
                  postlist=None, author=None,
-                 settings=None, has_main_entity=True):
+                 settings=None, has_main_entity=True, create_post=None):
         """ Constructor
 
             :param postlist: <PostList> populated with all blog posts
             :param author: <StructuredDataAuthor> for author of blog
             :param settings: Taken from blog .ini file
             :param has_main_entity: <Bool> Indicating if there's a main post 
+            :param create_post: Function handle that creates the
+                                <StructuredDataBlogPost> of a post (optional)
             """
         if postlist is None or author is None or settings is None:
             raise ValueError
@@ -136,6 +168,7 @@ class StructuredDataBlog:
         self._author = author
         self._settings = settings
         self._has_main_entity = has_main_entity
+        self._create_post = create_post
 
     def __str__(self):
         """ Creates a string representation of object in JSON
@@ -155,7 +188,7 @@ class StructuredDataBlog:
             'blogPost': [],
             'author': self._author.as_dict(),
             'dateCreated': self._settings['Struct']['BlogDateCreated'],
-            'dateModified': list(self._postlist)[0].mod_date.strftime('%Y-%m-%d'),
+            'dateModified': next(iter(self._postlist)).mod_date.strftime('%Y-%m-%d'),
             'description': self._settings['Render']['BlogDescription'],
             'name': self._settings['Render']['BlogTitle'],
             'url': f'{self._settings["Struct"]["BaseUrl"]}/',
@@ -165,10 +198,13 @@ class StructuredDataBlog:
             if idx >= int(self._settings['Render']['RenderedPostCount']):
                 break
             
-            struct_post = StructuredDataBlogPost(
-                post=post,
-                author=self._author,
-                settings=self._settings)
+            if self._create_post is not None:
+                struct_post = self._create_post(post)
+            else:
+                struct_post = StructuredDataBlogPost(
+                    post=post,
+                    author=self._author,
+                    settings=self._settings)
 
             blog_data['blogPost'].append(struct_post.as_dict())
 
@@ -179,18 +215,42 @@ class StructuredDataBlog:
         return blog_data
         
 class StructuredDataFactory:
-    """ Holds common build settings and constructs objects """
+    """ Holds common build settings and constructs objects
 
-    def __init__(self, settings):
+        The objects created for each post, and the JSON of each page, are
+        cached until the post (or post list) they were made from changes.
+        """
+
+    def __init__(self, settings, cache_size=1024):
         """ Constructor
 
             :param settings: Application config from .ini
+            :param cache_size: <int> Maximum number of cached objects
             :return: New instance
             """
         if settings is None:
             raise ValueError
 
         self._settings = settings
+        self._author = StructuredDataAuthor(self._settings)
+        self._posts = LruCache(cache_size)
+        self._json = LruCache(cache_size)
+
+    @property
+    def hits(self):
+        """ Number of pages whose JSON was already serialized
+
+            :return: <int> Hits
+            """
+        return self._json.hits
+
+    @property
+    def misses(self):
+        """ Number of pages whose JSON had to be serialized
+
+            :return: <int> Misses
+            """
+        return self._json.misses
 
     def create_blog(self, postlist):
         """ Creates an object representing struct data for blog
@@ -200,8 +260,9 @@ class StructuredDataFactory:
             """
         return StructuredDataBlog(
             postlist=postlist,
-            author=StructuredDataAuthor(self._settings),
-            settings=self._settings)
+            author=self._author,
+            settings=self._settings,
+            create_post=self.create_post)
 
     def create_archive(self, postlist):
         """ Creates an object representing struct data for the archive page
@@ -211,16 +272,17 @@ class StructuredDataFactory:
             """
         return StructuredDataBlog(
             postlist=postlist,
-            author=StructuredDataAuthor(self._settings),
+            author=self._author,
             settings=self._settings,
-            has_main_entity=False)
+            has_main_entity=False,
+            create_post=self.create_post)
 
     def create_about(self):
         """ Creates an object representing struct data for the about page
 
             :return: <StructuredDataAuthor>
             """
-        return StructuredDataAuthor(self._settings)
+        return self._author
 
     def create_post(self, post):
         """ Creates an object representing struct data for a single post
@@ -228,7 +290,74 @@ class StructuredDataFactory:
             :param post: <Post> from the PostList
             :return: <StructuredDataBlogPost>
             """
-        return StructuredDataBlogPost(
-            post=post,
-            author=StructuredDataAuthor(self._settings),
-            settings=self._settings)
+        key = (post.url_stem, post.mod_date)
+        struct_post = self._posts.get(key)
+        if struct_post is None:
+            struct_post = StructuredDataBlogPost(
+                post=post,
+                author=self._author,
+                settings=self._settings)
+
+            self._posts.put(key, struct_post)
+
+        return struct_post
+
+    def blog_json(self, postlist):
+        """ Creates the JSON embedded in the index pages
+
+            :param post_list: <PostList> with all posts
+            :return: <Markup> HTML-safe JSON
+            """
+        return self._to_json(
+            ('blog', postlist.version),
+            lambda: self.create_blog(postlist))
+
+    def archive_json(self, postlist):
+        """ Creates the JSON embedded in the archive page
+
+            :param post_list: <PostList> with all posts
+            :return: <Markup> HTML-safe JSON
+            """
+        return self._to_json(
+            ('archive', postlist.version),
+            lambda: self.create_archive(postlist))
+
+    def about_json(self):
+        """ Creates the JSON embedded in the about page
+
+            :return: <Markup> HTML-safe JSON
+            """
+        return self._to_json(('about',), self.create_about)
+
+    def post_json(self, post):
+        """ Creates the JSON embedded in a post page
+
+            :param post: <Post> from the PostList
+            :return: <Markup> HTML-safe JSON
+            """
+        return self._to_json(
+            ('post', post.url_stem, post.mod_date),
+            lambda: self.create_post(post))
+
+    def _to_json(self, key, create_func):
+        """ Serializes struct data, reusing a cached copy when possible
+
+            Serialized the same way as the "tojson" template filter, so the
+            result can be embedded in a page as-is.
+
+            :param key: Hashable key identifying the struct data
+            :param create_func: Function handle that creates the struct data
+            :return: <Markup> HTML-safe JSON
+            """
+        cached = self._json.get(key)
+        if cached is None:
+            with capture_dependencies() as deps, measure('json-ld'):
+                serialized = flask.Markup(
+                    flask.json.htmlsafe_dumps(create_func().as_dict()))
+
+            self._json.put(key, (serialized, deps))
+        else:
+            serialized, deps = cached
+            record_dependencies(deps)
+
+        return serialized
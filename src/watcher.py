@@ -0,0 +1,101 @@
+"""
+    Defines the PostWatcher class, which reloads posts while the server runs
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import threading
+import weakref
+
+class PostWatcher:
+    """ Polls the post templates and reloads the ones that change
+
+        Runs in a daemon thread so that requests never wait for posts to be
+        parsed. The version of the PostList changes after every reload, so
+        caches keyed on it see the new posts right away.
+        """
+
+    def __init__(self, app, postlist, interval):
+        """ Constructor
+
+            :param app: Flask application
+            :param postlist: <PostList> to keep up to date
+            :param interval: <float> Seconds between polls
+            :return: New instance
+            """
+        # Only a weak reference is kept so that the thread doesn't keep an
+        # app alive after everything else is done with it.
+        self._app = weakref.ref(app)
+        self._interval = interval
+        self._postlist = postlist
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def for_app(app, postlist, settings):
+        """ Gets the watcher of an app. Creates one if not already created.
+
+            :param app: Flask application
+            :param postlist: <PostList> to keep up to date
+            :param settings: Blog settings from .ini
+            :return: <PostWatcher>
+            """
+        if 'post_watcher' not in app.extensions:
+            app.extensions['post_watcher'] = PostWatcher(
+                app,
+                postlist,
+                float(settings['Cache']['PostWatchInterval']))
+
+        return app.extensions['post_watcher']
+
+    @property
+    def is_running(self):
+        """ Determines if the watcher thread is running
+
+            :return: <Bool> True if running
+            """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """ Starts polling. Does nothing if already started.
+
+            :return: None
+            """
+        if self.is_running or self._interval <= 0:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name='PostWatcher',
+            daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stops polling and waits for the thread to finish
+
+            :return: None
+            """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        """ Polls until stopped or the app is deleted
+
+            :return: None
+            """
+        while not self._stop_event.wait(self._interval):
+            app = self._app()
+            if app is None:
+                return
+
+            # Posts whose metadata is generated by Jinja are rendered
+            with app.app_context():
+                try:
+                    self._postlist.refresh()
+                except Exception:
+                    app.logger.exception('Failed to reload posts')
+
+            del app
@@ -7,9 +7,11 @@
 import bs4
 import os
 import pathlib
+import re
 import requests
 import test.util
 import unittest
+import unittest.mock as mock
 
 from datetime import date, datetime
 from parameterized import parameterized
@@ -210,6 +212,40 @@ class TestBlog(unittest.TestCase):
         with self.blog.app.test_client() as client:
             self.assertEquals(200, client.get('/robots.txt').status_code)
 
+    def test_fingerprinted_static_files(self):
+        """ Test pages link to static files by a name with their hash
+
+            :param: None
+            :return: None
+            """
+        with self.blog.app.test_client() as client:
+            soup = bs4.BeautifulSoup(client.get('/').data, 'html.parser')
+            href = soup.find('link', rel='stylesheet', href=re.compile(
+                'stylesheet'))['href']
+            self.assertRegex(href, r'^/static/css/stylesheet\.[0-9a-f]{10}\.css$')
+
+            plain = client.get('/static/css/stylesheet.css')
+            fingerprinted = client.get(href)
+            self.assertEqual(fingerprinted.status_code, 200)
+            self.assertEqual(fingerprinted.data, plain.data)
+            self.assertIn('immutable', fingerprinted.headers['Cache-Control'])
+            self.assertEqual(
+                fingerprinted.cache_control.max_age,
+                365 * 24 * 60 * 60)
+            self.assertNotIn(
+                'immutable',
+                plain.headers.get('Cache-Control', ''))
+
+            # A stale fingerprint gets the current file, but not forever
+            stale = client.get('/static/css/stylesheet.0123456789.css')
+            self.assertEqual(stale.data, plain.data)
+            self.assertNotIn(
+                'immutable',
+                stale.headers.get('Cache-Control', ''))
+
+            for response in [plain, fingerprinted, stale]:
+                response.close()
+
     def test_meta_description(self):
         """ Test the meta description exists
 
@@ -371,3 +407,161 @@ class TestBlog(unittest.TestCase):
                 200)
             
                     
+
+    def test_conditional_requests(self):
+        """ Test pages can be revalidated with ETag and Last-Modified """
+        latest_post_url = test.util.get_latest_url()
+
+        with self.blog.app.test_client() as client:
+            for route in ['/', latest_post_url,
+                          f'/{self.config["Routes"]["Sitemap"]}']:
+                response = client.get(route)
+                self.assertEqual(response.status_code, 200)
+                self.assertIsNotNone(response.headers.get('ETag'))
+                self.assertIsNotNone(response.headers.get('Last-Modified'))
+
+                etag = response.headers['ETag']
+                last_modified = response.headers['Last-Modified']
+
+                response = client.get(
+                    route,
+                    headers={'If-None-Match': etag})
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.data, b'')
+
+                response = client.get(
+                    route,
+                    headers={'If-Modified-Since': last_modified})
+                self.assertEqual(response.status_code, 304)
+
+    def test_page_cache(self):
+        """ Test repeated requests are served without rendering again """
+        with self.blog.app.test_client() as client:
+            expected = client.get('/').data
+
+            with mock.patch.object(
+                    self.blog.renderer,
+                    'render_latest',
+                    side_effect=AssertionError):
+                self.assertEqual(client.get('/').data, expected)
+
+                # Query strings and other hosts use the same entry
+                self.assertEqual(client.get('/?x=1').data, expected)
+                self.assertEqual(
+                    client.get('/', base_url='http://other').data,
+                    expected)
+
+    def test_page_cache_template_edits(self):
+        """ Test templates are only checked for edits once the template
+            watch interval has passed
+            """
+        blog = Blog(self.config)
+        blog.app.config['TEMPLATES_AUTO_RELOAD'] = True
+        blog._template_watch_interval = 3600
+
+        with mock.patch('src.blog.PostWatcher'), \
+                blog.app.test_client() as client:
+            expected = client.get('/').data
+
+            with mock.patch('os.walk', side_effect=AssertionError):
+                self.assertEqual(client.get('/').data, expected)
+
+            # Once the interval has passed, the templates are checked again
+            blog._template_watch_interval = 0
+            with mock.patch('os.walk', return_value=[]) as walk:
+                self.assertEqual(client.get('/').data, expected)
+            walk.assert_called()
+
+    def test_flask_config(self):
+        """ Test the [Flask] section is passed on to Flask """
+        self.assertIs(self.blog.app.testing, True)
+        self.assertEqual(self.blog.app.config['APPLICATION_ROOT'], '/')
+
+        self.config['Flask']['TESTING'] = 'False'
+        try:
+            blog = Blog(self.config)
+        finally:
+            self.config['Flask']['TESTING'] = 'True'
+
+        self.assertIs(blog.app.testing, False)
+
+    def test_metrics(self):
+        """ Test requests are timed when metrics are enabled """
+        with self.blog.app.test_client() as client:
+            response = client.get('/')
+            self.assertNotIn('Server-Timing', response.headers)
+            self.assertEqual(client.get('/metrics').status_code, 404)
+
+        self.config['Metrics']['Enabled'] = 'True'
+        try:
+            blog = Blog(self.config)
+        finally:
+            self.config['Metrics']['Enabled'] = 'False'
+
+        with blog.app.test_client() as client:
+            response = client.get('/')
+            timing = response.headers['Server-Timing']
+            self.assertRegex(timing, r'^total;dur=[0-9.]+')
+            self.assertIn('template;dur=', timing)
+
+            # Served from the page cache
+            client.get('/')
+            client.get('/archive/')
+
+            response = client.get('/metrics')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'text/plain')
+            self.assertNotIn('Server-Timing', response.headers)
+            metrics = response.get_data(as_text=True)
+
+        self.assertIn(
+            'blog_request_duration_seconds_count{endpoint="index"} 2',
+            metrics)
+        self.assertIn(
+            'blog_request_duration_seconds_bucket'
+            '{endpoint="index",le="+Inf"} 2',
+            metrics)
+        self.assertIn(
+            'blog_response_size_bytes_count{endpoint="archive"} 1',
+            metrics)
+        self.assertIn(
+            'blog_operation_duration_seconds_count'
+            '{endpoint="index",operation="template"} 1',
+            metrics)
+        self.assertIn('blog_cache_hits_total{cache="page"} 1', metrics)
+        self.assertIn('blog_cache_misses_total{cache="struct_data"}', metrics)
+        self.assertNotIn('endpoint="metrics"', metrics)
+
+    def test_search(self):
+        """ Test the search route and the index served to browsers """
+        with self.blog.app.test_client() as client:
+            response = client.get('/search', query_string={'q': 'yield'})
+            self.assertEqual(response.status_code, 200)
+            results = response.get_json()['results']
+            self.assertTrue(results)
+            self.assertTrue(all(
+                client.get(result['url']).status_code == 200
+                for result in results))
+
+            # The last term matches words it starts
+            response = client.get('/search', query_string={'q': 'yiel'})
+            self.assertEqual(response.get_json()['results'], results)
+
+            response = client.get('/search', query_string={'q': 'zzzzzz'})
+            self.assertEqual(response.get_json()['results'], [])
+
+            manifest = client.get('/search/index.json').get_json()
+            self.assertEqual(len(manifest['documents']), len(os.listdir(
+                pathlib.Path(self.blog.app.root_path) /
+                self.blog.app.template_folder /
+                'post')))
+
+            shard = client.get('/search/terms/yi.json').get_json()
+            self.assertIn('yield', shard)
+            self.assertEqual(
+                {manifest['documents'][doc]['url']
+                 for doc, _ in shard['yield']},
+                {result['url'] for result in results})
+
+            response = client.get('/search/terms/zz.json')
+            self.assertEqual(response.status_code, 404)
@@ -0,0 +1,540 @@
+"""
+    Defines unit tests for the Builder class
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import filecmp
+import bs4
+import gzip
+import json
+import pathlib
+import shutil
+import tempfile
+import test.util
+import unittest
+import unittest.mock as mock
+import warnings
+
+from src.blog import Blog
+from src.builder import Builder
+from src.compress import Precompressor
+from src.critical import CriticalCss
+from src.highlight import HighlightCache
+from src.manifest import BuildManifest
+from src.setting import Settings
+
+SRC_DIR = pathlib.Path(__file__).parent.parent / 'src'
+
+class TestBuilder(unittest.TestCase):
+    """ Defines unit tests for the Builder class """
+
+    def setUp(self):
+        """ Create a blog that builds into a temporary directory
+
+            :param: None
+            :return: None
+            """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.build_dir = pathlib.Path(self.tmp_dir.name) / 'build'
+
+        self.blog = test.util.create_blog()
+        self.blog.app.config['FREEZER_DESTINATION'] = str(self.build_dir)
+
+    def tearDown(self):
+        """ Clean up after each test """
+        self.tmp_dir.cleanup()
+        Settings.destroy()
+
+    def assert_same_tree(self, expected_dir, actual_dir):
+        """ Verifies two build directories contain identical files
+
+            :param expected_dir: <Path> to expected build
+            :param actual_dir: <Path> to actual build
+            :return: None
+            """
+        expected = sorted(
+            path.relative_to(expected_dir)
+            for path in expected_dir.rglob('*') if path.is_file())
+        actual = sorted(
+            path.relative_to(actual_dir)
+            for path in actual_dir.rglob('*') if path.is_file())
+
+        self.assertEqual(expected, actual)
+        for path in expected:
+            self.assertTrue(
+                filecmp.cmp(expected_dir / path, actual_dir / path, False),
+                msg=f'{path} differs')
+
+    def test_build(self):
+        """ Test the static site contains each page type
+
+            :return: None
+            """
+        result = test.util.build_static(self.blog.app)
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+
+        for page in ['index.html', '404.html', 'archive/index.html',
+                     'about/index.html', 'feed.xml', 'sitemap.xml',
+                     'search/index.json']:
+            self.assertTrue((self.build_dir / page).is_file(), msg=page)
+
+        # Each shard of the search index is built, but not the search route
+        search_dir = self.build_dir / 'search'
+        manifest = json.loads((search_dir / 'index.json').read_text())
+        self.assertEqual(
+            sorted(path.stem for path in search_dir.glob('terms/*.json')),
+            manifest['shards'])
+        self.assertFalse((search_dir / 'index.html').exists())
+
+    def test_dynamic_routes_not_built(self):
+        """ Test routes that only exist on a running server aren't built
+
+            :return: None
+            """
+        config = test.util.load_test_config()
+        config['Metrics']['Enabled'] = 'True'
+        blog = Blog(config)
+        blog.app.config['FREEZER_DESTINATION'] = str(self.build_dir)
+
+        filters = list(warnings.filters)
+        result = test.util.build_static(blog.app)
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        self.assertTrue((self.build_dir / 'index.html').is_file())
+        self.assertFalse((self.build_dir / 'metrics').exists())
+
+        # The warnings about them are hidden during the build only
+        self.assertEqual(warnings.filters, filters)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            result = test.util.build_static(blog.app)
+
+        self.assertFalse([
+            warning for warning in caught
+            if 'metrics' in str(warning.message)])
+
+    def test_incremental_build_reuses_pages(self):
+        """ Test an incremental build with no changes renders nothing
+
+            :return: None
+            """
+        result = test.util.build_static(self.blog.app)
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+
+        full_build = pathlib.Path(self.tmp_dir.name) / 'full'
+        shutil.copytree(self.build_dir, full_build)
+
+        with mock.patch.object(BuildManifest, 'record') as record:
+            result = test.util.build_static(self.blog.app, '--incremental')
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            record.assert_not_called()
+
+        self.assert_same_tree(full_build, self.build_dir)
+
+    def create_copied_blog(self):
+        """ Creates a blog whose static files can be edited by a test
+
+            The static files are copied into a temporary app root. The
+            templates are linked.
+
+            :return: <Path> to static folder of the copy
+            """
+        root = pathlib.Path(self.tmp_dir.name) / 'app'
+        shutil.copytree(SRC_DIR / 'static', root / 'static')
+        (root / 'templates').symlink_to(
+            SRC_DIR / 'templates',
+            target_is_directory=True)
+
+        return root / 'static'
+
+    def build_copied_blog(self, *args):
+        """ Builds the copied blog, as a new process of the CLI would
+
+            :param args: Arguments of the build command
+            :return: Result of build command
+            """
+        blog = Blog(test.util.load_test_config(), str(
+            pathlib.Path(self.tmp_dir.name) / 'app'))
+        blog.app.config['FREEZER_DESTINATION'] = str(self.build_dir)
+        return test.util.build_static(blog.app, *args)
+
+    def assert_links_exist(self):
+        """ Verifies every stylesheet and script of the built pages exists
+
+            :return: None
+            """
+        for page in self.build_dir.rglob('*.html'):
+            soup = bs4.BeautifulSoup(page.read_text(), 'html.parser')
+            links = [
+                tag.get('href') or tag.get('src')
+                for tag in soup.find_all(['link', 'script'])
+                if (tag.get('href') or tag.get('src') or '').startswith(
+                    '/static/')
+            ]
+
+            self.assertTrue(links, msg=page)
+            for link in links:
+                self.assertTrue(
+                    (self.build_dir / link.lstrip('/')).is_file(),
+                    msg=f'{page} links to missing {link}')
+
+    def test_incremental_build_static_file_edited(self):
+        """ Test pages linking to an edited static file are rebuilt
+
+            :return: None
+            """
+        static_dir = self.create_copied_blog()
+        result = self.build_copied_blog()
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+
+        stylesheet = static_dir / 'css' / 'stylesheet.css'
+        with stylesheet.open('a') as css:
+            css.write('\n.incremental-test { color: red; }\n')
+
+        result = self.build_copied_blog('--incremental')
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        self.assert_links_exist()
+
+    def test_incremental_build_critical_css(self):
+        """ Test the critical CSS of kept pages is inlined again when a
+            stylesheet is edited
+
+            :return: None
+            """
+        static_dir = self.create_copied_blog()
+
+        # Even if the link to the stylesheet isn't recorded when the page
+        # is rendered (e.g. it isn't made by url_for)
+        with mock.patch('src.fingerprint.record_dependency'):
+            result = self.build_copied_blog('--critical-css')
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+
+            stylesheet = static_dir / 'css' / 'stylesheet.css'
+            with stylesheet.open('a') as css:
+                css.write('\nbody { --incremental-test: 1; }\n')
+
+            result = self.build_copied_blog('--incremental', '--critical-css')
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+
+        self.assert_links_exist()
+        for page in self.build_dir.rglob('*.html'):
+            soup = bs4.BeautifulSoup(page.read_text(), 'html.parser')
+            critical_css = ''.join(
+                style.string or '' for style in soup.head.find_all(
+                    'style',
+                    attrs={'data-critical': True}))
+            self.assertIn('--incremental-test', critical_css, msg=page)
+
+    def test_parallel_build_matches(self):
+        """ Test a build with several processes writes the same files
+
+            :return: None
+            """
+        result = test.util.build_static(self.blog.app)
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+
+        serial_build = pathlib.Path(self.tmp_dir.name) / 'serial'
+        shutil.copytree(self.build_dir, serial_build)
+
+        result = test.util.build_static(self.blog.app, '--jobs', '3')
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+
+        self.assert_same_tree(serial_build, self.build_dir)
+
+    def test_parallel_build_custom_blog(self):
+        """ Test build processes render with the settings and root of the
+            blog rather than the defaults
+
+            :return: None
+            """
+        self.create_copied_blog()
+        config = test.util.load_test_config()
+        config['Render']['BlogTitle'] = 'Parallel build test'
+        settings = Settings.snapshot(config)
+        Settings.destroy()
+
+        blog = Blog(settings, str(pathlib.Path(self.tmp_dir.name) / 'app'))
+        blog.app.config['FREEZER_DESTINATION'] = str(self.build_dir)
+
+        result = test.util.build_static(blog.app)
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        self.assertIn(
+            'Parallel build test',
+            (self.build_dir / 'about' / 'index.html').read_text())
+
+        serial_build = pathlib.Path(self.tmp_dir.name) / 'serial'
+        shutil.copytree(self.build_dir, serial_build)
+
+        result = test.util.build_static(blog.app, '--jobs', '2')
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+
+        self.assert_same_tree(serial_build, self.build_dir)
+
+    def test_precompressed(self):
+        """ Test compressed copies are written and served to clients
+
+            :return: None
+            """
+        result = test.util.build_static(self.blog.app)
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+
+        for page in ['index.html', 'feed.xml', 'static/css/stylesheet.css']:
+            original = (self.build_dir / page).read_bytes()
+            compressed = self.build_dir / f'{page}.gz'
+            self.assertEqual(gzip.decompress(compressed.read_bytes()), original)
+
+        # Only text files are compressed
+        self.assertEqual(list(self.build_dir.rglob('*.png.gz')), [])
+
+        app = Builder(self.blog.app).make_static_app()
+        with app.test_client() as client:
+            response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(response.content_encoding, 'gzip')
+            self.assertIn('Accept-Encoding', response.vary)
+            self.assertEqual(
+                gzip.decompress(response.data),
+                (self.build_dir / 'index.html').read_bytes())
+            response.close()
+
+            response = client.get('/', headers={'Accept-Encoding': 'gzip;q=0'})
+            self.assertIsNone(response.content_encoding)
+            self.assertEqual(
+                response.data,
+                (self.build_dir / 'index.html').read_bytes())
+            response.close()
+
+    def test_fingerprinted_static_files(self):
+        """ Test fingerprinted and plain static files are built and served
+
+            :return: None
+            """
+        result = test.util.build_static(self.blog.app)
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+
+        css_dir = self.build_dir / 'static' / 'css'
+        fingerprinted = list(css_dir.glob('stylesheet.*.css'))
+        self.assertEqual(len(fingerprinted), 1)
+        self.assertEqual(
+            fingerprinted[0].read_bytes(),
+            (css_dir / 'stylesheet.css').read_bytes())
+
+        app = Builder(self.blog.app).make_static_app()
+        with app.test_client() as client:
+            response = client.get(
+                f'/static/css/{fingerprinted[0].name}',
+                headers={'Accept-Encoding': 'gzip'})
+            self.assertIn('immutable', response.headers['Cache-Control'])
+            self.assertEqual(response.content_encoding, 'gzip')
+            response.close()
+
+            response = client.get('/static/css/stylesheet.css')
+            self.assertNotIn(
+                'immutable',
+                response.headers.get('Cache-Control', ''))
+            response.close()
+
+    def test_minify(self):
+        """ Test minified pages keep their code blocks and report savings
+
+            :return: None
+            """
+        result = test.util.build_static(self.blog.app)
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+
+        plain_build = pathlib.Path(self.tmp_dir.name) / 'plain'
+        shutil.copytree(self.build_dir, plain_build)
+
+        result = test.util.build_static(self.blog.app, '--minify')
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        self.assertIn('total', result.output)
+
+        for page in plain_build.rglob('*.html'):
+            minified = self.build_dir / page.relative_to(plain_build)
+            self.assertLessEqual(
+                minified.stat().st_size,
+                page.stat().st_size)
+
+            expected = bs4.BeautifulSoup(page.read_text(), 'html.parser')
+            actual = bs4.BeautifulSoup(minified.read_text(), 'html.parser')
+            self.assertEqual(
+                [str(pre) for pre in expected.find_all('pre')],
+                [str(pre) for pre in actual.find_all('pre')])
+
+        # Compressed copies are made from the minified files
+        self.assertEqual(
+            gzip.decompress(
+                (self.build_dir / 'index.html.gz').read_bytes()),
+            (self.build_dir / 'index.html').read_bytes())
+
+    def test_critical_css(self):
+        """ Test pages inline their critical CSS and defer stylesheets
+
+            :return: None
+            """
+        result = test.util.build_static(self.blog.app, '--critical-css')
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        self.assertIn('critical CSS', result.output)
+
+        page = self.build_dir / 'index.html'
+        soup = bs4.BeautifulSoup(page.read_text(), 'html.parser')
+        styles = soup.head.find_all('style', attrs={'data-critical': True})
+        self.assertTrue(styles)
+
+        # Every stylesheet is loaded without blocking, and without JS
+        links = soup.head.find_all('link', rel='stylesheet')
+        deferred = [link for link in links if link.find_parent('noscript')]
+        self.assertTrue(deferred)
+        for link in links:
+            if not link.find_parent('noscript'):
+                self.assertEqual(link['media'], 'print')
+                self.assertIn('this.media', link['onload'])
+
+        # Only part of the stylesheet is inlined
+        stylesheet = next(
+            link['href'] for link in deferred
+            if link['href'].startswith('/static/css/stylesheet'))
+        full_css = (self.build_dir / stylesheet.lstrip('/')).read_text()
+        critical_css = ''.join(style.string for style in styles)
+        self.assertLess(len(critical_css), len(full_css))
+        self.assertIn('--title-color', critical_css)
+
+        # Compressed copies are made from the changed pages
+        self.assertEqual(
+            gzip.decompress(
+                (self.build_dir / 'index.html.gz').read_bytes()),
+            page.read_bytes())
+
+        # Processed pages are left alone
+        critical = CriticalCss(self.build_dir, 60)
+        self.assertEqual(critical.inline_tree(), (0, 0))
+
+    def test_profile(self):
+        """ Test the build reports the time of each phase and page
+
+            :return: None
+            """
+        # Skip the highlight cache so code is highlighted again
+        with mock.patch.object(HighlightCache, '_read', return_value=None):
+            result = test.util.build_static(
+                self.blog.app,
+                '--profile',
+                '--profile-top',
+                '3')
+
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        self.assertIn('slowest pages', result.output)
+
+        reports = [
+            pathlib.Path(line[len('Wrote '):])
+            for line in result.output.splitlines()
+            if line.startswith('Wrote ')
+        ]
+        self.assertEqual([path.suffix for path in reports], ['.json', '.html'])
+
+        profile = json.loads(reports[0].read_text())
+        for phase in ['manifest', 'images', 'freeze', 'compress']:
+            self.assertIn(phase, profile['phases'])
+
+        self.assertGreater(profile['operations']['template']['count'], 0)
+        self.assertGreater(
+            profile['operations']['pygments.highlight']['count'],
+            0)
+
+        # Pages are listed slowest first
+        times = [page['seconds'] for page in profile['pages']]
+        self.assertEqual(times, sorted(times, reverse=True))
+
+        urls = {page['url'] for page in profile['pages']}
+        self.assertIn('/', urls)
+        self.assertIn('/archive/', urls)
+        self.assertIn('/post/', reports[1].read_text())
+
+        # Build processes send their timings back to the parent
+        result = test.util.build_static(
+            self.blog.app,
+            '--profile',
+            '--jobs',
+            '2')
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+
+        profile = json.loads(reports[0].read_text())
+        self.assertEqual({page['url'] for page in profile['pages']}, urls)
+        self.assertGreater(profile['operations']['template']['count'], 0)
+
+    def test_precompressor_removes_stale_copies(self):
+        """ Test compressed copies of removed or small files are deleted
+
+            :return: None
+            """
+        self.build_dir.mkdir()
+        large = self.build_dir / 'large.html'
+        large.write_text('x' * 1000)
+        small = self.build_dir / 'small.html'
+        small.write_text('x' * 1000)
+
+        precompressor = Precompressor(
+            100,
+            ['gzip'],
+            record_path=pathlib.Path(self.tmp_dir.name) / 'copies.json')
+        self.assertEqual(precompressor.compress_tree(self.build_dir), 2)
+        self.assertEqual(precompressor.compress_tree(self.build_dir), 0)
+
+        small.write_text('x')
+        large.unlink()
+        precompressor.compress_tree(self.build_dir)
+        self.assertEqual(
+            sorted(path.name for path in self.build_dir.iterdir()),
+            ['small.html'])
+
+    def test_precompressor_without_record(self):
+        """ Test only copies of existing files are deleted when the copies
+            aren't recorded
+
+            :return: None
+            """
+        self.build_dir.mkdir()
+        large = self.build_dir / 'large.html'
+        large.write_text('x' * 1000)
+        small = self.build_dir / 'small.html'
+        small.write_text('x' * 1000)
+
+        precompressor = Precompressor(100, ['gzip'])
+        self.assertEqual(precompressor.compress_tree(self.build_dir), 2)
+
+        small.write_text('x')
+        large.unlink()
+        precompressor.compress_tree(self.build_dir)
+        self.assertEqual(
+            sorted(path.name for path in self.build_dir.iterdir()),
+            ['large.html.gz', 'small.html'])
+
+    def test_precompressor_keeps_compressed_assets(self):
+        """ Test compressed files that aren't copies of a page are kept
+
+            :return: None
+            """
+        downloads = self.build_dir / 'static' / 'downloads'
+        downloads.mkdir(parents=True)
+        archive = downloads / 'source.tar.gz'
+        archive.write_bytes(gzip.compress(b'x' * 1000))
+        font = downloads / 'font.woff2.br'
+        font.write_bytes(b'x' * 1000)
+        data = downloads / 'data.json.gz'
+        data.write_bytes(gzip.compress(b'{}' * 1000))
+        image = downloads / 'logo.svg.gz'
+        image.write_bytes(gzip.compress(b'<svg/>' * 1000))
+        assets = ['data.json.gz', 'font.woff2.br', 'logo.svg.gz',
+                  'source.tar.gz']
+
+        record_path = pathlib.Path(self.tmp_dir.name) / 'copies.json'
+        for precompressor in [
+                Precompressor(100, ['gzip']),
+                Precompressor(100, ['gzip'], record_path=record_path)]:
+            # Every build, not only the first
+            for _ in range(2):
+                self.assertEqual(
+                    precompressor.compress_tree(self.build_dir),
+                    0)
+                self.assertEqual(
+                    sorted(path.name for path in downloads.iterdir()),
+                    assets)
@@ -0,0 +1,115 @@
+"""
+    Defines unit tests for the TemplateBytecodeCache class
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import jinja2
+import pathlib
+import src.cli
+import tempfile
+import test.util
+import unittest
+import unittest.mock as mock
+
+from src.bytecode import TemplateBytecodeCache
+from src.setting import Settings
+
+class TestTemplateBytecodeCache(unittest.TestCase):
+    """ Defines unit tests for the TemplateBytecodeCache class """
+
+    def setUp(self):
+        """ Create a directory of templates and a cache
+
+            :return: None
+            """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        root = pathlib.Path(self.tmp_dir.name)
+
+        self.template_dir = root / 'templates'
+        self.template_dir.mkdir()
+        (self.template_dir / 'base.html').write_text(
+            '<p>{% block body %}{% endblock %}</p>')
+        (self.template_dir / 'page.html').write_text(
+            '{% extends "base.html" %}{% block body %}{{ x }}{% endblock %}')
+
+        self.cache_dir = root / 'cache'
+        self.cache = TemplateBytecodeCache(self.cache_dir)
+
+    def tearDown(self):
+        """ Clean up after each test """
+        self.tmp_dir.cleanup()
+        Settings.destroy()
+
+    def create_environment(self):
+        """ Creates a Jinja environment, as a new process would
+
+            :return: <jinja2.Environment>
+            """
+        return jinja2.Environment(
+            loader=jinja2.FileSystemLoader(str(self.template_dir)),
+            bytecode_cache=self.cache)
+
+    def test_reuses_compiled_templates(self):
+        """ Test templates are only compiled again when edited
+
+            :return: None
+            """
+        render = self.create_environment().get_template('page.html').render
+        self.assertEqual(render(x=1), '<p>1</p>')
+        self.assertEqual(len(list(self.cache_dir.iterdir())), 2)
+
+        with mock.patch.object(
+                jinja2.Environment,
+                'compile',
+                side_effect=AssertionError):
+            template = self.create_environment().get_template('page.html')
+            self.assertEqual(template.render(x=2), '<p>2</p>')
+
+        # Edited templates are compiled again
+        (self.template_dir / 'page.html').write_text('{{ x }}!')
+        template = self.create_environment().get_template('page.html')
+        self.assertEqual(template.render(x=3), '3!')
+
+    def test_damaged_entries(self):
+        """ Test unreadable entries are compiled again
+
+            :return: None
+            """
+        self.create_environment().get_template('page.html')
+        for path in self.cache_dir.iterdir():
+            path.write_bytes(path.read_bytes()[:20])
+
+        template = self.create_environment().get_template('page.html')
+        self.assertEqual(template.render(x=1), '<p>1</p>')
+
+        # Damaged entries were replaced
+        with mock.patch.object(
+                jinja2.Environment,
+                'compile',
+                side_effect=AssertionError):
+            template = self.create_environment().get_template('page.html')
+            self.assertEqual(template.render(x=1), '<p>1</p>')
+
+        self.assertEqual(list(self.cache_dir.glob('*.tmp')), [])
+
+    def test_precompile(self):
+        """ Test every template of the blog is compiled by the CLI
+
+            :return: None
+            """
+        blog = test.util.create_blog()
+        environment = blog.app.jinja_env
+
+        with mock.patch.object(
+                environment.bytecode_cache,
+                'directory',
+                str(self.cache_dir)):
+            runner = blog.app.test_cli_runner()
+            result = runner.invoke(src.cli.precompile)
+
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        self.assertEqual(
+            len(list(self.cache_dir.glob('*.cache'))),
+            len(environment.list_templates()))
+        self.assertIn(str(self.cache_dir), result.output)
@@ -0,0 +1,103 @@
+"""
+    Defines unit tests for the CriticalCss class
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import pathlib
+import tempfile
+import unittest
+
+from src.critical import CriticalCss
+
+class TestCriticalCss(unittest.TestCase):
+    """ Defines unit tests for the CriticalCss class """
+
+    def setUp(self):
+        """ Create a build with a stylesheet
+
+            :return: None
+            """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp_dir.name)
+        (self.root / 'site.css').write_text("""
+            @import url("print.css") print;
+            :root { --color: red; }
+            h1 { color: var(--color); }
+            a:hover { color: blue; }
+            .footer p, .missing { margin: 0; }
+            .highlight .k { font-weight: bold; }
+            @media (max-width: 40em) {
+                h1 { font-size: 1em; }
+                .footer { display: none; }
+            }
+            @font-face { font-family: "A"; src: url("a.woff2"); }
+        """)
+
+    def tearDown(self):
+        """ Clean up after each test """
+        self.tmp_dir.cleanup()
+
+    def create_page(self, body):
+        """ Creates a page that links to the stylesheet and a web font
+
+            :param body: <str> HTML of body
+            :return: <str> HTML of page
+            """
+        return (
+            '<!DOCTYPE html><html><head><title>Test</title>'
+            '<link href="https://fonts.example.com/css" rel="stylesheet">'
+            "<link href='/site.css' rel='stylesheet' media='screen'/>"
+            f'</head><body>{body}</body></html>')
+
+    def test_inline(self):
+        """ Test only rules used above the fold are inlined """
+        critical = CriticalCss(self.root, 3)
+        page = self.create_page(
+            '<h1>Title</h1><a href="/">Home</a><p>Text</p>'
+            '<div class="footer"><p>Footer</p></div>')
+        html, inlined = critical.inline(page)
+
+        style_start = html.index('<style data-critical media="screen">')
+        style = html[style_start:html.index('</style>', style_start)]
+        self.assertEqual(inlined, len(style) + len('</style>'))
+        self.assertIn('@import url("print.css") print;', style)
+        self.assertIn(':root{--color:red}', style)
+        self.assertIn('h1{color:var(--color)}', style)
+        self.assertIn('a:hover{color:blue}', style)
+        self.assertIn('@media (max-width:40em){h1{font-size:1em}}', style)
+        self.assertIn('@font-face', style)
+        self.assertNotIn('.footer', style)
+        self.assertNotIn('.highlight', style)
+
+        # The critical CSS comes before the first stylesheet
+        self.assertLess(
+            style_start,
+            html.index('href="https://fonts.example.com/css"'))
+
+    def test_defer(self):
+        """ Test stylesheets load without blocking and without JS """
+        critical = CriticalCss(self.root, 3)
+        html, _ = critical.inline(self.create_page('<h1>Title</h1>'))
+
+        self.assertIn(
+            '<link href="https://fonts.example.com/css" rel="stylesheet" '
+            'media="print" onload="this.media=&#39;all&#39;">'
+            '<noscript><link href="https://fonts.example.com/css" '
+            'rel="stylesheet"></noscript>',
+            html)
+        self.assertIn(
+            "<link href='/site.css' rel='stylesheet' "
+            'media="print" onload="this.media=&#39;screen&#39;">'
+            "<noscript><link href='/site.css' rel='stylesheet' "
+            "media='screen'/></noscript>",
+            html)
+
+        # Pages are only processed once
+        self.assertIsNone(critical.inline(html))
+
+    def test_no_stylesheets(self):
+        """ Test pages without stylesheets are left alone """
+        critical = CriticalCss(self.root, 3)
+        self.assertIsNone(critical.inline(
+            '<html><head><title>Test</title></head><body></body></html>'))
@@ -0,0 +1,100 @@
+"""
+    Defines unit tests for the minify functions
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import json
+import unittest
+
+from src.minify import MinifyReport, minify_css, minify_html, minify_xml
+
+class TestMinify(unittest.TestCase):
+    """ Defines unit tests for the minify functions """
+
+    def test_minify_html(self):
+        """ Test whitespace and comments are removed outside of <pre> """
+        code = '<pre><span>def f():\n    return  1\n</span></pre>'
+        html = f"""
+            <!DOCTYPE html>
+            <!--
+            A comment
+            -->
+            <div   class='a  b'
+                 id="x" >
+              Some    text
+              {code}
+              <code>a  =  b</code>
+            </div>
+        """
+        minified = minify_html(html)
+
+        self.assertIn(code, minified)
+        self.assertIn('<code>a  =  b</code>', minified)
+        self.assertIn('<div class=\'a  b\' id="x">', minified)
+        self.assertIn('Some text', minified)
+        self.assertNotIn('comment', minified)
+        self.assertEqual(minify_html(minified), minified)
+
+    def test_minify_json_ld(self):
+        """ Test JSON-LD is minified and stays safe to embed """
+        data = {'name': "Chris's <blog>", 'list': [1, 2]}
+        html = (
+            '<script type="application/ld+json">\n' +
+            json.dumps(data, indent=4).replace("'", '\\u0027')
+                                      .replace('<', '\\u003c')
+                                      .replace('>', '\\u003e') +
+            '\n</script>\n'
+            '<script>\n  var x  =  1;\n</script>')
+        minified = minify_html(html)
+
+        self.assertIn(
+            '<script type="application/ld+json">'
+            '{"name":"Chris\\u0027s \\u003cblog\\u003e","list":[1,2]}'
+            '</script>',
+            minified)
+        self.assertIn('<script>\n  var x  =  1;\n</script>', minified)
+
+    def test_minify_css(self):
+        """ Test CSS comments and whitespace are removed """
+        css = """
+            /* Comment */
+            a > b,  c:hover {
+                content: "  /* not a comment */  ";
+                margin: 0 1em;
+            }
+            @media (max-width: 600px) { a { color: red; } }
+        """
+        self.assertEqual(
+            minify_css(css),
+            'a>b,c:hover{content:"  /* not a comment */  ";margin:0 1em}'
+            '@media (max-width:600px){a{color:red}}')
+
+    def test_minify_xml(self):
+        """ Test whitespace between XML elements is removed """
+        xml = """<?xml version="1.0"?>
+            <rss>
+              <!-- Comment -->
+              <title>A  &amp;  B</title>
+              <description><![CDATA[ <pre>  x  </pre> ]]></description>
+              <xsl:text> </xsl:text>
+            </rss>
+        """
+        self.assertEqual(
+            minify_xml(xml),
+            '<?xml version="1.0"?><rss><title>A  &amp;  B</title>'
+            '<description><![CDATA[ <pre>  x  </pre> ]]></description>'
+            '<xsl:text> </xsl:text></rss>')
+
+    def test_report(self):
+        """ Test bytes saved are totaled per type """
+        report = MinifyReport()
+        report.add('html', 100, 60)
+        report.add('html', 50, 40)
+        report.add('css', 10, 5)
+
+        self.assertEqual(report.saved('html'), 50)
+        self.assertEqual(report.saved('xml'), 0)
+        self.assertEqual(report.saved(), 55)
+        self.assertIn('html', report.format())
+        self.assertIn('total', report.format())
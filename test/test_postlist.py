@@ -5,13 +5,21 @@
     :license: MIT License. See LICENSE.md for details
 """
 import concurrent.futures
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
 import test.util
 import time
 import unittest
 import unittest.mock as mock
 
-from src.postlist import PostList
+from src.metadata import MetadataParser
+from src.postindex import PostIndex
+from src.postlist import Post, PostList
 from src.setting import Settings
+from src.watcher import PostWatcher
 
 class TestPostList(unittest.TestCase):
     """ Defines unit tests for the PostList class """
@@ -62,3 +70,255 @@ class TestPostList(unittest.TestCase):
                 self.assertNotIn('\n', post.title)
                 self.assertNotEqual(' ', post.title[0])
                 self.assertNotIn(r'&#39', post.title)
+
+    def test_load_from_index(self):
+        """ Test that unchanged posts are loaded from the on-disk index """
+        blog = test.util.create_blog()
+
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+             blog.app.test_request_context():
+            index_path = pathlib.Path(tmp_dir) / 'post-index.json'
+
+            postlist = PostList(Settings.instance(), blog.app.root_path)
+            postlist._index = PostIndex(index_path, blog.app.root_path)
+            expected = [(post.title, post.date, post.description)
+                        for post in postlist]
+
+            self.assertTrue(index_path.exists())
+
+            # A new list must not need to render any post to find metadata
+            postlist = PostList(Settings.instance(), blog.app.root_path)
+            postlist._index = PostIndex(index_path, blog.app.root_path)
+
+            with mock.patch.object(
+                    Post,
+                    '_parse_metadata',
+                    side_effect=AssertionError):
+                actual = [(post.title, post.date, post.description)
+                          for post in postlist]
+
+            self.assertEqual(expected, actual)
+
+    def test_shared_by_app(self):
+        """ Test that one PostList is shared by everything using an app """
+        blog = test.util.create_blog()
+
+        postlist = PostList.for_app(blog.app, Settings.instance())
+        self.assertIs(postlist, blog.renderer._postlist)
+        self.assertIs(
+            postlist,
+            PostList.for_app(blog.app, Settings.instance()))
+
+    def test_load_without_rendering(self):
+        """ Test metadata is found without rendering the post bodies """
+        blog = test.util.create_blog()
+
+        with blog.app.test_request_context():
+            postlist = PostList(Settings.instance(), blog.app.root_path)
+            postlist._index = PostIndex()
+
+            with mock.patch(
+                    'flask.render_template',
+                    side_effect=AssertionError):
+                for post in postlist:
+                    self.assertNotEqual(post.title, '')
+                    self.assertNotEqual(post.description, '')
+
+            # Bodies are still rendered when they are needed
+            self.assertIn(post.title, post.contents)
+
+    def test_metadata_parser(self):
+        """ Test the streaming parser finds the same fields as bs4 did """
+        html = """
+            <!--
+            First comment
+            -->
+            <h3><a href='/post/x/' class='link'>Title &amp; &#39;more&#39;</a></h3>
+            <p class='post-caption' id='date'>Dec 20, 2021</p>
+            <!-- Second comment -->
+            <h3><a>Second title</a></h3>
+        """
+        self.assertEqual(
+            MetadataParser.parse(html),
+            ('Dec 20, 2021',
+             "Title & 'more'",
+             '\n            First comment\n            '))
+
+        # Elements that hold more than a string have no value (like bs4)
+        html = "<h3><a>Title <em>x</em></a></h3><p id='date'><b>x</b></p>"
+        self.assertEqual(MetadataParser.parse(html), (None, None, None))
+
+    def test_pages(self):
+        """ Test pages are consecutive slices of the sorted posts """
+        blog = test.util.create_blog()
+
+        with blog.app.test_request_context():
+            postlist = PostList(Settings.instance(), blog.app.root_path)
+            posts = list(postlist)
+            self.assertEqual(len(postlist), len(posts))
+
+            for count in range(1, len(posts) + 2):
+                num_pages = postlist.page_count(count)
+                pages = [
+                    postlist.page(number, count)
+                    for number in range(1, num_pages + 1)]
+
+                self.assertEqual(
+                    [post for page in pages for post in page],
+                    posts)
+                self.assertTrue(all(len(page) > 0 for page in pages))
+                self.assertEqual(postlist.page(0, count), ())
+                self.assertEqual(postlist.page(num_pages + 1, count), ())
+
+    def create_post_dir(self, blog):
+        """ Copies a few posts to a temporary app root
+
+            :param blog: <Blog> with the posts to copy
+            :return: <tuple> of temporary directory and post <Path>
+            """
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+
+        post_dir = (
+            pathlib.Path(tmp_dir.name) /
+            blog.app.template_folder /
+            Settings.instance()['Routes']['PostsUrl'])
+        post_dir.mkdir(parents=True)
+
+        src_dir = (
+            pathlib.Path(blog.app.root_path) /
+            blog.app.template_folder /
+            Settings.instance()['Routes']['PostsUrl'])
+        for name in ['asteroids.html', 'the-dash.html', 'stakes.html']:
+            shutil.copy(src_dir / name, post_dir / name)
+
+        return tmp_dir.name, post_dir
+
+    def edit_post(self, path, old, new):
+        """ Replaces text in a post and moves its mtime forward
+
+            :param path: <Path> to post
+            :param old: <str> Text to replace
+            :param new: <str> Replacement
+            :return: None
+            """
+        path.write_text(path.read_text().replace(old, new))
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    def test_refresh(self):
+        """ Test only changed posts are reloaded and the version changes """
+        blog = test.util.create_blog()
+        root_path, post_dir = self.create_post_dir(blog)
+
+        with blog.app.app_context():
+            postlist = PostList(Settings.instance(), root_path)
+            postlist._index = PostIndex()
+
+            before = {post.url_stem: post for post in postlist}
+            version = postlist.version
+            self.assertFalse(postlist.refresh())
+            self.assertEqual(postlist.version, version)
+
+            # Edit, add and remove posts
+            self.edit_post(post_dir / 'asteroids.html', 'Asteroids!', 'Rocks!')
+            shutil.copy(post_dir / 'stakes.html', post_dir / 'new.html')
+            (post_dir / 'the-dash.html').unlink()
+
+            self.assertTrue(postlist.refresh())
+            self.assertGreater(postlist.version, version)
+
+            after = {post.url_stem: post for post in postlist}
+            self.assertEqual(
+                sorted(after),
+                ['asteroids', 'new', 'stakes'])
+            self.assertEqual(after['asteroids'].title, 'Rocks!')
+            self.assertIs(after['stakes'], before['stakes'])
+            self.assertEqual(
+                list(postlist),
+                sorted(after.values(), key=lambda p: p.date, reverse=True))
+
+    def test_watcher(self):
+        """ Test the watcher reloads edited posts in the background """
+        blog = test.util.create_blog()
+        root_path, post_dir = self.create_post_dir(blog)
+
+        with blog.app.app_context():
+            postlist = PostList(Settings.instance(), root_path)
+            postlist._index = PostIndex()
+            version = postlist.version
+
+        watcher = PostWatcher(blog.app, postlist, 0.01)
+        watcher.start()
+        self.addCleanup(watcher.stop)
+        self.assertTrue(watcher.is_running)
+
+        self.edit_post(post_dir / 'asteroids.html', 'Asteroids!', 'Rocks!')
+
+        deadline = time.monotonic() + 5
+        while postlist.version == version and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(postlist.get('asteroids').title, 'Rocks!')
+
+        watcher.stop()
+        self.assertFalse(watcher.is_running)
+
+    def test_concurrent_readers(self):
+        """ Test many threads read consistent posts while posts reload """
+        blog = test.util.create_blog()
+        root_path, post_dir = self.create_post_dir(blog)
+
+        postlist = PostList(Settings.instance(), root_path)
+        postlist._index = PostIndex()
+        load_posts = mock.Mock(wraps=postlist._load_posts)
+        postlist._load_posts = load_posts
+
+        names = ['asteroids', 'stakes', 'the-dash']
+        num_reloads = 20
+        done = threading.Event()
+
+        def read():
+            with blog.app.app_context():
+                count = 0
+                while count == 0 or not done.is_set():
+                    posts = list(postlist)
+                    self.assertEqual(len(posts), len(names))
+                    self.assertEqual(
+                        posts,
+                        sorted(posts, key=lambda p: p.date, reverse=True))
+
+                    for name in names:
+                        self.assertEqual(postlist.get(name).url_stem, name)
+
+                    self.assertEqual(len(postlist.page(1, 2)), 2)
+                    count += 1
+
+                return count
+
+        def reload():
+            with blog.app.app_context():
+                try:
+                    version = postlist.version
+                    for ii in range(num_reloads):
+                        self.edit_post(
+                            post_dir / 'asteroids.html',
+                            '<section>',
+                            '<section> ')
+                        self.assertTrue(postlist.refresh())
+
+                    return postlist.version - version
+                finally:
+                    done.set()
+
+        num_readers = 16
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=num_readers + 1) as executor:
+            readers = [executor.submit(read) for ii in range(num_readers)]
+            reloads = executor.submit(reload)
+
+            self.assertEqual(reloads.result(), num_reloads)
+            for reader in readers:
+                self.assertGreater(reader.result(), 0)
+
+        load_posts.assert_called_once()
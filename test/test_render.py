@@ -6,14 +6,24 @@
 """
 import bs4
 import flask
+import pathlib
+import src.images
+import pygments
+import pygments.formatters
+import pygments.lexers
+import tempfile
 import test.util
 import unittest
+import unittest.mock as mock
 
 from datetime import datetime
 from src.blog import Blog
+from src.highlight import HighlightCache, get_language
+from src.images import ImagePipeline
 from src.render import Renderer
 from src.render import RendererNotConfiguredException
 from src.setting import Settings
+from src.struct_data import StructuredDataBlogPost
 from test.template import Template
 
 class TestRenderer(unittest.TestCase):
@@ -218,3 +228,175 @@ class TestRenderer(unittest.TestCase):
             response = client.get(f'/{self.config["Routes"]["ArchiveUrl"]}')
             test.util.validate_links(self, client, response.data)
 
+
+    def test_struct_data_cached(self):
+        """ Test the JSON of each post is only created once
+
+            :param: None
+            :return: None
+            """
+        latest_post_name = test.util.get_latest_url().strip('/').split('/')[-1]
+
+        with self.blog.app.test_request_context():
+            with mock.patch.object(
+                    StructuredDataBlogPost,
+                    '_create_dict',
+                    autospec=True,
+                    side_effect=StructuredDataBlogPost._create_dict) as create:
+                first = self.blog.renderer.render_post(latest_post_name)
+                second = self.blog.renderer.render_post(latest_post_name)
+                self.assertEqual(first, second)
+                self.assertEqual(create.call_count, 1)
+
+                # The index reuses the latest post and adds the others shown
+                self.blog.renderer.render_latest()
+                self.assertEqual(
+                    create.call_count,
+                    int(self.config['Render']['RenderedPostCount']))
+
+    def test_highlight_cache(self):
+        """ Test highlighted code is reused from memory and from disk
+
+            :param: None
+            :return: None
+            """
+        code = 'print("hello world!")'
+        lexer = pygments.lexers.PythonLexer()
+        formatter = pygments.formatters.HtmlFormatter(linenos=True)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with mock.patch(
+                    'pygments.highlight',
+                    side_effect=pygments.highlight) as highlight:
+                cache = HighlightCache(10, pathlib.Path(tmp_dir))
+                expected = cache.highlight(code, lexer, formatter)
+                self.assertEqual(
+                    expected,
+                    cache.highlight(code, lexer, formatter))
+
+                # A new cache (e.g. in the next build) reads from disk
+                cache = HighlightCache(10, pathlib.Path(tmp_dir))
+                self.assertEqual(
+                    expected,
+                    cache.highlight(code, lexer, formatter))
+
+                highlight.assert_called_once()
+
+                # Different options must not share an entry
+                cache.highlight(
+                    code,
+                    lexer,
+                    pygments.formatters.HtmlFormatter())
+                self.assertEqual(highlight.call_count, 2)
+
+    def test_languages(self):
+        """ Test lexers and formatters are created once, for any alias
+
+            :param: None
+            :return: None
+            """
+        lexer, formatter = get_language('py')
+        self.assertIsInstance(lexer, pygments.lexers.PythonLexer)
+        self.assertTrue(formatter.linenos)
+        self.assertIs(get_language('py')[0], lexer)
+
+        # Shell sessions and plain text have no line numbers
+        lexer, formatter = get_language('bash')
+        self.assertIsInstance(lexer, pygments.lexers.BashSessionLexer)
+        self.assertFalse(formatter.linenos)
+        self.assertIsInstance(
+            get_language(None)[0],
+            pygments.lexers.TextLexer)
+
+        # Any Pygments alias works. Unknown languages are plain text.
+        self.assertIsInstance(
+            get_language('rust')[0],
+            pygments.lexers.RustLexer)
+        self.assertIs(get_language('not-a-language'), get_language('default'))
+
+        with self.blog.app.test_request_context():
+            code = self.blog.renderer._codeify('fn main() {\n}', 'rust')
+            self.assertIn('class="linenos"', code)
+            self.assertIn('<span class="k">fn</span>', code)
+
+    @unittest.skipIf(src.images.PIL is None, 'Pillow is not installed')
+    def test_image_pipeline(self):
+        """ Test image variants are resized and cached by content
+
+            :param: None
+            :return: None
+            """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            image_dir = pathlib.Path(tmp_dir) / 'img'
+            image_dir.mkdir()
+            src.images.PIL.Image.new('RGBA', (1000, 500)).save(
+                image_dir / 'test.png')
+            (image_dir / 'test.svg').write_text('<svg></svg>')
+            src.images.PIL.Image.new('RGBA', (1000, 500)).save(
+                pathlib.Path(tmp_dir) / 'outside.png')
+
+            pipeline = ImagePipeline(
+                image_dir,
+                pathlib.Path(tmp_dir) / 'cache',
+                [500, 2000],
+                ['webp', 'unknown'],
+                max_workers=1)
+
+            self.assertEqual(pipeline.images(), ['test.png'])
+            self.assertEqual(pipeline.formats, ['webp'])
+            self.assertEqual(pipeline.widths('test.png'), [500, 1000])
+            self.assertEqual(pipeline.widths('test.svg'), [])
+            self.assertEqual(pipeline.widths('../outside.png'), [])
+
+            self.assertEqual(pipeline.generate_all(), 2)
+            self.assertEqual(pipeline.generate_all(), 0)
+
+            with src.images.PIL.Image.open(
+                    pipeline.variant('test.png', 500, 'webp')) as variant:
+                self.assertEqual(variant.format, 'WEBP')
+                self.assertEqual(variant.size, (500, 250))
+
+            with self.assertRaises(ValueError):
+                pipeline.variant('test.png', 600, 'webp')
+
+            # Editing an image creates new variants
+            src.images.PIL.Image.new('RGBA', (800, 400)).save(
+                image_dir / 'test.png')
+            self.assertEqual(pipeline.widths('test.png'), [500, 800])
+            self.assertEqual(pipeline.generate_all(), 2)
+
+    def test_picture(self):
+        """ Test the picture helper offers a variant of each width/format
+
+            :param: None
+            :return: None
+            """
+        images = self.blog.app.extensions['images']
+        name = 'logo.png'
+
+        with self.blog.app.test_request_context():
+            html = self.blog.renderer._picture(
+                f'img/{name}',
+                alt='Logo',
+                class_='wide')
+            src = flask.url_for('static', filename=f'img/{name}')
+
+        soup = bs4.BeautifulSoup(html, 'html.parser')
+        img = soup.find('img')
+        self.assertEqual(img['src'], src)
+        self.assertEqual(img['alt'], 'Logo')
+        self.assertEqual(img['class'], ['wide'])
+
+        sources = soup.find_all('source')
+        self.assertEqual(len(sources), len(images.formats))
+        with self.blog.app.test_client() as client:
+            for source in sources:
+                urls = [
+                    candidate.split()[0]
+                    for candidate in source['srcset'].split(', ')]
+                self.assertEqual(len(urls), len(images.widths(name)))
+
+                response = client.get(urls[0])
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.mimetype, source['type'])
+                response.close()
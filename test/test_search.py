@@ -0,0 +1,92 @@
+"""
+    Defines unit tests for the SearchIndex class
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import types
+import unittest
+
+from datetime import datetime
+from src.search import SearchIndex, stem, tokenize
+
+def create_post(name, title, description, contents):
+    """ Creates an object with the fields of a Post
+
+        :param name: <str> Name of post
+        :param title: <str> Title of post
+        :param description: <str> Description of post
+        :param contents: <str> HTML of post
+        :return: Post-like object
+        """
+    return types.SimpleNamespace(
+        rel_url=f'/post/{name}',
+        title=title,
+        description=description,
+        date=datetime(2021, 10, 1),
+        contents=contents)
+
+class TestSearchIndex(unittest.TestCase):
+    """ Defines unit tests for the SearchIndex class """
+
+    def setUp(self):
+        """ Index a few posts
+
+            :return: None
+            """
+        self.index = SearchIndex.from_posts([
+            create_post(
+                'threads',
+                'Debugging threads',
+                'Finding a deadlock with gdb',
+                '<p>Each thread is <b>stopped</b> by gdb.</p>'),
+            create_post(
+                'generators',
+                "Python's generators",
+                'How yield works',
+                '<p>A generator yields values. Threads are not needed.</p>'),
+        ])
+
+    def test_tokenize(self):
+        """ Test words are stemmed and stop words left out """
+        self.assertEqual(stem('threads'), 'thread')
+        self.assertEqual(stem('threading'), 'thread')
+        self.assertEqual(stem('running'), 'run')
+        self.assertEqual(stem('class'), 'class')
+        self.assertEqual(
+            tokenize("It's the Python’s <yield>"),
+            ['python', 'yield'])
+
+    def test_search(self):
+        """ Test results match every term and are ranked by weight """
+        urls = [result['url'] for result in self.index.search('thread')]
+        self.assertEqual(urls, ['/post/threads/', '/post/generators/'])
+
+        # Every term must match
+        urls = [result['url'] for result in self.index.search('thread yield')]
+        self.assertEqual(urls, ['/post/generators/'])
+
+        # The last term matches the words it starts
+        urls = [result['url'] for result in self.index.search('gener')]
+        self.assertEqual(urls, ['/post/generators/'])
+
+        self.assertEqual(self.index.search('the'), [])
+        self.assertEqual(self.index.search('deadlock generator'), [])
+        self.assertEqual(self.index.search('thread', limit=1)[0]['title'],
+                         'Debugging threads')
+
+    def test_shards(self):
+        """ Test each term is in the shard of its prefix """
+        manifest = self.index.manifest()
+        self.assertEqual(manifest['shards'], self.index.shard_keys())
+        self.assertEqual(len(manifest['documents']), 2)
+
+        terms = {}
+        for key in manifest['shards']:
+            shard = self.index.shard(key)
+            self.assertTrue(shard)
+            self.assertTrue(all(term.startswith(key) for term in shard))
+            terms.update(shard)
+
+        self.assertEqual(terms, self.index.postings)
+        self.assertEqual(self.index.shard('zz'), {})
@@ -0,0 +1,113 @@
+"""
+    Defines unit tests for the Settings class
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import test.util
+import unittest
+
+from src.blog import Blog
+from src.setting import Settings
+
+class TestSettings(unittest.TestCase):
+    """ Defines unit tests for the Settings class """
+
+    def setUp(self):
+        """ Load the test settings
+
+            :return: None
+            """
+        self.config = test.util.load_test_config()
+
+    def tearDown(self):
+        """ Clean up after each test """
+        Settings.destroy()
+
+    def test_snapshot(self):
+        """ Test a snapshot has every setting, resolved but not converted
+
+            :return: None
+            """
+        snapshot = Settings.snapshot()
+        self.assertEqual(snapshot.sections(), self.config.sections())
+        for section in self.config.sections():
+            self.assertEqual(
+                dict(snapshot[section]),
+                dict(self.config[section]))
+
+        self.assertEqual(
+            snapshot.Struct.BaseUrl,
+            self.config['Routes']['BaseUrl'])
+        self.assertEqual(
+            snapshot.Render.getint('RenderedPostCount'),
+            int(self.config['Render']['RenderedPostCount']))
+        self.assertIs(snapshot['Metrics'].getboolean('Enabled'), False)
+        self.assertIs(snapshot.Flask.getboolean('TESTING'), True)
+        self.assertIsInstance(
+            snapshot.Cache.getfloat('PostWatchInterval'),
+            float)
+
+        # Values that look like numbers or booleans stay strings
+        self.config['Render']['BlogTitle'] = '007'
+        self.config['Struct']['AuthorTelephone'] = '1.0'
+        self.config['Render']['IndexTitle'] = 'true'
+        snapshot = Settings.snapshot()
+        self.assertEqual(snapshot.Render.BlogTitle, '007')
+        self.assertEqual(snapshot.Struct.AuthorTelephone, '1.0')
+        self.assertEqual(snapshot.Render.IndexTitle, 'true')
+
+        with self.assertRaises(KeyError):
+            snapshot['Routes']['NotASetting']
+
+        with self.assertRaises(AttributeError):
+            snapshot.Routes.NotASetting
+
+    def test_read_only(self):
+        """ Test a snapshot can't be changed
+
+            :return: None
+            """
+        snapshot = Settings.snapshot()
+        with self.assertRaises(TypeError):
+            snapshot['Render']['RenderedPostCount'] = 1
+
+        with self.assertRaises(AttributeError):
+            snapshot.Render.RenderedPostCount = 1
+
+        with self.assertRaises(AttributeError):
+            snapshot.Render = {}
+
+    def test_version(self):
+        """ Test a snapshot is reused until the settings change
+
+            :return: None
+            """
+        snapshot = Settings.snapshot()
+        self.assertIs(Settings.snapshot(), snapshot)
+        self.assertIs(Settings.snapshot(snapshot), snapshot)
+
+        self.config['Render']['RenderedPostCount'] = '5'
+        changed = Settings.snapshot()
+        self.assertIsNot(changed, snapshot)
+        self.assertNotEqual(changed.version, snapshot.version)
+        self.assertEqual(changed.Render.RenderedPostCount, '5')
+
+        # Versions aren't reused by new settings
+        Settings.destroy()
+        self.assertNotIn(
+            Settings.snapshot().version,
+            [snapshot.version, changed.version])
+
+    def test_templates(self):
+        """ Test templates read the settings as before
+
+            :return: None
+            """
+        blog = Blog(self.config)
+        with blog.app.test_client() as client:
+            response = client.get('/about/')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(
+                f'href=\'{self.config["Routes"]["ResumeSrc"]}\''.encode(),
+                response.data)
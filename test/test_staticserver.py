@@ -0,0 +1,351 @@
+"""
+    Defines unit tests for the StaticServer class
+
+    :copyright: Copyright (c) 2021 Chris Hughes
+    :license: MIT License. See LICENSE.md for details
+"""
+import gzip
+import http.client
+import os
+import pathlib
+import tempfile
+import test.util
+import threading
+import unittest
+import unittest.mock as mock
+
+from src.builder import Builder
+from src.fingerprint import StaticFingerprints
+from src.setting import Settings
+from src.staticserver import StaticServer
+
+class TestStaticServer(unittest.TestCase):
+    """ Defines unit tests for the StaticServer class """
+
+    def setUp(self):
+        """ Create a build tree and serve it
+
+            :return: None
+            """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp_dir.name)
+
+        self.page = b'<p>' + b'0123456789' * 100 + b'</p>'
+        (self.root / 'index.html').write_bytes(self.page)
+        (self.root / 'index.html.gz').write_bytes(gzip.compress(self.page))
+        (self.root / '404.html').write_bytes(b'<p>Not found</p>')
+        (self.root / 'about').mkdir()
+        (self.root / 'about' / 'index.html').write_bytes(b'<p>About</p>')
+
+        css_dir = self.root / 'static' / 'css'
+        css_dir.mkdir(parents=True)
+        (css_dir / 'style.css').write_bytes(b'p { color: red; }')
+        self.fingerprinted = StaticFingerprints(
+            self.root / 'static').fingerprint('css/style.css')
+        (self.root / 'static' / self.fingerprinted).write_bytes(
+            b'p { color: red; }')
+
+        self.server = self.start_server()
+
+    def tearDown(self):
+        """ Clean up after each test """
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+        Settings.destroy()
+
+    def start_server(self, **kwargs):
+        """ Serves the build tree from another thread
+
+            :param kwargs: Passed to StaticServer
+            :return: <StaticServer>
+            """
+        server = StaticServer(
+            ('127.0.0.1', 0),
+            str(self.root),
+            quiet=True,
+            **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def request(self, path, method='GET', headers=None, server=None):
+        """ Sends a request on a new connection
+
+            :param path: <str> URL path
+            :param method: <str> HTTP method
+            :param headers: <dict> of request headers
+            :param server: <StaticServer> (self.server if None)
+            :return: <tuple> of <http.client.HTTPResponse> and body
+            """
+        server = server or self.server
+        connection = http.client.HTTPConnection(
+            '127.0.0.1',
+            server.server_port,
+            timeout=10)
+        self.addCleanup(connection.close)
+
+        connection.request(method, path, headers=headers or {})
+        response = connection.getresponse()
+        return response, response.read()
+
+    def test_get(self):
+        """ Test files and directories are served like the static app
+
+            :return: None
+            """
+        response, body = self.request('/')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, self.page)
+        self.assertEqual(
+            response.headers['Content-Type'],
+            'text/html; charset=utf-8')
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', response.headers)
+        self.assertIn('Last-Modified', response.headers)
+
+        response, body = self.request('/about/')
+        self.assertEqual(body, b'<p>About</p>')
+
+        response, body = self.request('/about?x=1')
+        self.assertEqual(response.status, 301)
+        self.assertEqual(response.headers['Location'], '/about/?x=1')
+
+        response, body = self.request('/missing/')
+        self.assertEqual(response.status, 404)
+        self.assertEqual(body, b'<p>Not found</p>')
+
+        for path in ['/../index.html', '/about/../index.html',
+                     '/about//index.html']:
+            response, body = self.request(path)
+            self.assertEqual(response.status, 404, msg=path)
+
+        response, body = self.request('/', method='POST')
+        self.assertEqual(response.status, 501)
+
+    def test_head(self):
+        """ Test HEAD sends the headers of GET without a body
+
+            :return: None
+            """
+        response, body = self.request('/', method='HEAD')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, b'')
+        self.assertEqual(
+            response.headers['Content-Length'],
+            str(len(self.page)))
+
+    def test_keep_alive(self):
+        """ Test several requests are answered on one connection
+
+            :return: None
+            """
+        connection = http.client.HTTPConnection(
+            '127.0.0.1',
+            self.server.server_port,
+            timeout=10)
+        self.addCleanup(connection.close)
+
+        for path in ['/', '/about/', '/missing', '/about', '/']:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            self.assertFalse(response.will_close, msg=path)
+
+    def test_sendfile(self):
+        """ Test bodies are sent with sendfile
+
+            :return: None
+            """
+        with mock.patch('os.sendfile', wraps=os.sendfile) as sendfile:
+            response, body = self.request('/')
+
+        self.assertEqual(body, self.page)
+        sendfile.assert_called()
+
+    def test_conditional(self):
+        """ Test clients with a current copy get a 304 without a body
+
+            :return: None
+            """
+        response, _ = self.request('/')
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+
+        for headers in [
+                {'If-None-Match': etag},
+                {'If-None-Match': f'"other", W/{etag}'},
+                {'If-None-Match': '*'},
+                {'If-Modified-Since': last_modified}]:
+            response, body = self.request('/', headers=headers)
+            self.assertEqual(response.status, 304, msg=headers)
+            self.assertEqual(body, b'')
+            self.assertEqual(response.headers['ETag'], etag)
+
+        # If-None-Match takes precedence over If-Modified-Since
+        response, body = self.request('/', headers={
+            'If-None-Match': '"other"',
+            'If-Modified-Since': last_modified})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, self.page)
+
+        response, body = self.request('/', headers={
+            'If-Modified-Since': 'Thu, 01 Jan 1970 00:00:00 GMT'})
+        self.assertEqual(response.status, 200)
+
+    def test_range(self):
+        """ Test byte ranges of files are sent
+
+            :return: None
+            """
+        size = len(self.page)
+        for value, start, stop in [
+                ('bytes=0-9', 0, 10),
+                ('bytes=10-', 10, size),
+                ('bytes=-5', size - 5, size),
+                (f'bytes=5-{size + 100}', 5, size)]:
+            response, body = self.request('/', headers={'Range': value})
+            self.assertEqual(response.status, 206, msg=value)
+            self.assertEqual(body, self.page[start:stop])
+            self.assertEqual(
+                response.headers['Content-Range'],
+                f'bytes {start}-{stop - 1}/{size}')
+
+        response, body = self.request('/', headers={
+            'Range': f'bytes={size}-'})
+        self.assertEqual(response.status, 416)
+        self.assertEqual(response.headers['Content-Range'], f'bytes */{size}')
+
+        # Several ranges, other units and invalid headers get the whole file
+        for value in ['bytes=0-1,5-6', 'items=0-1', 'bytes=x']:
+            response, body = self.request('/', headers={'Range': value})
+            self.assertEqual(response.status, 200, msg=value)
+            self.assertEqual(body, self.page)
+
+        # Ranges of other versions of the file are ignored
+        etag = response.headers['ETag']
+        response, body = self.request('/', headers={
+            'Range': 'bytes=0-9',
+            'If-Range': etag})
+        self.assertEqual(response.status, 206)
+
+        response, body = self.request('/', headers={
+            'Range': 'bytes=0-9',
+            'If-Range': '"other"'})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, self.page)
+
+    def test_precompressed(self):
+        """ Test compressed copies are sent to clients that accept them
+
+            :return: None
+            """
+        response, body = self.request('/', headers={
+            'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(body), self.page)
+        gzip_etag = response.headers['ETag']
+
+        response, body = self.request('/', headers={
+            'Accept-Encoding': 'gzip;q=0'})
+        self.assertIsNone(response.headers['Content-Encoding'])
+        self.assertEqual(body, self.page)
+        self.assertNotEqual(response.headers['ETag'], gzip_etag)
+
+        # Ranges apply to the compressed copy
+        response, body = self.request('/', headers={
+            'Accept-Encoding': 'gzip',
+            'Range': 'bytes=0-1'})
+        self.assertEqual(response.status, 206)
+        self.assertEqual(body, b'\x1f\x8b')
+
+    def test_fingerprinted(self):
+        """ Test fingerprinted static files may be cached forever
+
+            :return: None
+            """
+        response, _ = self.request(f'/static/{self.fingerprinted}')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertEqual(response.headers['Content-Type'][:8], 'text/css')
+
+        response, _ = self.request('/static/css/style.css')
+        self.assertIsNone(response.headers['Cache-Control'])
+
+    def test_metadata_cache(self):
+        """ Test file metadata is kept until the stat interval passes
+
+            :return: None
+            """
+        server = self.start_server(stat_interval=3600)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        response, _ = self.request('/about/', server=server)
+        etag = response.headers['ETag']
+
+        with mock.patch('os.stat', side_effect=AssertionError):
+            response, body = self.request('/about/', server=server)
+        self.assertEqual(body, b'<p>About</p>')
+
+        # Deleted files are found missing when they are opened
+        (self.root / 'about' / 'index.html').unlink()
+        response, body = self.request('/about/', server=server)
+        self.assertEqual(response.status, 404)
+
+        # A new file is found once it is looked up again
+        (self.root / 'about' / 'index.html').write_bytes(b'<p>New</p>')
+        response, body = self.request('/about/', server=server)
+        self.assertEqual(body, b'<p>New</p>')
+
+        # Without an interval, edits are seen immediately
+        (self.root / 'about' / 'index.html').write_bytes(b'<p>Edited</p>')
+        server = self.start_server(stat_interval=0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        response, body = self.request('/about/', server=server)
+        self.assertEqual(body, b'<p>Edited</p>')
+
+    def test_concurrent(self):
+        """ Test requests on other connections are answered while a client
+            is idle
+
+            :return: None
+            """
+        idle = http.client.HTTPConnection(
+            '127.0.0.1',
+            self.server.server_port,
+            timeout=10)
+        self.addCleanup(idle.close)
+        idle.connect()
+
+        results = []
+        def fetch():
+            results.append(self.request('/')[1])
+
+        threads = [threading.Thread(target=fetch) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(results, [self.page] * 8)
+
+    def test_builder(self):
+        """ Test the builder serves its build area under the base URL
+
+            :return: None
+            """
+        blog = test.util.create_blog()
+        blog.app.config['FREEZER_DESTINATION'] = str(self.root)
+        blog.app.config['FREEZER_BASE_URL'] = 'https://example.com/blog/'
+
+        server = Builder(blog.app).make_static_server('127.0.0.1', 0, True)
+        self.addCleanup(server.server_close)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+
+        response, body = self.request('/blog/about/', server=server)
+        self.assertEqual(body, b'<p>About</p>')
+
+        response, body = self.request('/about/', server=server)
+        self.assertEqual(response.status, 404)
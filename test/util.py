@@ -75,14 +75,15 @@ def get_latest_url():
             if config['Routes']['PostsUrl'] in link['href']:
                 return link['href']
 
-def build_static(app):
+def build_static(app, *args):
     """ Builds the static version of the site
 
         :param: Current Flask instance
+        :param args: <str> Extra command line arguments
         :return: Result of CLI invocation
         """
     runner = app.test_cli_runner()
-    return runner.invoke(src.cli.build)
+    return runner.invoke(src.cli.build, args)
 
 def load_page_json(html):
     """ Loads the StructuredData JSON for the page